@@ -0,0 +1,219 @@
+# This file is a part of the AnyBlok / postgres api project
+#
+#    Copyright (C) 2026 Jean-Sebastien SUZANNE <js.suzanne@gmail.com>
+#
+# This Source Code Form is subject to the terms of the Mozilla Public License,
+# v. 2.0. If a copy of the MPL was not distributed with this file,You can
+# obtain one at http://mozilla.org/MPL/2.0/.
+"""Indexes of the materialized views, recommended from their usage
+
+The :class:`~anyblok_postgres.usage.UsageCollector` counts the columns
+filtered and sorted by the queries reading each view. These patterns are
+compared with the indexes of the view and with their scans, from
+``pg_stat_user_indexes``::
+
+    from anyblok_postgres.advisor import (
+        recommend_indexes, format_recommendations,
+        create_recommended_indexes)
+
+    recommendations = recommend_indexes(registry, collector.usages)
+    print(format_recommendations(recommendations))
+    create_recommended_indexes(registry, recommendations)
+    registry.commit()
+
+An index is recommended on the filtered columns followed by the sorted
+columns, when no index of the view starts with them, and after
+``min_queries`` queries. The indexes never scanned, other than the unique
+indexes, are recommended to drop, they are never dropped automatically.
+
+.. note::
+
+    The created indexes are not a part of the definition of the view, and are
+    lost when the view is rebuilt, add them to ``view_indexes`` to keep them.
+"""
+from sqlalchemy import bindparam, text
+from sqlalchemy.sql import table
+from anyblok_postgres.instrumentation import get_storage_names
+from anyblok_postgres.materialized_view import (
+    CreateMaterializedViewIndex, get_materialized_views, index_name,
+    is_materialized)
+
+MIN_QUERIES = 10
+
+
+class IndexRecommendation:
+    """Recommendation of one index of one view
+
+    * ``view``: name of the view
+    * ``action``: ``'create'`` or ``'drop'``
+    * ``columns``: tuple of the column names of the index
+    * ``queries`` and ``time``: number and total duration in seconds of the
+      queries which would use the index
+    * ``reason``: explanation of the recommendation
+    * ``indexes``: names of the existing indexes, for ``'drop'``
+    """
+
+    def __init__(self, view, action, columns, queries=0, time=0., reason='',
+                 indexes=()):
+        self.view = view
+        self.action = action
+        self.columns = columns
+        self.queries = queries
+        self.time = time
+        self.reason = reason
+        self.indexes = indexes
+
+
+def get_indexes(bind, relations):
+    """Return the indexes of the relations, with their scans
+
+    :param bind: registry or connection to execute the queries
+    :param relations: names of the relations
+    :rtype: dict ``{tuple of the column names: [names of the indexes, True if
+            unique, number of scans]}``, the indexes of the different
+            relations on the same columns are merged
+    """
+    res = {}
+    for row in bind.execute(text(
+        'SELECT s.indexrelname AS name, x.indisunique AS is_unique, '
+        's.idx_scan AS scans, ARRAY('
+        'SELECT a.attname FROM unnest(x.indkey) WITH ORDINALITY '
+        'AS k(attnum, position) '
+        'JOIN pg_attribute a ON a.attrelid = x.indrelid '
+        'AND a.attnum = k.attnum '
+        'ORDER BY k.position) AS columns '
+        'FROM pg_stat_user_indexes s '
+        'JOIN pg_index x ON x.indexrelid = s.indexrelid '
+        'WHERE s.relname IN :relations '
+        'AND pg_catalog.pg_table_is_visible(s.relid) '
+        'ORDER BY s.indexrelname'
+    ).bindparams(bindparam('relations', expanding=True)),
+            dict(relations=list(relations))).fetchall():
+        index = res.setdefault(tuple(row.columns), [[], False, 0])
+        index[0].append(row.name)
+        index[1] = index[1] or row.is_unique
+        index[2] += row.scans or 0
+
+    return res
+
+
+def covers(columns, filters, sorts):
+    """Return True if an index on the columns can be used to filter on
+    ``filters`` then to sort on ``sorts``"""
+    size = len(filters)
+    return (len(columns) >= size + len(sorts) and
+            set(columns[:size]) == set(filters) and
+            tuple(columns[size:size + len(sorts)]) == tuple(sorts))
+
+
+def get_candidates(usage, min_queries):
+    """Return the indexes wanted by the patterns of the usage
+
+    :rtype: dict ``{(filters, sorts): [number of queries, total duration]}``,
+            the sorted columns already filtered are removed
+    """
+    candidates = {}
+    for (filters, sorts), (count, duration) in usage.patterns.items():
+        sorts = tuple(column for column in sorts if column not in filters)
+        if not filters and not sorts:
+            continue
+
+        candidate = candidates.setdefault((filters, sorts), [0, 0.])
+        candidate[0] += count
+        candidate[1] += duration
+
+    return {key: value for key, value in candidates.items()
+            if value[0] >= min_queries}
+
+
+def recommend_view_indexes(name, usage, indexes, min_queries=MIN_QUERIES):
+    """Return the recommendations for one view
+
+    :param name: name of the view
+    :param usage: :class:`~anyblok_postgres.usage.ViewUsage` of the view
+    :param indexes: indexes of the view, see :func:`get_indexes`
+    :param min_queries: number of queries needed to recommend an index
+    :rtype: list of :class:`IndexRecommendation`
+    """
+    res = []
+    candidates = get_candidates(usage, min_queries)
+    chosen = list(indexes)
+    for (filters, sorts), (count, duration) in sorted(
+            candidates.items(), key=lambda x: -len(x[0][0] + x[0][1])):
+        if any(covers(columns, filters, sorts) for columns in chosen):
+            continue
+
+        columns = filters + sorts
+        chosen.append(columns)
+        res.append(IndexRecommendation(
+            name, 'create', columns, queries=count, time=duration,
+            reason='%d queries without index' % count))
+
+    if usage.reads < min_queries:
+        return res
+
+    for columns, (names, unique, scans) in sorted(indexes.items()):
+        if not unique and not scans:
+            res.append(IndexRecommendation(
+                name, 'drop', columns, reason='never scanned',
+                indexes=tuple(names)))
+
+    return res
+
+
+def recommend_indexes(registry, usages, min_queries=MIN_QUERIES):
+    """Return the recommendations for the materialized views
+
+    :param registry: the current registry
+    :param usages: dict ``{view name: ViewUsage}``, with the patterns of the
+                   queries, see :attr:`UsageCollector.usages
+                   <anyblok_postgres.usage.UsageCollector>`
+    :param min_queries: number of queries needed to recommend an index
+    :rtype: list of :class:`IndexRecommendation`
+    """
+    res = []
+    for name, view in sorted(get_materialized_views(registry).items()):
+        if name not in usages or not is_materialized(registry, view):
+            continue
+
+        indexes = get_indexes(registry, get_storage_names(view))
+        res.extend(recommend_view_indexes(
+            name, usages[name], indexes, min_queries=min_queries))
+
+    return res
+
+
+def create_recommended_indexes(registry, recommendations):
+    """Create the indexes recommended to create, on each partition for the
+    partitioned views
+
+    :param registry: the current registry
+    :param recommendations: list of :class:`IndexRecommendation`
+    :rtype: list of the names of the created indexes
+    """
+    views = get_materialized_views(registry)
+    res = []
+    for recommendation in recommendations:
+        if recommendation.action != 'create':
+            continue
+
+        for relation in get_storage_names(views[recommendation.view]):
+            name = index_name(relation, '_'.join(recommendation.columns))
+            registry.execute(CreateMaterializedViewIndex(
+                name, table(relation), recommendation.columns))
+            res.append(name)
+
+    return res
+
+
+def format_recommendations(recommendations):
+    """Return the recommendations as a text table"""
+    lines = ['%-30s %-8s %-40s %8s %12s  %s' % (
+        'view', 'action', 'columns', 'queries', 'time', 'reason')]
+    for recommendation in recommendations:
+        lines.append('%-30s %-8s %-40s %8d %12.3f  %s' % (
+            recommendation.view, recommendation.action,
+            ', '.join(recommendation.columns), recommendation.queries,
+            recommendation.time, recommendation.reason))
+
+    return '\n'.join(lines)
@@ -6,12 +6,109 @@
 # This Source Code Form is subject to the terms of the Mozilla Public License,
 # v. 2.0. If a copy of the MPL was not distributed with this file,You can
 # obtain one at http://mozilla.org/MPL/2.0/.
+from contextlib import contextmanager
+from json import dumps
 from sqlalchemy.dialects import postgresql as pg
-from sqlalchemy import select, and_
+from sqlalchemy import (
+    select, and_, types, func, bindparam, cast, all_, type_coerce)
+from sqlalchemy.sql.elements import ClauseElement
+from sqlalchemy.sql.type_api import to_instance
 from anyblok.column import Column
 from anyblok.common import anyblok_column_prefix
+from anyblok_postgres.profiling import decode_jsonb, profiler
+from anyblok_postgres.range import Range, get_driver_range
 
 json_null = object()
+not_decoded = object()
+
+
+class JsonbType(types.TypeDecorator):
+    """JSONB type whose encoding is measured in ``jsonb.encode`` spans, see
+    :mod:`anyblok_postgres.profiling`"""
+
+    impl = pg.JSONB
+    cache_ok = True
+
+    def bind_processor(self, dialect):
+        process = super(JsonbType, self).bind_processor(dialect)
+        if process is None:
+            return None
+
+        def encode(value):
+            if isinstance(value, LazyDocument):
+                if not value.decoded:
+                    return value.raw
+
+                # the decoded document may have been changed in place
+                value = value.value
+
+            if not profiler.enabled:
+                return process(value)
+
+            with profiler.span('jsonb.encode') as span:
+                value = process(value)
+                span.attributes['bytes'] = len(value or '')
+                return value
+
+        return encode
+
+
+class LazyDocument:
+    """JSONB document loaded as text, decoded on the first access of
+    ``value``
+
+    * ``raw``: the text of the document, from PostgreSQL
+    * ``value``: the decoded document, memoized, encoded again when the
+      document is written
+    """
+
+    __slots__ = ('raw', '_value')
+
+    def __init__(self, raw):
+        self.raw = raw
+        self._value = not_decoded
+
+    @property
+    def value(self):
+        if self._value is not_decoded:
+            self._value = decode_jsonb(self.raw)
+
+        return self._value
+
+    @property
+    def decoded(self):
+        """True if ``value`` was accessed"""
+        return self._value is not not_decoded
+
+    def __eq__(self, other):
+        if isinstance(other, LazyDocument):
+            other = other.value
+
+        return self.value == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return 'LazyDocument(%r)' % self.raw
+
+
+class LazyJsonbType(JsonbType):
+    """JSONB type loaded as text, in :class:`LazyDocument`"""
+
+    cache_ok = True
+
+    def column_expression(self, colexpr):
+        return type_coerce(cast(colexpr, types.Text), self)
+
+    def result_processor(self, dialect, coltype):
+
+        def process(value):
+            if value is None:
+                return None
+
+            return LazyDocument(value)
+
+        return process
 
 
 class Jsonb(Column):
@@ -28,11 +125,171 @@ class Jsonb(Column):
 
             x = Jsonb()
 
+    With ``lazy_decode=True``, the document is loaded as text, and only
+    decoded, once, when the attribute is read. :func:`get_raw_json` returns
+    this text without decoding it, and the queries of the column return
+    :class:`LazyDocument`::
+
+        x = Jsonb(lazy_decode=True)
+
+        -----------------------------
+
+        get_raw_json(test, 'x')  # the text of the document
+    """
+    sqlalchemy_type = JsonbType(none_as_null=True)
+
+    def __init__(self, *args, **kwargs):
+        self.lazy_decode = kwargs.pop('lazy_decode', False)
+        if self.lazy_decode:
+            self.sqlalchemy_type = LazyJsonbType(none_as_null=True)
+
+        super(Jsonb, self).__init__(*args, **kwargs)
+
+    def getter_format_value(self, value):
+        if isinstance(value, LazyDocument):
+            return value.value
+
+        return value
+
+
+def get_raw_json(model_self, fieldname):
+    """Return the text of the document of the **Jsonb** column, without
+    decoding it if the column is declared with ``lazy_decode=True``
+
+    :param model_self: instance of the model
+    :param fieldname: name of the **Jsonb** column
+    """
+    value = getattr(model_self, anyblok_column_prefix + fieldname)
+    if value is None:
+        return None
+
+    if isinstance(value, LazyDocument):
+        return value.raw
+
+    return dumps(value)
+
+
+class RangeType(types.TypeDecorator):
+    """Bind :class:`~anyblok_postgres.range.Range` values as the range
+    objects of the DBAPI driver, and load them back as
+    :class:`~anyblok_postgres.range.Range`"""
+
+    impl = types.NullType
+    cache_ok = True
+
+    def __init__(self, range_type, driver_range, element_type):
+        self.range_type = range_type
+        self.driver_range = driver_range
+        self.element_type = element_type
+        self.impl = to_instance(range_type)
+
+    class comparator_factory(types.TypeDecorator.Comparator,
+                             pg.ranges.RangeOperators.comparator_factory):
+
+        def contains(self, other, **kw):
+            """Boolean expression. Returns true if the right hand operand,
+            which can be an element, a list of elements or a range, is
+            contained within the column.
+
+            The elements are bound with the element type of the range
+            (``::bigint``, ``::numeric``, ...), and a list of elements as
+            one array parameter.
+            """
+            element_type = self.type.element_type
+            if isinstance(other, (list, tuple)):
+                other = all_(bindparam(None, list(other),
+                                       type_=pg.ARRAY(element_type)))
+            elif not is_range_operand(other):
+                other = cast(other, element_type)
+
+            return self.expr.op("@>", is_comparison=True)(other)
+
+    def process_bind_param(self, value, dialect):
+        if isinstance(value, Range):
+            return value.to_driver(
+                get_driver_range(dialect.dbapi, self.driver_range))
+
+        return value
+
+    def process_result_value(self, value, dialect):
+        return Range.from_driver(value)
+
+    @property
+    def python_type(self):
+        return Range
+
+
+def is_range_operand(value):
+    """Return True if value is a range or a SQL expression"""
+    return isinstance(value, (Range, str, ClauseElement)) or hasattr(
+        value, 'isempty')
+
+
+class RangeColumn(Column):
+    """Base class of the range columns
+
+    The values are loaded as :class:`~anyblok_postgres.range.Range`, which
+    are also accepted, as the strings and the DBAPI range objects, to set
+    the value or in the queries.
+    """
+    driver_range = None
+    element_type = None
+
+    def __init__(self, *args, **kwargs):
+        self.sqlalchemy_type = RangeType(
+            self.sqlalchemy_type, self.driver_range, self.element_type)
+        super(RangeColumn, self).__init__(*args, **kwargs)
+
+
+def query_containing(Model, fieldname, points):
+    """Return the query of the instances whose range contains the points
+
+    All the points are sent as one array parameter, joined with the range
+    column through ``unnest(...) WITH ORDINALITY``, so a GiST index on the
+    column is used for each of them. The query returns ``(position,
+    instance)`` rows, ordered by the position of the point in ``points``::
+
+        query = query_containing(registry.RateCard, 'validity', timestamps)
+        for position, rate_card in query.filter(...):
+            ...
+
+    :param Model: AnyBlok model
+    :param fieldname: name of the range column of the model
+    :param points: iterable of elements of the range type
+    :rtype: Query
+    """
+    column = getattr(Model, fieldname)
+    element_type = column.type.element_type
+    points = func.unnest(
+        bindparam('points', list(points), type_=pg.ARRAY(element_type))
+    ).table_valued(
+        'point', with_ordinality='ordinality'
+    ).render_derived(name='points')
+    query = Model.query((points.c.ordinality - 1).label('position'), Model)
+    query = query.select_from(points).join(
+        Model, column.contains(points.c.point))
+    return query.order_by(points.c.ordinality)
+
+
+def find_containing(Model, fieldname, points):
+    """Return, for each point, the instances whose range contains it
+
+    One query is done for all the points, see :func:`query_containing`.
+
+    :param Model: AnyBlok model
+    :param fieldname: name of the range column of the model
+    :param points: list of elements of the range type
+    :rtype: list, in the order of ``points``, of the lists of instances
     """
-    sqlalchemy_type = pg.JSONB(none_as_null=True)
+    res = [[] for _ in points]
+    if res:
+        for position, instance in query_containing(Model, fieldname, points):
+            res[position].append(instance)
+
+    return res
 
 
-class Int4Range(Column):
+class Int4Range(RangeColumn):
     """PostgreSQL int4range column.
 
     Example usage, with this declaration::
@@ -51,54 +308,52 @@ class Int4Range(Column):
         Test.insert(col="[1,3)")
         Test.insert(col="(4,8)")
         Test.query().filter(Test.col.contains(2))
-        Test.query().filter(Test.col.contains([5, 6))
+        Test.query().filter(Test.col.contains("[5, 6]"))
+        Test.query().filter(Test.col.contains(Range(5, 7)))
+        Test.query().filter(Test.col.contains([5, 6]))  # all the elements
 
     """
     sqlalchemy_type = pg.INT4RANGE
+    driver_range = 'NumericRange'
+    element_type = types.Integer
 
 
-class Int8Range(Column):
+class Int8Range(RangeColumn):
     """PostgreSQL int8range column.
 
     Usage is similar to  see :class:`Int4Range`.
     See also https://www.postgresql.org/docs/current/rangetypes.html
 
-    Caveat (at least with psycopg2):
+    In containment queries, the integers are passed with the ``::bigint``
+    cast, even those within PostgreSQL's regular 'integer' type::
 
-    In containment queries, passing integers that are within
-    PostgreSQL's regular 'integer' type doesn't work because it lacks the
-    ``::bigint`` cast. One workaround is to pass it as an inclusive 0 length
-    range in string form such as::
-
-        Test.query(Test.col.contains('[1, 1]')
+        Test.query().filter(Test.col.contains(1))
 
     """
     sqlalchemy_type = pg.INT8RANGE
+    driver_range = 'NumericRange'
+    element_type = types.BigInteger
 
 
-class NumRange(Column):
+class NumRange(RangeColumn):
     """PostgreSQL numrange column.
 
     Usage is similar to  see :class:`Int4Range`, with
     :class:`decimal.Decimal` instances instead of integers.
 
-    Caveat (at least with psycopg2):
-
-    In containment queries, passing values that are integers or
-    :class:`Decimal` instances equal to integers, such as ``Decimal('1')``
-    doesn't work because they end up as litteral SQL integers, without the
-    ``::numeric`` cast.
-
-    One workaround is to pass them as inclusive 0 length ranges in string
-    representation, such as::
+    In containment queries, the integers and the :class:`Decimal` instances
+    equal to integers, such as ``Decimal('1')``, are passed with the
+    ``::numeric`` cast::
 
-        Test.query(Test.col.contains('[1, 1]')
+        Test.query().filter(Test.col.contains(Decimal('1')))
 
     """
     sqlalchemy_type = pg.NUMRANGE
+    driver_range = 'NumericRange'
+    element_type = types.Numeric
 
 
-class DateRange(Column):
+class DateRange(RangeColumn):
     """PostgreSQL daterange column.
 
     This range column can be used with Python :class:`date` instances.
@@ -123,18 +378,22 @@ class DateRange(Column):
 
     """
     sqlalchemy_type = pg.DATERANGE
+    driver_range = 'DateRange'
+    element_type = types.Date
 
 
-class TsRange(Column):
+class TsRange(RangeColumn):
     """PostgreSQL tsrange column (timestamps without time zones).
 
     This range column can be used with "naive" Python :class:`datetime`
     instances. Apart from that, usage is similar to :class:`DateRange`
     """
     sqlalchemy_type = pg.TSRANGE
+    driver_range = 'DateTimeRange'
+    element_type = types.DateTime
 
 
-class TsTzRange(Column):
+class TsTzRange(RangeColumn):
     """PostgreSQL tstzrange column (timestamps with time zones).
 
     See also https://www.postgresql.org/docs/current/rangetypes.html
@@ -144,10 +403,12 @@ class TsTzRange(Column):
     Apart from taht, usage is similar to :class:`DateRange`
     """
     sqlalchemy_type = pg.TSTZRANGE
+    driver_range = 'DateTimeTZRange'
+    element_type = types.DateTime(timezone=True)
 
 
 class LargeObject(Column):
-    """PostgreSQL JSONB column
+    """PostgreSQL large object column
 
     ::
 
@@ -166,6 +427,8 @@ class LargeObject(Column):
         test.x = hugefile
         test.x  # get the huge file
 
+    The large object is opened on the DBAPI connection of the transaction
+    of the session, and closed after each read or write.
     """
     sqlalchemy_type = pg.OID
 
@@ -198,30 +461,52 @@ class LargeObject(Column):
             if oldvalue:
                 oldvalue = oldvalue[0]
 
-            value = self.setter_format_value(
-                value, oldvalue, model_self.anyblok)
+            with profiler.span(
+                'large_object.unlink' if value is None else
+                'large_object.write',
+                model=model_self.__registry_name__, field=fieldname
+            ) as span:
+                value = self.setter_format_value(
+                    value, oldvalue, model_self.anyblok, span=span)
+
             res = setattr(model_self, attr_name, value)
             self.expire_related_attribute(model_self, action_todos)
             return res
 
         return setter_column
 
-    def setter_format_value(self, value, oldvalue, registry):
+    def setter_format_value(self, value, oldvalue, registry, span=None):
+        """Write the value in the large object, and return its oid
+
+        :param span: the profiling span of the write, completed with the
+                     bytes and the estimated round trips
+        """
+        round_trips = 0
         if value is not None:
-            cursor = registry.session.connection().connection.cursor()
             oid = oldvalue or 0
             if self.keep_blob:
                 oid = 0
 
-            lobj = cursor.connection.lobject(oid, 'wb')
-            lobj.write(value)
-            value = lobj.oid
-            cursor.close()
+            if span is not None:
+                span.attributes['bytes'] = len(value)
+
+            with open_large_object(registry, oid, 'wb') as lobj:
+                lobj.write(value)
+                if oid:
+                    # the old content may be longer
+                    lobj.truncate(len(value))
+
+                value = lobj.oid
+
+            # create or truncate, open, write and close
+            round_trips = 4
         elif oldvalue and not self.keep_blob:
-            cursor = registry.session.connection().connection.cursor()
-            lobj = cursor.connection.lobject(oldvalue)
-            lobj.unlink()
-            cursor.close()
+            get_dbapi_connection(registry).lobject(oldvalue).unlink()
+            # open, close and unlink
+            round_trips = 3
+
+        if span is not None:
+            span.attributes['round_trips'] = round_trips
 
         return value
 
@@ -233,15 +518,51 @@ class LargeObject(Column):
         attr_name = anyblok_column_prefix + fieldname
 
         def getter_column(model_self):
-            return self.getter_format_value(
-                getattr(model_self, attr_name),
-                model_self.anyblok
-            )
+            with profiler.span(
+                'large_object.read', model=model_self.__registry_name__,
+                field=fieldname
+            ) as span:
+                return self.getter_format_value(
+                    getattr(model_self, attr_name),
+                    model_self.anyblok, span=span
+                )
 
         return getter_column
 
-    def getter_format_value(self, value, registry):
+    def getter_format_value(self, value, registry, span=None):
+        """Return the content of the large object
+
+        :param span: the profiling span of the read, completed with the
+                     bytes and the estimated round trips
+        """
         if value is not None:
-            cursor = registry.session.connection().connection.cursor()
-            lobj = cursor.connection.lobject(value, 'rb')
-            return lobj.read()
+            with open_large_object(registry, value, 'rb') as lobj:
+                value = lobj.read()
+
+            if span is not None:
+                # open, tell, seek to the end, seek back, read and close
+                span.attributes['bytes'] = len(value)
+                span.attributes['round_trips'] = 6
+
+            return value
+
+
+def get_dbapi_connection(registry):
+    """Return the DBAPI connection of the transaction of the session"""
+    return registry.session.connection().connection.connection
+
+
+@contextmanager
+def open_large_object(registry, oid=0, mode='rb'):
+    """Open the large object on the DBAPI connection of the session, and
+    close it at the exit of the context
+
+    :param registry: the current registry
+    :param oid: oid of the large object, 0 to create it
+    :param mode: mode of ``lobject``
+    """
+    lobj = get_dbapi_connection(registry).lobject(oid, mode)
+    try:
+        yield lobj
+    finally:
+        lobj.close()
@@ -0,0 +1,31 @@
+# This file is a part of the AnyBlok / postgres api project
+#
+#    Copyright (C) 2026 Jean-Sebastien SUZANNE <js.suzanne@gmail.com>
+#
+# This Source Code Form is subject to the terms of the Mozilla Public License,
+# v. 2.0. If a copy of the MPL was not distributed with this file,You can
+# obtain one at http://mozilla.org/MPL/2.0/.
+from hashlib import sha1
+
+MAX_IDENTIFIER_LENGTH = 63
+
+
+def truncate_name(name, max_length=MAX_IDENTIFIER_LENGTH):
+    """Return the name, truncated and ended by a hash of the full name if
+    it is longer than ``max_length`` bytes
+
+    PostgreSQL truncates the identifiers longer than 63 bytes: two long
+    names with the same beginning would name the same object.
+
+    :param name: full name of the object
+    :param max_length: maximal length in bytes of the name
+    """
+    if len(name.encode('utf-8')) <= max_length:
+        return name
+
+    digest = sha1(name.encode('utf-8')).hexdigest()[:8]
+    prefix = name[:max_length - len(digest) - 1]
+    while len(prefix.encode('utf-8')) > max_length - len(digest) - 1:
+        prefix = prefix[:-1]
+
+    return '%s_%s' % (prefix, digest)
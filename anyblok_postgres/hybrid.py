@@ -0,0 +1,279 @@
+# This file is a part of the AnyBlok / postgres api project
+#
+#    Copyright (C) 2026 Jean-Sebastien SUZANNE <js.suzanne@gmail.com>
+#
+# This Source Code Form is subject to the terms of the Mozilla Public License,
+# v. 2.0. If a copy of the MPL was not distributed with this file,You can
+# obtain one at http://mozilla.org/MPL/2.0/.
+"""Plain or materialized views, chosen from their usage
+
+The :class:`HybridViewFactory` maps the model on a plain view or on a
+materialized view, with the options of the ``MaterializedViewFactory``::
+
+    @Declarations.register(Declarations.Model, factory=HybridViewFactory)
+    class TestView:
+        materialize = 'auto'
+        refresh_interval = 300
+        ...
+
+With ``materialize = True`` or ``False``, the view is always materialized or
+plain. With ``'auto'``, the default, the view is first a plain view, then the
+usage counted by :class:`~anyblok_postgres.usage.UsageCollector` decides:
+
+* the cost of the plain view is the duration of the reads. For a
+  materialized view, each read is estimated as a refresh
+* the cost of the materialized view is the duration of the refreshes and of
+  the reads. For a plain view, the refreshes are estimated from
+  ``refresh_interval``, one by interval or one in all without interval, each
+  one as the longest read
+
+The plain view is materialized when its cost is more than ``ratio`` times
+the cost of the materialized view, and conversely, after ``min_reads``
+reads::
+
+    from anyblok_postgres.hybrid import (
+        get_view_decisions, format_report, apply_view_decisions)
+
+    decisions = get_view_decisions(registry)
+    print(format_report(decisions))
+    apply_view_decisions(registry, decisions)
+    registry.commit()
+
+The view is rebuilt in its new storage, see
+:meth:`~anyblok_postgres.materialized_view.ViewDDL.rebuild`, and the counts
+restart. The refreshes of a plain view do nothing.
+
+.. note::
+
+    The views reading a hybrid view are always stale, and the other processes
+    see the new storage of the view once their registry is reloaded.
+"""
+from anyblok.model.exceptions import ViewException
+from sqlalchemy import text
+from sqlalchemy_views import CreateView
+from anyblok_postgres.materialized_view import (
+    MaterializedViewFactory, ViewDDL, get_materialized_views,
+    is_materialized)
+from anyblok_postgres.scheduler import get_interval
+from anyblok_postgres.usage import (
+    USAGE_TABLE, CreateViewUsage, ViewUsage, get_usages, reset_usage)
+
+MATERIALIZE = (True, False, 'auto')
+PROMOTION_RATIO = 2
+MIN_READS = 100
+
+
+class HybridViewDDL:
+    """Creation of one hybrid view, as a plain or as a materialized view
+
+    :param view: table clause of the view
+    :param plain: :class:`ViewDDL` of the plain view
+    :param materialized: :class:`ViewDDL` of the materialized view
+    :param materialize: ``True``, ``False`` or ``'auto'``
+    """
+
+    def __init__(self, view, plain, materialized, materialize):
+        self.view = view
+        self.plain = plain
+        self.materialized = materialized
+        self.materialize = materialize
+
+    def __call__(self, target, connection, **kw):
+        materialize = self.materialize
+        if materialize == 'auto':
+            materialize = get_decision(connection, self.view.name)
+
+        ddl = self.materialized if materialize else self.plain
+        ddl(target, connection, **kw)
+        self.view.materialized = None
+
+
+def get_decision(bind, name):
+    """Return the saved choice of the storage of the view, False by
+    default"""
+    bind.execute(CreateViewUsage())
+    return bool(bind.execute(text(
+        'SELECT materialized FROM %s WHERE name = :name' % USAGE_TABLE
+    ), dict(name=name)).scalar())
+
+
+class ViewDecision:
+    """Choice of the storage of one hybrid view
+
+    * ``view``: name of the view
+    * ``materialized``: True if the view is materialized
+    * ``recommended``: True if the view should be materialized
+    * ``plain_cost`` and ``materialized_cost``: cost in seconds of each
+      storage, for the counted usage
+    * ``reason``: explanation of the choice
+    * ``usage``: the :class:`~anyblok_postgres.usage.ViewUsage`
+    """
+
+    def __init__(self, view, materialized, recommended, plain_cost,
+                 materialized_cost, reason, usage):
+        self.view = view
+        self.materialized = materialized
+        self.recommended = recommended
+        self.plain_cost = plain_cost
+        self.materialized_cost = materialized_cost
+        self.reason = reason
+        self.usage = usage
+
+    @property
+    def changed(self):
+        return self.recommended != self.materialized
+
+
+def get_costs(view, usage, materialized):
+    """Return the cost of the plain and of the materialized view
+
+    :param view: table clause of the view
+    :param usage: usage of the view
+    :param materialized: True if the usage was counted on a materialized view
+    :rtype: tuple ``(plain cost, materialized cost)`` in seconds
+    """
+    if materialized:
+        return (usage.reads * usage.mean_refresh_time,
+                usage.refresh_time + usage.read_time)
+
+    refreshes = 1
+    interval = get_interval(view)
+    if interval:
+        refreshes = max((usage.age or 0) / interval, 1)
+
+    return usage.read_time, refreshes * usage.max_read_time
+
+
+def decide(view, usage, materialized, materialize='auto',
+           ratio=PROMOTION_RATIO, min_reads=MIN_READS):
+    """Return the decision for one view
+
+    :param view: table clause of the view
+    :param usage: usage of the view
+    :param materialized: True if the view is materialized
+    :param materialize: option of the model
+    :param ratio: ratio of the costs needed to change the storage
+    :param min_reads: number of reads needed to change the storage
+    :rtype: :class:`ViewDecision`
+    """
+    plain_cost, materialized_cost = get_costs(view, usage, materialized)
+    recommended = materialized
+    if materialize != 'auto':
+        recommended = materialize
+        reason = 'declared by the model'
+    elif usage.reads < min_reads or (materialized and not usage.refreshes):
+        reason = 'not enough usage'
+    elif not materialized and plain_cost > ratio * materialized_cost:
+        recommended = True
+        reason = 'reads cost more than refreshes'
+    elif materialized and materialized_cost > ratio * plain_cost:
+        recommended = False
+        reason = 'refreshes cost more than reads'
+    else:
+        reason = 'costs close'
+
+    return ViewDecision(view.name, materialized, recommended, plain_cost,
+                        materialized_cost, reason, usage)
+
+
+def get_hybrid_views(registry):
+    """Return the views of the models built by HybridViewFactory
+
+    :rtype: dict ``{view name: table clause of the view}``
+    """
+    return {name: view
+            for name, view in get_materialized_views(registry).items()
+            if view.hybrid}
+
+
+def get_view_decisions(registry, ratio=PROMOTION_RATIO, min_reads=MIN_READS):
+    """Return the decisions for the hybrid views, from their saved usage
+
+    :param registry: the current registry
+    :param ratio: ratio of the costs needed to change the storage
+    :param min_reads: number of reads needed to change the storage
+    :rtype: list of :class:`ViewDecision`
+    """
+    usages = get_usages(registry)
+    res = []
+    for name, view in sorted(get_hybrid_views(registry).items()):
+        res.append(decide(
+            view, usages.get(name, ViewUsage(name, age=0)),
+            bool(is_materialized(registry, view)),
+            materialize=view.ddl.materialize, ratio=ratio,
+            min_reads=min_reads))
+
+    return res
+
+
+def apply_view_decisions(registry, decisions=None):
+    """Rebuild the hybrid views whose storage should change
+
+    :param registry: the current registry
+    :param decisions: the decisions to apply, by default the ones of
+                      :func:`get_view_decisions`
+    :rtype: list of the names of the rebuilt views
+    """
+    if decisions is None:
+        decisions = get_view_decisions(registry)
+
+    views = get_hybrid_views(registry)
+    connection = registry.session.connection()
+    res = []
+    for decision in decisions:
+        if not decision.changed:
+            continue
+
+        view = views[decision.view]
+        reset_usage(connection, view.name, materialized=decision.recommended)
+        view.ddl(None, connection)
+        res.append(view.name)
+
+    return res
+
+
+def format_report(decisions):
+    """Return the decisions as a text table"""
+    lines = ['%-30s %-12s %-12s %8s %12s %18s  %s' % (
+        'view', 'storage', 'decision', 'reads', 'plain cost',
+        'materialized cost', 'reason')]
+    for decision in decisions:
+        lines.append('%-30s %-12s %-12s %8d %12.3f %18.3f  %s' % (
+            decision.view,
+            'materialized' if decision.materialized else 'plain',
+            'materialized' if decision.recommended else 'plain',
+            decision.usage.reads, decision.plain_cost,
+            decision.materialized_cost, decision.reason))
+
+    return '\n'.join(lines)
+
+
+class HybridViewFactory(MaterializedViewFactory):
+    """Factory of the models mapped on a plain or on a materialized view,
+    chosen by the ``materialize`` option of the model or by their usage, see
+    :mod:`anyblok_postgres.hybrid`
+
+    The other options are the ones of the ``MaterializedViewFactory``, used
+    when the view is materialized.
+    """
+
+    def get_view_ddl(self, base, view, properties):
+        """Return the :class:`HybridViewDDL` creating the view
+
+        :exception: ViewException
+        """
+        materialize = getattr(base, 'materialize', 'auto')
+        if materialize not in MATERIALIZE:
+            raise ViewException("%r.'materialize' must be one of %r" % (
+                base, MATERIALIZE))
+
+        view.hybrid = True
+        view.materialized = None
+        plain = ViewDDL(
+            view, 'VIEW',
+            view.tracking.get_ddl() + [
+                CreateView(view, view.definition, or_replace=True)],
+            self.registry.engine.dialect)
+        materialized = super(HybridViewFactory, self).get_view_ddl(
+            base, view, properties)
+        return HybridViewDDL(view, plain, materialized, materialize)
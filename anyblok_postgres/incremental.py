@@ -0,0 +1,481 @@
+# This file is a part of the AnyBlok / postgres api project
+#
+#    Copyright (C) 2026 Jean-Sebastien SUZANNE <js.suzanne@gmail.com>
+#
+# This Source Code Form is subject to the terms of the Mozilla Public License,
+# v. 2.0. If a copy of the MPL was not distributed with this file,You can
+# obtain one at http://mozilla.org/MPL/2.0/.
+"""Incremental refresh of the materialized views
+
+A view declared with ``incremental_refresh = True`` is stored in a table
+instead of a materialized view. Triggers on the source tables log the
+primary keys of the view rows affected by each change, and the refresh only
+recomputes these rows.
+
+The supported query shapes are the simple ``SELECT`` (no ``UNION``, no
+``LIMIT`` / ``OFFSET``) on tables or joins of tables, ``GROUP BY`` included,
+where each primary key of the view is a column of a source table and can be
+mapped to a column of every source table through the equalities of the
+top-level ``AND`` of the ``WHERE`` and ``ON`` clauses. The queries with a
+subquery, a window function or ``DISTINCT ON`` read other rows than the ones
+of the keys, or other tables than the triggered ones: they are not supported.
+The other views keep the full refresh.
+
+.. warning::
+
+    ``TRUNCATE`` on a source table is not logged, a full refresh is needed
+    after it.
+"""
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.schema import DDLElement, Table
+from sqlalchemy import select, tuple_
+from sqlalchemy.sql import Select, Join, expression, operators, visitors
+from sqlalchemy.sql.expression import (
+    AliasedReturnsRows, BinaryExpression, BooleanClauseList, ColumnClause,
+    Exists, Grouping, Label, Over, ScalarSelect, SelectBase, TableClause)
+from anyblok_postgres.common import truncate_name
+
+
+class CreateIncrementalView(DDLElement):
+    def __init__(self, name, selectable, with_data=None):
+        self.name = name
+        self.selectable = selectable
+        self.with_data = with_data
+
+
+@compiles(CreateIncrementalView)
+def compile_create_incremental_view(element, compiler, **kw):
+    quote = compiler.preparer.quote
+    with_data = ''
+    if element.with_data is False:
+        with_data = ' WITH NO DATA'
+
+    return 'CREATE TABLE IF NOT EXISTS %s AS %s%s' % (
+        quote(element.name),
+        compiler.sql_compiler.process(element.selectable, literal_binds=True),
+        with_data,
+    )
+
+
+class CreateChangeLog(DDLElement):
+    def __init__(self, name, selectable, keys):
+        self.name = name
+        self.selectable = selectable
+        self.keys = keys
+
+
+@compiles(CreateChangeLog)
+def compile_create_change_log(element, compiler, **kw):
+    quote = compiler.preparer.quote
+    return (
+        'CREATE TABLE IF NOT EXISTS %s AS SELECT %s FROM (%s) AS query '
+        'WITH NO DATA'
+    ) % (
+        quote(change_log_name(element.name)),
+        ', '.join(quote(key) for key in element.keys),
+        compiler.sql_compiler.process(element.selectable, literal_binds=True),
+    )
+
+
+class CreateChangeTrigger(DDLElement):
+    def __init__(self, name, table, columns, keys):
+        self.name = name
+        self.table = table
+        self.columns = columns
+        self.keys = keys
+
+
+@compiles(CreateChangeTrigger)
+def compile_create_change_trigger(element, compiler, **kw):
+    quote = compiler.preparer.quote
+    function = quote(change_function_name(element.name, element.table.name))
+    trigger = quote(change_trigger_name(element.name))
+    table = compiler.preparer.format_table(element.table)
+    keys = ', '.join(quote(key) for key in element.keys)
+
+    def values(record):
+        return ', '.join('%s.%s' % (record, quote(column.name))
+                         for column in element.columns)
+
+    return (
+        'CREATE OR REPLACE FUNCTION %(function)s() RETURNS trigger AS $$\n'
+        'BEGIN\n'
+        "    IF TG_OP IN ('UPDATE', 'DELETE') THEN\n"
+        '        INSERT INTO %(log)s (%(keys)s) VALUES (%(old)s);\n'
+        '    END IF;\n'
+        "    IF TG_OP IN ('INSERT', 'UPDATE') THEN\n"
+        '        INSERT INTO %(log)s (%(keys)s) VALUES (%(new)s);\n'
+        '    END IF;\n'
+        '    RETURN NULL;\n'
+        'END;\n'
+        '$$ LANGUAGE plpgsql;'
+        'DROP TRIGGER IF EXISTS %(trigger)s ON %(table)s;'
+        'CREATE TRIGGER %(trigger)s AFTER INSERT OR UPDATE OR DELETE '
+        'ON %(table)s FOR EACH ROW EXECUTE PROCEDURE %(function)s()'
+    ) % dict(function=function, trigger=trigger, table=table, keys=keys,
+             log=quote(change_log_name(element.name)),
+             old=values('OLD'), new=values('NEW'))
+
+
+class CollectChanges(DDLElement):
+    """Move the logged keys in a temporary table, for one refresh"""
+
+    def __init__(self, name, keys):
+        self.name = name
+        self.keys = keys
+
+
+@compiles(CollectChanges)
+def compile_collect_changes(element, compiler, **kw):
+    quote = compiler.preparer.quote
+    keys = ', '.join(quote(key) for key in element.keys)
+    log = quote(change_log_name(element.name))
+    pending = quote(pending_name(element.name))
+    return (
+        'DROP TABLE IF EXISTS %(pending)s;'
+        'CREATE TEMPORARY TABLE %(pending)s ON COMMIT DROP AS '
+        'SELECT DISTINCT %(keys)s FROM %(log)s;'
+        'DELETE FROM %(log)s AS log USING %(pending)s AS pending '
+        'WHERE %(where)s'
+    ) % dict(pending=pending, keys=keys, log=log,
+             where=match_keys('log', 'pending', element.keys, quote))
+
+
+class ApplyChanges(DDLElement):
+    """Recompute the rows of the view for the collected keys
+
+    :param selectable: query of the view restricted to the collected keys,
+                       see :meth:`IncrementalRefresh.get_changed_rows_query`
+    """
+
+    def __init__(self, name, selectable, keys, columns):
+        self.name = name
+        self.selectable = selectable
+        self.keys = keys
+        self.columns = columns
+
+
+@compiles(ApplyChanges)
+def compile_apply_changes(element, compiler, **kw):
+    quote = compiler.preparer.quote
+    columns = ', '.join(quote(column) for column in element.columns)
+    return (
+        'DELETE FROM %(view)s AS target USING %(pending)s AS pending '
+        'WHERE %(where_view)s;'
+        'INSERT INTO %(view)s (%(columns)s) '
+        'SELECT %(columns)s FROM (%(query)s) AS query'
+    ) % dict(
+        view=quote(element.name),
+        pending=quote(pending_name(element.name)),
+        where_view=match_keys('target', 'pending', element.keys, quote),
+        columns=columns,
+        query=compiler.sql_compiler.process(
+            element.selectable, literal_binds=True),
+    )
+
+
+class FullRefresh(DDLElement):
+    """Recompute all the rows of the view, without blocking the readers"""
+
+    def __init__(self, name, selectable, columns):
+        self.name = name
+        self.selectable = selectable
+        self.columns = columns
+
+
+@compiles(FullRefresh)
+def compile_full_refresh(element, compiler, **kw):
+    quote = compiler.preparer.quote
+    columns = ', '.join(quote(column) for column in element.columns)
+    return (
+        'DELETE FROM %(log)s;'
+        'DELETE FROM %(view)s;'
+        'INSERT INTO %(view)s (%(columns)s) '
+        'SELECT %(columns)s FROM (%(query)s) AS query'
+    ) % dict(
+        log=quote(change_log_name(element.name)),
+        view=quote(element.name),
+        columns=columns,
+        query=compiler.sql_compiler.process(
+            element.selectable, literal_binds=True),
+    )
+
+
+def change_log_name(name):
+    return truncate_name(name + '__changes')
+
+
+def pending_name(name):
+    return truncate_name(name + '__pending')
+
+
+def change_function_name(name, table):
+    return truncate_name('%s__log_%s' % (name, table))
+
+
+def change_trigger_name(name):
+    return truncate_name(name + '__log')
+
+
+def match_keys(left, right, keys, quote):
+    return ' AND '.join('%s.%s = %s.%s' % (left, quote(key), right, quote(key))
+                        for key in keys)
+
+
+class IncrementalRefresh:
+    """Incremental refresh of one view
+
+    :param name: name of the view
+    :param selectable: query of the view
+    :param keys: names of the primary keys of the view
+    :param sources: dict ``{source table: [column for each key]}``
+    :param key_columns: the source column selected for each key
+    """
+
+    def __init__(self, name, selectable, keys, sources, key_columns):
+        self.name = name
+        self.selectable = selectable
+        self.keys = keys
+        self.sources = sources
+        self.key_columns = key_columns
+        self.columns = [column.name
+                        for column in selectable.selected_columns]
+
+    def get_ddl(self, with_data=None):
+        """Return the DDL elements to create the view, its change log and
+        the triggers on the source tables"""
+        res = [
+            CreateIncrementalView(self.name, self.selectable,
+                                  with_data=with_data),
+            CreateChangeLog(self.name, self.selectable, self.keys),
+        ]
+        for table, columns in self.sources.items():
+            res.append(CreateChangeTrigger(self.name, table, columns,
+                                           self.keys))
+
+        return res
+
+    def refresh(self, bind, full=False):
+        """Recompute the rows whose keys were logged, or all of them
+
+        :param bind: registry or connection to execute the queries
+        :param full: if True, recompute all the rows
+        """
+        if full:
+            bind.execute(FullRefresh(self.name, self.selectable,
+                                     self.columns))
+        else:
+            bind.execute(CollectChanges(self.name, self.keys))
+            bind.execute(ApplyChanges(self.name,
+                                      self.get_changed_rows_query(),
+                                      self.keys, self.columns))
+
+    def get_changed_rows_query(self):
+        """Return the query of the view restricted to the collected keys
+
+        The keys are filtered on the source columns, in the ``WHERE`` clause
+        of the query, so only the source rows of these keys are read and
+        grouped.
+        """
+        pending = expression.table(
+            pending_name(self.name),
+            *[expression.column(key) for key in self.keys])
+        if len(self.key_columns) == 1:
+            key_columns = self.key_columns[0]
+        else:
+            key_columns = tuple_(*self.key_columns)
+
+        return self.selectable.where(
+            key_columns.in_(select(*pending.columns)))
+
+    @classmethod
+    def from_selectable(cls, name, selectable, keys):
+        """Return the incremental refresh of the view, or None if the
+        shape of the query is not supported"""
+        sources = get_source_columns(selectable, keys)
+        if sources is None:
+            return None
+
+        key_columns = get_key_columns(selectable, keys,
+                                      get_source_tables(selectable))
+        return cls(name, selectable, keys, sources, key_columns)
+
+
+def get_source_columns(selectable, keys):
+    """Map the primary keys of the view on the columns of each source table
+
+    :param selectable: query of the view
+    :param keys: names of the primary keys of the view
+    :rtype: dict ``{table: [column for each key]}``, or None if the query
+            is not supported
+    """
+    tables = get_source_tables(selectable)
+    if tables is None:
+        return None
+
+    equivalents = get_equivalent_columns(tables, selectable)
+    key_columns = get_key_columns(selectable, keys, tables)
+    if key_columns is None:
+        return None
+
+    sources = {}
+    for table in tables:
+        columns = []
+        for key_column in key_columns:
+            for column in equivalents.get(key_column, [key_column]):
+                if column.table is table:
+                    columns.append(column)
+                    break
+            else:
+                return None
+
+        sources[table] = columns
+
+    return sources
+
+
+def get_source_tables(selectable):
+    """Return the tables of the query, or None if it is not supported"""
+    if not isinstance(selectable, Select):
+        return None
+
+    if (selectable._limit_clause is not None or
+            selectable._offset_clause is not None):
+        return None
+
+    tables = []
+    for from_ in selectable.get_final_froms():
+        if not collect_tables(from_, tables):
+            return None
+
+    if len(set(tables)) != len(tables):
+        return None
+
+    if has_unsupported_elements(selectable, tables):
+        return None
+
+    return tables
+
+
+def has_unsupported_elements(selectable, tables):
+    """Return True if the query reads other rows than the ones of the keys,
+    or other relations than its source tables
+
+    The subqueries, the window functions, ``DISTINCT ON`` and the relations
+    out of the ``FROM`` clause are not supported.
+    """
+    if selectable._distinct_on:
+        return True
+
+    for element in visitors.iterate(selectable):
+        if element is selectable:
+            continue
+
+        if isinstance(element, (SelectBase, ScalarSelect, Exists,
+                                AliasedReturnsRows, Over)):
+            return True
+
+        if (isinstance(element, TableClause) and
+                not any(element is table for table in tables)):
+            return True
+
+    return False
+
+
+def get_key_columns(selectable, keys, tables):
+    """Return the source column of each key, or None if one of them is
+    not a column of the source tables"""
+    selected_columns = selectable.selected_columns
+    key_columns = []
+    for key in keys:
+        if key not in selected_columns:
+            return None
+
+        column = selected_columns[key]
+        while isinstance(column, Label):
+            column = column.element
+
+        if not is_table_column(column, tables):
+            return None
+
+        key_columns.append(column)
+
+    return key_columns
+
+
+def collect_tables(from_, tables):
+    if isinstance(from_, Table):
+        tables.append(from_)
+        return True
+
+    if isinstance(from_, Join):
+        return (collect_tables(from_.left, tables) and
+                collect_tables(from_.right, tables))
+
+    return False
+
+
+def get_clauses(selectable):
+    """Return the WHERE clause and the ON clauses of the joins"""
+    clauses = [selectable.whereclause]
+    joins = list(selectable.get_final_froms())
+    while joins:
+        from_ = joins.pop()
+        if isinstance(from_, Join):
+            clauses.append(from_.onclause)
+            joins.extend((from_.left, from_.right))
+
+    return [clause for clause in clauses if clause is not None]
+
+
+def is_table_column(column, tables):
+    return isinstance(column, ColumnClause) and any(
+        column.table is table for table in tables)
+
+
+def get_conjuncts(clause):
+    """Yield the terms of the top-level ``AND`` of the clause
+
+    The terms under an ``OR`` or a ``NOT`` are not true for every row, they
+    are never split.
+    """
+    if isinstance(clause, Grouping):
+        yield from get_conjuncts(clause.element)
+    elif (isinstance(clause, BooleanClauseList) and
+            clause.operator is operators.and_):
+        for term in clause.clauses:
+            yield from get_conjuncts(term)
+    else:
+        yield clause
+
+
+def get_equivalent_columns(tables, selectable):
+    """Return the classes of the columns equal in the clauses of the query
+
+    Only the equalities of the top-level ``AND`` of the clauses are used.
+
+    :rtype: dict ``{column: list of the equal columns}``
+    """
+    classes = {}
+    for clause in get_clauses(selectable):
+        for element in get_conjuncts(clause):
+            if not isinstance(element, BinaryExpression):
+                continue
+
+            if element.operator is not operators.eq:
+                continue
+
+            left, right = element.left, element.right
+            if not (is_table_column(left, tables) and
+                    is_table_column(right, tables)):
+                continue
+
+            merged = classes.get(left, [left])
+            for column in classes.get(right, [right]):
+                if not any(column is x for x in merged):
+                    merged.append(column)
+
+            for column in merged:
+                classes[column] = merged
+
+    return classes
@@ -0,0 +1,232 @@
+# This file is a part of the AnyBlok / postgres api project
+#
+#    Copyright (C) 2026 Jean-Sebastien SUZANNE <js.suzanne@gmail.com>
+#
+# This Source Code Form is subject to the terms of the Mozilla Public License,
+# v. 2.0. If a copy of the MPL was not distributed with this file,You can
+# obtain one at http://mozilla.org/MPL/2.0/.
+"""Metrics of the refreshes of the materialized views
+
+The hooks added to :data:`instrumentation` are called after each refresh
+with its :class:`RefreshMetrics`::
+
+    from anyblok_postgres.instrumentation import instrumentation
+
+    def send_metrics(metrics):
+        statsd.timing('refresh.%s' % metrics.view, metrics.duration)
+
+    instrumentation.add_hook(send_metrics)
+
+:func:`log_refresh` is a hook writing the metrics in the logs. Without hook,
+the metrics are not measured.
+
+With ``instrumentation.explain_threshold``, in seconds, the plan of the
+query of the view, from ``EXPLAIN (ANALYZE, BUFFERS)``, is captured in
+``metrics.plan`` when the refresh lasts longer. This query is run again by
+the capture.
+
+The numbers of rows are estimated from ``pg_class.reltuples``, which is
+only updated by ``VACUUM`` and ``ANALYZE``. With
+``instrumentation.exact_counts`` they are counted by ``count(*)`` before
+and after the refresh, which reads the whole view twice.
+"""
+from contextlib import contextmanager
+from logging import getLogger
+from time import perf_counter
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.schema import DDLElement
+from anyblok_postgres.profiling import profiler
+
+logger = getLogger(__name__)
+
+
+class ExplainAnalyze(DDLElement):
+    def __init__(self, selectable):
+        self.selectable = selectable
+
+
+@compiles(ExplainAnalyze)
+def compile_explain_analyze(element, compiler, **kw):
+    return 'EXPLAIN (ANALYZE, BUFFERS) %s' % compiler.sql_compiler.process(
+        element.selectable, literal_binds=True)
+
+
+class RefreshMetrics:
+    """Metrics of one refresh
+
+    * ``view``: name of the view
+    * ``mode``: ``'blocking'``, ``'concurrently'``, ``'swap'``,
+      ``'incremental'``, ``'incremental full'``, or ``'partitions'``
+    * ``duration``: duration of the refresh in seconds, lock waits
+      included
+    * ``advisory_lock_wait``: wait of the other refreshes of the view in
+      seconds. The wait of the lock taken by the refresh on the view, held
+      by its readers, is not measured apart and only counts in
+      ``duration``
+    * ``rows_before`` and ``rows_after``: number of rows of the view,
+      estimated from ``pg_class.reltuples`` unless ``exact_counts`` is
+      set, None if the view was not populated or never analyzed
+    * ``size_before`` and ``size_after``: size in bytes of the view, from
+      ``pg_relation_size``
+    * ``plan``: plan of the query of the view, if captured
+    """
+
+    def __init__(self, view, mode):
+        self.view = view
+        self.mode = mode
+        self.duration = None
+        self.advisory_lock_wait = None
+        self.rows_before = None
+        self.rows_after = None
+        self.size_before = None
+        self.size_after = None
+        self.plan = None
+
+    def to_dict(self):
+        return {key: getattr(self, key)
+                for key in ('view', 'mode', 'duration',
+                            'advisory_lock_wait', 'rows_before',
+                            'rows_after', 'size_before', 'size_after',
+                            'plan')}
+
+
+class RefreshInstrumentation:
+    """Hooks called with the metrics of the refreshes
+
+    :param explain_threshold: duration in seconds from which the plan of the
+                              query of the view is captured, None to never
+                              capture it
+    :param exact_counts: if True, the rows of the view are counted before
+                         and after the refresh instead of estimated
+    """
+
+    def __init__(self, explain_threshold=None, exact_counts=False):
+        self.hooks = []
+        self.explain_threshold = explain_threshold
+        self.exact_counts = exact_counts
+
+    def add_hook(self, hook):
+        """Add a callable called with the metrics of each refresh"""
+        if hook not in self.hooks:
+            self.hooks.append(hook)
+
+    def remove_hook(self, hook):
+        if hook in self.hooks:
+            self.hooks.remove(hook)
+
+    @contextmanager
+    def measure(self, bind, view, mode):
+        """Measure the refresh run in the context
+
+        :param bind: registry or connection to execute the queries
+        :param view: table clause of the view
+        :param mode: mode of the refresh
+        :rtype: the metrics, None if there is no hook
+
+        The refresh is also measured in a ``view.refresh`` span, see
+        :mod:`anyblok_postgres.profiling`.
+        """
+        with profiler.span('view.refresh', view=view.name, mode=mode):
+            if not self.hooks:
+                yield None
+                return
+
+            metrics = RefreshMetrics(view.name, mode)
+            relations = get_storage_names(view)
+            metrics.rows_before = self.get_rows(bind, view.name, relations)
+            metrics.size_before = get_size(bind, relations)
+            start = perf_counter()
+            yield metrics
+            metrics.duration = perf_counter() - start
+            metrics.rows_after = self.get_rows(bind, view.name, relations)
+            metrics.size_after = get_size(bind, relations)
+            if (self.explain_threshold is not None and
+                    metrics.duration >= self.explain_threshold):
+                metrics.plan = '\n'.join(
+                    line for line, in bind.execute(
+                        ExplainAnalyze(view.definition)).fetchall())
+
+            for hook in self.hooks:
+                try:
+                    hook(metrics)
+                except Exception:
+                    logger.exception('The refresh hook %r failed', hook)
+
+    def get_rows(self, bind, name, relations):
+        if self.exact_counts:
+            return count_rows(bind, name, relations)
+
+        return estimate_rows(bind, relations)
+
+    @contextmanager
+    def advisory_lock_wait(self, metrics):
+        """Measure the wait of the advisory lock of the refresh, taken in
+        the context"""
+        start = perf_counter()
+        yield
+        if metrics is not None:
+            metrics.advisory_lock_wait = perf_counter() - start
+
+
+instrumentation = RefreshInstrumentation()
+
+
+def get_storage_names(view):
+    """Return the names of the relations storing the rows of the view"""
+    if view.partitioning is not None:
+        return list(view.partitioning.get_names().values())
+
+    return [view.name]
+
+
+def are_populated(bind, relations):
+    """Return True if all the relations are populated, from
+    ``pg_class.relispopulated``"""
+    return bool(bind.execute(
+        'SELECT bool_and(relispopulated) FROM pg_class '
+        'WHERE relname IN (%s) AND pg_catalog.pg_table_is_visible(oid)' % (
+            ', '.join("'%s'" % relation for relation in relations))
+    ).scalar())
+
+
+def count_rows(bind, name, relations):
+    """Return the number of rows of the view, None if one of its
+    relations is not populated"""
+    if not are_populated(bind, relations):
+        return None
+
+    return bind.execute('SELECT count(*) FROM %s' % name).scalar()
+
+
+def estimate_rows(bind, relations):
+    """Return the number of rows of the view from ``pg_class.reltuples``,
+    None if one of its relations is not populated or never analyzed"""
+    populated, rows = bind.execute(
+        'SELECT bool_and(relispopulated AND reltuples >= 0), sum(reltuples) '
+        'FROM pg_class '
+        'WHERE relname IN (%s) AND pg_catalog.pg_table_is_visible(oid)' % (
+            ', '.join("'%s'" % relation for relation in relations))
+    ).first()
+    if not populated:
+        return None
+
+    return int(rows)
+
+
+def get_size(bind, relations):
+    return bind.execute('SELECT %s' % ' + '.join(
+        "pg_relation_size('%s')" % relation for relation in relations)
+    ).scalar()
+
+
+def log_refresh(metrics):
+    """Hook writing the metrics of the refresh in the logs"""
+    logger.info(
+        'Refresh of the materialized view %r (%s): %.3fs, advisory lock wait '
+        '%.3fs, rows %s -> %s, size %s -> %s bytes', metrics.view,
+        metrics.mode, metrics.duration, metrics.advisory_lock_wait or 0,
+        metrics.rows_before, metrics.rows_after, metrics.size_before,
+        metrics.size_after)
+    if metrics.plan:
+        logger.info('Plan of the materialized view %r:\n%s', metrics.view,
+                    metrics.plan)
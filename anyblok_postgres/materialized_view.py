@@ -9,10 +9,36 @@ from anyblok.model.factory import ViewFactory
 from anyblok.model.exceptions import ViewException
 from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.schema import DDLElement
-from sqlalchemy.sql import table
-from sqlalchemy import event
-from sqlalchemy.orm import Query
+from sqlalchemy.sql import TableClause, table, visitors
+from sqlalchemy.sql.expression import ColumnClause
+from sqlalchemy import String, event, text
+from sqlalchemy.orm import Query, Session, aliased
 from anyblok.common import anyblok_column_prefix
+from anyblok_postgres.common import MAX_IDENTIFIER_LENGTH, truncate_name
+from anyblok_postgres.incremental import IncrementalRefresh, change_log_name
+from anyblok_postgres.staleness import ChangeTracking
+from anyblok_postgres.partition import Partitioning
+from anyblok_postgres.instrumentation import (
+    instrumentation, are_populated, get_storage_names)
+from sqlalchemy_views import CreateView
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from logging import getLogger
+from threading import Lock, Thread
+from datetime import timedelta
+from time import monotonic, sleep
+from copy import copy
+from hashlib import sha1
+from zlib import crc32
+
+logger = getLogger(__name__)
+
+REFRESH_POLICIES = ('stale', 'always')
+REFRESH_STRATEGIES = ('refresh', 'swap')
+UNPOPULATED_READS = ('error', 'wait', 'fallback')
+ADVISORY_LOCK_NAMESPACE = crc32(b'anyblok_postgres.refresh') - 2 ** 31
+DEFINITION_HASH_PREFIX = 'anyblok_postgres:'
+RELATION_KINDS = {'m': 'MATERIALIZED VIEW', 'v': 'VIEW', 'r': 'TABLE'}
+FALLBACK_OPTION = 'anyblok_view_fallback'
 
 
 class CreateMaterializedView(DDLElement):
@@ -37,18 +63,1156 @@ def compile(element, compiler, **kw):
     )
 
 
+class CreateMaterializedViewIndex(DDLElement):
+    def __init__(self, name, view, columns, unique=False):
+        self.name = name
+        self.view = view
+        self.columns = columns
+        self.unique = unique
+
+
+@compiles(CreateMaterializedViewIndex)
+def compile_create_index(element, compiler, **kw):
+    quote = compiler.preparer.quote
+    return 'CREATE %sINDEX IF NOT EXISTS %s ON %s (%s)' % (
+        'UNIQUE ' if element.unique else '',
+        quote(element.name),
+        quote(element.view.name),
+        ', '.join(quote(column) for column in element.columns),
+    )
+
+
+class DropMaterializedView(DDLElement):
+    def __init__(self, name):
+        self.name = name
+
+
+@compiles(DropMaterializedView)
+def compile_drop(element, compiler, **kw):
+    return 'DROP MATERIALIZED VIEW IF EXISTS %s' % (
+        compiler.preparer.quote(element.name))
+
+
+class SwapMaterializedView(DDLElement):
+    """Replace the view and its indexes by the shadow ones, and copy the
+    comment of the view"""
+
+    def __init__(self, name, indexes, comment=None):
+        self.name = name
+        self.indexes = indexes
+        self.comment = comment
+
+
+@compiles(SwapMaterializedView)
+def compile_swap(element, compiler, **kw):
+    quote = compiler.preparer.quote
+    res = [
+        'DROP MATERIALIZED VIEW %s' % quote(element.name),
+        'ALTER MATERIALIZED VIEW %s RENAME TO %s' % (
+            quote(shadow_name(element.name)), quote(element.name)),
+    ]
+    for index in element.indexes:
+        res.append('ALTER INDEX %s RENAME TO %s' % (
+            quote(shadow_name(index)), quote(index)))
+
+    if element.comment is not None:
+        res.append('COMMENT ON MATERIALIZED VIEW %s IS %s' % (
+            quote(element.name), compiler.sql_compiler.render_literal_value(
+                element.comment, String())))
+
+    return ';'.join(res)
+
+
+def shadow_name(name):
+    return name + '__shadow'
+
+
+def index_name(tablename, suffix, unique=False):
+    """Return the name of the index of the view
+
+    The names longer than the identifiers of PostgreSQL, with the suffix of
+    their shadow name, are truncated and end with a hash of the full name,
+    PostgreSQL would truncate them and ``IF NOT EXISTS`` would skip the
+    indexes with the same truncated name.
+
+    :param tablename: name of the view
+    :param suffix: ``'pk'`` or the names of the columns joined by ``_``
+    :param unique: True for the unique index
+    """
+    return truncate_name(
+        '%s_%s__%s' % ('anyblok_uix' if unique else 'anyblok_ix', tablename,
+                       suffix),
+        max_length=MAX_IDENTIFIER_LENGTH - len(shadow_name('')))
+
+
+class RenameShadow(DDLElement):
+    """Rename the shadow relation in place of the relation"""
+
+    def __init__(self, kind, name):
+        self.kind = kind
+        self.name = name
+
+
+@compiles(RenameShadow)
+def compile_rename_shadow(element, compiler, **kw):
+    quote = compiler.preparer.quote
+    return 'ALTER %s %s RENAME TO %s' % (
+        element.kind, quote(shadow_name(element.name)), quote(element.name))
+
+
+class CommentOnView(DDLElement):
+    """Save the hash of the definition of the view in its comment"""
+
+    def __init__(self, name, kind, definition_hash):
+        self.name = name
+        self.kind = kind
+        self.definition_hash = definition_hash
+
+
+@compiles(CommentOnView)
+def compile_comment(element, compiler, **kw):
+    return "COMMENT ON %s %s IS '%s%s'" % (
+        element.kind, compiler.preparer.quote(element.name),
+        DEFINITION_HASH_PREFIX, element.definition_hash)
+
+
+class ViewDDL:
+    """Creation of one view, by the ``after_create`` event of the metadata
+
+    The DDL elements are built at each load of the registry, but only
+    rendered, and hashed, when the tables are created or
+    ``definition_hash`` is read, at most once by load. The hash of the
+    rendered DDL is saved in the comment of the view: the statements are not
+    executed while this hash does not change, and the view is rebuilt when
+    it changes, see :meth:`rebuild`. The views created before, without
+    hash, are rebuilt too, their definition is unknown.
+
+    :param view: table clause of the view
+    :param kind: ``'MATERIALIZED VIEW'``, ``'VIEW'`` or ``'TABLE'``, the
+                 relation of the view
+    :param elements: DDL elements to create the view
+    :param dialect: dialect of the database
+    """
+
+    def __init__(self, view, kind, elements, dialect):
+        self.view = view
+        self.kind = kind
+        self.elements = elements
+        self.dialect = dialect
+        self.statements = None
+        self.shadow_statements = []
+        self.renames = []
+        self._definition_hash = None
+        self.comment = None
+
+    @property
+    def definition_hash(self):
+        self.render()
+        return self._definition_hash
+
+    def render(self):
+        """Render the DDL elements and hash them, on the first use only, as
+        most loads of the registries do not create the views"""
+        if self.statements is not None:
+            return
+
+        elements, dialect = self.elements, self.dialect
+        self.statements = [str(element.compile(dialect=dialect))
+                           for element in elements]
+        self.set_shadow_statements(elements, dialect)
+        definition = sha1()
+        for element, statement in zip(elements, self.statements):
+            if getattr(element, 'with_data', None) is not None:
+                # creating the view with or without data is not a change
+                # of its definition
+                element = copy(element)
+                element.with_data = None
+                statement = str(element.compile(dialect=dialect))
+
+            definition.update(statement.encode('utf-8'))
+
+        self._definition_hash = definition.hexdigest()
+        self.comment = str(CommentOnView(
+            self.view.name, self.kind, self._definition_hash
+        ).compile(dialect=dialect))
+
+    def __call__(self, target, connection, **kw):
+        self.render()
+        definition_hash = get_definition_hash(connection, self.view.name)
+        if definition_hash == self._definition_hash:
+            return
+
+        if definition_hash is None and not relation_exists(
+                connection, self.view.name):
+            for statement in self.statements:
+                connection.exec_driver_sql(statement)
+        else:
+            logger.info('The definition of the view %r changed, the view is '
+                        'rebuilt', self.view.name)
+            self.rebuild(connection)
+
+        connection.exec_driver_sql(self.comment)
+
+    def set_shadow_statements(self, elements, dialect):
+        """Render the creation of the shadow of the materialized views and
+        of their indexes, and their renames in place of the relations"""
+        shadows = []
+        views = set()
+        for element in elements:
+            if isinstance(element, CreateMaterializedView):
+                name = getattr(element.name, 'name', element.name)
+                views.add(name)
+                shadows.append(DropMaterializedView(shadow_name(name)))
+                shadows.append(CreateMaterializedView(
+                    shadow_name(name), element.selectable, element.with_data))
+                self.renames.append(RenameShadow('MATERIALIZED VIEW', name))
+            elif (isinstance(element, CreateMaterializedViewIndex) and
+                    element.view.name in views):
+                shadows.append(CreateMaterializedViewIndex(
+                    shadow_name(element.name),
+                    table(shadow_name(element.view.name)), element.columns,
+                    unique=element.unique))
+                self.renames.append(RenameShadow('INDEX', element.name))
+
+        self.shadow_statements = [str(element.compile(dialect=dialect))
+                                  for element in shadows]
+        self.renames = [str(element.compile(dialect=dialect))
+                        for element in self.renames]
+
+    def rebuild(self, connection):
+        """Replace the view by the one of the new definition
+
+        The new materialized views and their indexes are filled as shadow
+        relations, then the old relations are dropped and the shadow ones are
+        renamed in their place: the readers are only blocked from the drop to
+        the end of the transaction. The views depending on the view are
+        dropped with it, and created again from their definitions,
+        ``pg_get_viewdef``, in the order of their dependencies, with their
+        indexes and comments.
+
+        .. warning::
+
+            The privileges granted on the view and on the views depending on
+            it are not restored. The incremental views are not swapped, their
+            table is recreated after the drop.
+        """
+        self.render()
+        for statement in self.shadow_statements:
+            connection.exec_driver_sql(statement)
+
+        names = [self.view.name]
+        names.extend(x for x in get_storage_names(self.view) if x not in names)
+        dependents = get_dependent_views(connection, names)
+        drop_view(connection, self.view.name, cascade=True)
+        self.view.tracking.forget(connection)
+        for statement in self.renames + self.statements:
+            connection.exec_driver_sql(statement)
+
+        restore_views(connection, dependents)
+        self.view.populated = False
+        self.view.fresh_until = 0
+        self.view.materialized = None
+
+
+def get_comment(bind, name):
+    """Return the comment of the relation, None if it does not exist or has
+    no comment"""
+    return bind.execute(text(
+        "SELECT obj_description(oid, 'pg_class') FROM pg_class "
+        "WHERE relname = :name AND pg_catalog.pg_table_is_visible(oid)"
+    ), dict(name=name)).scalar()
+
+
+def get_definition_hash(bind, name):
+    """Return the hash of the definition saved in the comment of the view,
+    None if the view does not exist or has no hash"""
+    comment = get_comment(bind, name)
+    if not comment or not comment.startswith(DEFINITION_HASH_PREFIX):
+        return None
+
+    return comment[len(DEFINITION_HASH_PREFIX):]
+
+
+def relation_exists(bind, name):
+    """Return True if a relation of this name exists"""
+    return bind.execute(text(
+        "SELECT count(*) FROM pg_class "
+        "WHERE relname = :name AND pg_catalog.pg_table_is_visible(oid)"
+    ), dict(name=name)).scalar() > 0
+
+
+def drop_view(bind, name, cascade=False):
+    """Drop the relations storing the view: the materialized view, the
+    table of the incremental view and its change log, or the view of the
+    partitions and their materialized views
+
+    :param bind: registry or connection to execute the queries
+    :param name: name of the view
+    :param cascade: if True, the views depending on them are dropped too
+    """
+    relations = bind.execute(text(
+        "SELECT quote_ident(relname), relkind FROM pg_class "
+        "WHERE (relname = :name OR (relname LIKE :partitions AND "
+        "relkind = 'm') OR relname = :changes) "
+        "AND relkind IN ('m', 'v', 'r') AND relname NOT LIKE '%\\_\\_shadow' "
+        "AND pg_catalog.pg_table_is_visible(oid) "
+        "ORDER BY relname = :name DESC"
+    ), dict(name=name, partitions=name.replace('_', '\\_') + '\\_\\_%',
+            changes=change_log_name(name))).fetchall()
+    for relname, relkind in relations:
+        bind.execute(text('DROP %s IF EXISTS %s%s' % (
+            RELATION_KINDS[relkind], relname, ' CASCADE' if cascade else '')))
+
+
+def get_dependent_views(bind, names):
+    """Return the views depending on the relations, directly or not, each
+    one after the views it reads
+
+    :param bind: registry or connection to execute the queries
+    :param names: names of the relations
+    :rtype: list of the rows ``(name, relkind, relispopulated, definition,
+            comment, indexes)``, the names and the comment being quoted
+    """
+    res = []
+    for row in bind.execute(text(
+        "WITH RECURSIVE dependents(oid, depth) AS ("
+        "SELECT oid, 0 FROM pg_class WHERE relname = ANY(:names) "
+        "AND pg_catalog.pg_table_is_visible(oid) "
+        "UNION "
+        "SELECT r.ev_class, dependents.depth + 1 FROM dependents "
+        "JOIN pg_depend d ON d.refobjid = dependents.oid "
+        "JOIN pg_rewrite r ON r.oid = d.objid "
+        "WHERE d.classid = 'pg_rewrite'::regclass "
+        "AND d.refclassid = 'pg_class'::regclass "
+        "AND r.ev_class <> d.refobjid) "
+        "SELECT c.oid, quote_ident(c.relname) AS name, c.relkind, "
+        "c.relispopulated, rtrim(pg_get_viewdef(c.oid), ';') AS definition, "
+        "quote_literal(obj_description(c.oid, 'pg_class')) AS comment, "
+        "max(dependents.depth) AS depth "
+        "FROM dependents JOIN pg_class c ON c.oid = dependents.oid "
+        "WHERE NOT c.relname = ANY(:names) "
+        "GROUP BY c.oid, c.relname, c.relkind, c.relispopulated "
+        "ORDER BY depth, c.relname"
+    ), dict(names=names)).fetchall():
+        indexes = [definition for definition, in bind.execute(text(
+            'SELECT pg_get_indexdef(indexrelid) FROM pg_index '
+            'WHERE indrelid = :oid'), dict(oid=row.oid)).fetchall()]
+        res.append((row.name, row.relkind, row.relispopulated,
+                    row.definition, row.comment, indexes))
+
+    return res
+
+
+def restore_views(connection, views):
+    """Create again the views returned by :func:`get_dependent_views`
+
+    :param connection: connection to execute the queries
+    :param views: the views to create, in this order
+    """
+    for name, relkind, populated, definition, comment, indexes in views:
+        kind = RELATION_KINDS[relkind]
+        statements = ['CREATE %s %s AS %s' % (kind, name, definition)]
+        if relkind == 'm' and not populated:
+            statements[0] += ' WITH NO DATA'
+
+        statements.extend(indexes)
+        if comment is not None:
+            statements.append('COMMENT ON %s %s IS %s' % (
+                kind, name, comment))
+
+        for statement in statements:
+            connection.exec_driver_sql(statement.replace('%', '%%'))
+
+
+class MaterializedView(TableClause):
+    """Table clause of a materialized view, with its refresh behaviour"""
+
+    inherit_cache = True
+
+    def __init__(self, name, *columns, **kw):
+        super(MaterializedView, self).__init__(name, *columns, **kw)
+        self.definition = None
+        self.fallback = None
+        self.incremental = None
+        self.partitioning = None
+        self.tracking = None
+        self.refresh_interval = None
+        self.refresh_policy = 'stale'
+        self.populated = False
+        self.unpopulated_read = 'error'
+        self.unpopulated_timeout = 30
+        self.max_staleness = None
+        self.fresh_until = 0
+        self.background_refresh = Lock()
+        self.ddl = None
+        self.hybrid = False
+        self.materialized = True
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def read_fallback(orm_execute_state):
+    """Read the query of the view instead of the view, for the queries
+    returned by :meth:`Refresh.query` with the ``anyblok_view_fallback``
+    execution option
+
+    The columns of the view in the criteria added to the query, as
+    ``filter(Model.code == 'test')``, are replaced by the columns of the
+    query of the view.
+    """
+    view = orm_execute_state.execution_options.get(FALLBACK_OPTION)
+    if view is None or not orm_execute_state.is_select:
+        return
+
+    def replace(element):
+        if element is view:
+            return view.fallback
+
+        if isinstance(element, ColumnClause) and element.table is view:
+            return view.fallback.c[element.name]
+
+        return None
+
+    orm_execute_state.statement = visitors.replacement_traverse(
+        orm_execute_state.statement, dict(stop_on=[view.fallback]), replace)
+
+
 class Refresh:
 
     @classmethod
-    def refresh_materialized_view(cls, concurrently=False):
-        lnft = cls.anyblok.loaded_namespaces_first_step
-        tablename = lnft[cls.__registry_name__]['__tablename__']
+    def query(cls, *elements):
+        """Return a query on the view, or on the query of the view if the
+        view can not be read, see :meth:`read_from_view`
+
+        The query on the query of the view is on an alias of the model, the
+        criteria on the columns of the model are adapted at the execution,
+        see :func:`read_fallback`.
+
+        :exception: ViewException
+        """
+        if cls.read_from_view():
+            return super(Refresh, cls).query(*elements)
+
+        view = cls.__view__
+        if not elements:
+            elements = (aliased(cls, view.fallback, adapt_on_names=True),)
+
+        query = super(Refresh, cls).query(*elements)
+        return query.execution_options(**{FALLBACK_OPTION: view})
+
+    @classmethod
+    def read_from_view(cls):
+        """Return False if the queries must run the query of the view
+
+        This is the case of the view not populated yet, with
+        ``unpopulated_read = 'fallback'``, and of the view stale for longer
+        than ``max_staleness``. A refresh of the view is then requested with
+        :meth:`refresh_in_background`.
+
+        :exception: ViewException, if the view is still not populated after
+                    ``unpopulated_timeout``
+        """
+        view = cls.__view__
+        if (view.unpopulated_read != 'error' and
+                not is_populated(cls.anyblok, view)):
+            if view.unpopulated_read == 'fallback':
+                cls.refresh_in_background()
+                return False
+
+            if not wait_populated(cls.anyblok, view, view.unpopulated_timeout):
+                raise ViewException(
+                    "The view %r is not populated after %s seconds" % (
+                        view.name, view.unpopulated_timeout))
+
+        if (view.max_staleness is not None and
+                is_materialized(cls.anyblok, view) and
+                exceeds_staleness(cls.anyblok, view)):
+            cls.refresh_in_background()
+            return False
+
+        return True
+
+    @classmethod
+    def refresh_in_background(cls):
+        """Request a refresh of the view, without waiting it
+
+        By default the view is refreshed in a thread, see
+        :func:`refresh_in_background`. The models can overload it, to ask
+        the refresh to a :class:`~anyblok_postgres.scheduler.RefreshScheduler`
+        """
+        refresh_in_background(cls.anyblok, cls.__view__)
+
+    @classmethod
+    def refresh_materialized_view(cls, concurrently=False, full=False,
+                                  strategy='refresh', partitions=None,
+                                  wait=False):
+        """Refresh the materialized view
+
+        :param concurrently: if True, the readers are not blocked, the view
+                             needs a unique index
+        :param full: for the views with ``incremental_refresh``, recompute
+                     all the rows instead of the changed ones
+        :param strategy: ``'swap'`` to fill a shadow view and rename it in
+                         place of the view, see :func:`swap_view`
+        :param partitions: for the partitioned views, names of the
+                           partitions to refresh, all of them by default
+        :param wait: if True, wait the end of the refresh of another
+                     transaction instead of skipping the view
+        :rtype: bool, True if the view was refreshed
+        """
+        cls.anyblok.flush()
+        return refresh_view(cls.anyblok, cls.__view__,
+                            concurrently=concurrently, full=full,
+                            strategy=strategy, partitions=partitions,
+                            wait=wait)
+
+    @classmethod
+    def schedule_refresh(cls, concurrently=False, wait=False):
+        """Refresh the materialized view after the commit of the current
+        transaction
+
+        The view is refreshed once, even if this method is called several
+        times in the transaction, and is not refreshed if the transaction
+        is rolled back.
+
+        :param concurrently: if True, the readers are not blocked
+        :param wait: if True, wait the end of the refresh of another
+                     transaction instead of skipping the view
+        """
+        cls.postcommit_hook('refresh_after_commit', concurrently=concurrently,
+                            wait=wait)
+
+    @classmethod
+    def refresh_after_commit(cls, concurrently=False, wait=False):
+        """Refresh the materialized view in its own transaction, called by
+        the postcommit hook of ``schedule_refresh``"""
+        try:
+            refresh_view(cls.anyblok, cls.__view__,
+                         concurrently=concurrently, wait=wait)
+            cls.anyblok.session_commit()
+        except Exception:
+            cls.anyblok.session.rollback()
+            raise
+
+    @classmethod
+    def is_stale(cls):
+        """Return True if one source of the view changed since the last
+        refresh, see :mod:`anyblok_postgres.staleness`"""
+        cls.anyblok.flush()
+        if not is_materialized(cls.anyblok, cls.__view__):
+            return False
+
+        return cls.__view__.tracking.is_stale(cls.anyblok)
+
+    @classmethod
+    def last_refreshed_at(cls):
+        """Return the date of the last refresh, None if the view was
+        never populated"""
+        state = cls.__view__.tracking.get_state(cls.anyblok)
+        return state.refreshed_at if state is not None else None
+
+    @classmethod
+    def refresh_if_stale(cls, max_age=None, concurrently=False, full=False,
+                         wait=False):
+        """Refresh the materialized view if one of its sources changed
+
+        :param max_age: ``timedelta`` or number of seconds, the view is not
+                        refreshed before this age, even if it is stale
+        :param concurrently: if True, the readers are not blocked
+        :param full: for the views with ``incremental_refresh``, recompute
+                     all the rows instead of the changed ones
+        :param wait: if True, wait the end of the refresh of another
+                     transaction instead of skipping the view
+        :rtype: bool, True if the view was refreshed
+        """
         cls.anyblok.flush()
+        if not is_materialized(cls.anyblok, cls.__view__):
+            return False
+
+        if not cls.__view__.tracking.is_stale(cls.anyblok, max_age=max_age):
+            return False
+
+        return refresh_view(cls.anyblok, cls.__view__,
+                            concurrently=concurrently, full=full, wait=wait)
+
+
+def refresh_view(bind, view, concurrently=False, full=False,
+                 strategy='refresh', partitions=None, wait=False):
+    """Refresh one materialized view
+
+    The refreshes of the same view are serialized by an advisory lock, held
+    until the end of the transaction of ``bind``: by default the view is
+    not refreshed if another transaction is refreshing it. The refreshes
+    are measured by :mod:`anyblok_postgres.instrumentation`. Nothing is
+    done for the views of :mod:`anyblok_postgres.hybrid` stored as plain
+    views.
+
+    :param bind: registry or connection to execute the queries
+    :param view: table clause of the view
+    :param concurrently: if True, the readers are not blocked
+    :param full: for the incremental views, recompute all the rows
+    :param strategy: ``'refresh'`` or ``'swap'``
+    :param partitions: for the partitioned views, names of the partitions
+                       to refresh, all of them by default
+    :param wait: if True, wait the end of the refresh of the other
+                 transaction instead of skipping the view
+    :rtype: bool, True if the view was refreshed
+    :exception: ViewException
+    """
+    check_refresh_options(view, strategy, partitions)
+    if not is_materialized(bind, view):
+        return False
+
+    if not wait and not lock_refresh(bind, view):
+        logger.info('The materialized view %r is already refreshed by '
+                    'another transaction, skipped', view.name)
+        return False
+
+    mode = get_refresh_mode(view, concurrently, full, strategy)
+    with instrumentation.measure(bind, view, mode) as metrics:
+        with instrumentation.advisory_lock_wait(metrics):
+            lock_refresh(bind, view, wait=True)
+
+        if view.partitioning is not None:
+            refresh_partitions(bind, view, partitions,
+                               concurrently=concurrently)
+        else:
+            refresh_storage(bind, view, concurrently=concurrently, full=full,
+                            strategy=strategy)
+
+    return True
+
+
+def lock_refresh(bind, view, wait=False):
+    """Take the advisory lock of the refreshes of the view, until the end of
+    the transaction of ``bind``
+
+    The lock is reentrant: a transaction holding it takes it again at once.
+
+    :param bind: registry or connection to execute the queries
+    :param view: table clause of the view
+    :param wait: if True, wait the lock instead of giving up
+    :rtype: bool, False if another transaction holds the lock
+    """
+    function = ('pg_advisory_xact_lock' if wait
+                else 'pg_try_advisory_xact_lock')
+    locked = bind.execute(
+        text('SELECT %s(:namespace, :key)' % function),
+        dict(namespace=ADVISORY_LOCK_NAMESPACE,
+             key=get_advisory_lock_key(view.name))
+    ).scalar()
+    return wait or bool(locked)
+
+
+def is_materialized(bind, view):
+    """Return False if the view is stored as a plain view, see
+    :mod:`anyblok_postgres.hybrid`
+
+    :param bind: registry or connection to execute the queries
+    :param view: table clause of the view
+    """
+    if view.materialized is None:
+        relkind = bind.execute(text(
+            "SELECT relkind FROM pg_class WHERE relname = :name "
+            "AND pg_catalog.pg_table_is_visible(oid)"
+        ), dict(name=get_storage_names(view)[0])).scalar()
+        if relkind is None:
+            return False
+
+        view.materialized = relkind != 'v'
+
+    return view.materialized
+
+
+def is_populated(bind, view):
+    """Return True if the view was populated by a refresh
+
+    The incremental views are populated by their first refresh, the other
+    ones when all their materialized views are. Once seen populated, the view
+    is not checked anymore.
+
+    :param bind: registry or connection to execute the queries
+    :param view: table clause of the view
+    """
+    if not view.populated:
+        if view.incremental is not None:
+            state = view.tracking.get_state(bind)
+            view.populated = bool(state and state.refreshed_at)
+        else:
+            view.populated = are_populated(bind, get_storage_names(view))
+
+    return view.populated
+
+
+def exceeds_staleness(bind, view):
+    """Return True if the view is stale for longer than its
+    ``max_staleness``
+
+    The view is not checked again before the end of the bound of its last
+    refresh, or during ``max_staleness`` once seen not stale.
+
+    :param bind: registry or connection to execute the queries
+    :param view: table clause of the view
+    """
+    if monotonic() < view.fresh_until:
+        return False
+
+    max_staleness = view.max_staleness
+    if not isinstance(max_staleness, timedelta):
+        max_staleness = timedelta(seconds=max_staleness)
+
+    state = view.tracking.get_state(bind)
+    if state is None or state.refreshed_at is None:
+        return True
+
+    if state.age < max_staleness:
+        view.fresh_until = monotonic() + (
+            max_staleness - state.age).total_seconds()
+        return False
+
+    if view.tracking.is_stale(bind, state=state):
+        return True
+
+    # the sources did not change since the last refresh, a change from
+    # now can not be older than max_staleness before this bound
+    view.fresh_until = monotonic() + max_staleness.total_seconds()
+    return False
+
+
+def wait_populated(bind, view, timeout, interval=0.1):
+    """Wait the population of the view by another transaction
+
+    :param bind: registry or connection to execute the queries
+    :param view: table clause of the view
+    :param timeout: maximal wait in seconds
+    :rtype: bool, True if the view is populated
+    """
+    deadline = monotonic() + timeout
+    while not is_populated(bind, view):
+        remaining = deadline - monotonic()
+        if remaining <= 0:
+            return False
+
+        sleep(min(interval, remaining))
+
+    return True
+
+
+def check_refresh_options(view, strategy, partitions):
+    """Check the options of the refresh of the view
+
+    :exception: ViewException
+    """
+    if strategy not in REFRESH_STRATEGIES:
+        raise ViewException("Unknown refresh strategy %r, must be one of %r"
+                            % (strategy, REFRESH_STRATEGIES))
+
+    if view.partitioning is None:
+        if partitions is not None:
+            raise ViewException("The view %r is not partitioned" % view.name)
+    elif strategy == 'swap':
+        raise ViewException(
+            "The partitions of the view %r can not be swapped, the view "
+            "depends on them" % view.name)
+
+
+def get_refresh_mode(view, concurrently, full, strategy):
+    """Return the mode of the refresh, for the metrics"""
+    if view.incremental is not None:
+        return 'incremental full' if full else 'incremental'
+
+    if view.partitioning is not None:
+        return 'partitions'
+
+    if strategy == 'swap':
+        return 'swap'
+
+    return 'concurrently' if concurrently else 'blocking'
+
+
+def get_advisory_lock_key(name):
+    """Return the key of the advisory lock of the view, as a signed int4"""
+    return crc32(name.encode('utf-8')) - 2 ** 31
+
+
+def try_refresh_view(bind, view, policy='always', concurrently=False,
+                     full=False):
+    """Refresh the view if no other transaction is refreshing it
+
+    The advisory lock is released at the end of the transaction of ``bind``
+
+    :param bind: registry or connection to execute the queries
+    :param view: table clause of the view
+    :param policy: ``'stale'`` to refresh the view only if it is stale
+    :param concurrently: if True, the readers are not blocked
+    :param full: for the incremental views, recompute all the rows
+    :rtype: bool, True if the view was refreshed
+    """
+    if not is_materialized(bind, view):
+        return False
+
+    if not lock_refresh(bind, view):
+        return False
+
+    if policy == 'stale' and not view.tracking.is_stale(bind):
+        return False
+
+    return refresh_view(bind, view, concurrently=concurrently, full=full,
+                        wait=True)
+
+
+def refresh_in_background(registry, view):
+    """Refresh the view in a background thread, on its own connection
+
+    Nothing is done if the view is already refreshed in background by this
+    process, and the view is skipped if another transaction is refreshing
+    it. The view is refreshed concurrently once populated.
+
+    :param registry: the current registry
+    :param view: table clause of the view
+    :rtype: the started thread, or None
+    """
+    if not view.background_refresh.acquire(blocking=False):
+        return None
+
+    populated = is_populated(registry, view)
+
+    def refresh():
+        try:
+            with registry.engine.connect() as connection:
+                with connection.begin():
+                    try_refresh_view(connection, view,
+                                     concurrently=populated,
+                                     full=not populated)
+        except Exception:
+            logger.exception(
+                'Background refresh of the materialized view %r failed',
+                view.name)
+        finally:
+            view.background_refresh.release()
+
+    thread = Thread(target=refresh, daemon=True,
+                    name='anyblok-materialized-view-refresh-%s' % view.name)
+    thread.start()
+    return thread
+
+
+def refresh_storage(bind, view, concurrently=False, full=False,
+                    strategy='refresh'):
+    """Refresh the relation storing the rows of the view"""
+    counters = view.tracking.get_counters(bind)
+    if view.incremental is not None:
+        view.incremental.refresh(bind, full=full)
+    elif strategy == 'swap':
+        swap_view(bind, view)
+    else:
         _con = 'CONCURRENTLY ' if concurrently else ''
-        cls.anyblok.execute('REFRESH MATERIALIZED VIEW ' + _con + tablename)
+        bind.execute('REFRESH MATERIALIZED VIEW ' + _con + view.name)
+
+    view.tracking.refreshed(bind, counters)
+
+
+def refresh_partitions(bind, view, partitions, concurrently=False):
+    """Refresh the materialized views of the partitions of the view
+
+    The state of the view is only saved when all the partitions are
+    refreshed, see :mod:`anyblok_postgres.staleness`
+    """
+    counters = view.tracking.get_counters(bind)
+    _con = 'CONCURRENTLY ' if concurrently else ''
+    for name in view.partitioning.get_refreshed_names(partitions):
+        bind.execute('REFRESH MATERIALIZED VIEW ' + _con + name)
+
+    if partitions is None:
+        view.tracking.refreshed(bind, counters)
+    else:
+        view.tracking.changed(bind)
+
+
+def swap_view(bind, view):
+    """Refresh the view without blocking its readers, even without unique
+    index
+
+    A shadow view is created and filled with the query of the view, with a
+    copy of the indexes of the view, then the view is dropped and the shadow
+    view is renamed in its place, with the comment of the view. The readers
+    are only blocked from the drop to the end of the transaction.
+
+    .. warning::
+
+        The drop takes an ACCESS EXCLUSIVE lock on the view, held until the
+        end of the transaction of ``bind``: the caller must commit right
+        after the swap, or run it in its own short transaction, else the
+        readers of the view wait the commit.
+
+        The privileges granted on the view are not copied, and the views
+        depending on this view forbid its drop.
+
+    :param bind: registry or connection to execute the queries
+    :param view: table clause of the view
+    :exception: ViewException, if other views depend on the view
+    """
+    dependents = get_dependent_views(bind, [view.name])
+    if dependents:
+        raise ViewException(
+            'The materialized view %r can not be swapped, the views %s '
+            'depend on it' % (view.name, ', '.join(
+                name for name, *_ in dependents)))
+
+    shadow = shadow_name(view.name)
+    indexes = get_shadow_indexes(bind, view.name)
+    bind.execute(DropMaterializedView(shadow))
+    bind.execute(CreateMaterializedView(shadow, view.definition, True))
+    for definition in indexes.values():
+        bind.execute(definition)
+
+    bind.execute(SwapMaterializedView(view.name, list(indexes),
+                                      comment=get_comment(bind, view.name)))
+
+
+def get_shadow_indexes(bind, name):
+    """Return the copy of the indexes of the view for its shadow view
+
+    :param bind: registry or connection to execute the queries
+    :param name: name of the view
+    :rtype: dict ``{index name: CREATE INDEX statement on the shadow view}``
+    """
+    return dict(bind.execute(text(
+        "SELECT name, create_index || quote_ident(name || '__shadow') || "
+        "' ON ' || quote_ident(:name || '__shadow') || "
+        "substring(definition from length("
+        "create_index || quote_ident(name) || ' ON ' || "
+        "quote_ident(schema) || '.' || quote_ident(:name)) + 1) "
+        "FROM ("
+        "SELECT i.relname AS name, n.nspname AS schema, "
+        "pg_get_indexdef(i.oid) AS definition, "
+        "CASE WHEN x.indisunique THEN 'CREATE UNIQUE INDEX ' "
+        "ELSE 'CREATE INDEX ' END AS create_index "
+        "FROM pg_index x "
+        "JOIN pg_class t ON t.oid = x.indrelid "
+        "JOIN pg_class i ON i.oid = x.indexrelid "
+        "JOIN pg_namespace n ON n.oid = t.relnamespace "
+        "WHERE t.relname = :name "
+        "AND pg_catalog.pg_table_is_visible(t.oid)"
+        ") AS indexes"
+    ), dict(name=name)).fetchall())
+
+
+def get_materialized_views(registry):
+    """Return the views of the models built by MaterializedViewFactory
+
+    :param registry: the current registry
+    :rtype: dict ``{view name: table clause of the view}``
+    """
+    return {view.name: view
+            for view in registry.loaded_views.values()
+            if isinstance(view, MaterializedView)}
+
+
+def get_view_dependencies(registry, names):
+    """Return the dependencies between the views, from the rewrite rules
+    stored in ``pg_depend``
+
+    A view depending on another one through plain views or other
+    relations also depends on it.
+
+    :param registry: the current registry
+    :param names: names of the views
+    :rtype: dict ``{view name: set of the names of the views it reads}``
+    """
+    edges = {}
+    for dependent, source in registry.execute(
+        """SELECT DISTINCT dependent.relname, source.relname
+           FROM pg_depend d
+           JOIN pg_rewrite r ON r.oid = d.objid
+           JOIN pg_class dependent ON dependent.oid = r.ev_class
+           JOIN pg_class source ON source.oid = d.refobjid
+           WHERE d.classid = 'pg_rewrite'::regclass
+           AND d.refclassid = 'pg_class'::regclass
+           AND dependent.oid <> source.oid
+           AND pg_catalog.pg_table_is_visible(dependent.oid)"""
+    ).fetchall():
+        edges.setdefault(dependent, set()).add(source)
+
+    res = {}
+    for name in names:
+        res[name] = set()
+        todo = list(edges.get(name, ()))
+        seen = set(todo)
+        while todo:
+            source = todo.pop()
+            if source in names:
+                res[name].add(source)
+                continue
+
+            for relation in edges.get(source, ()):
+                if relation not in seen:
+                    seen.add(relation)
+                    todo.append(relation)
+
+    return res
+
+
+def refresh_all_materialized_views(registry, parallel=1, concurrently=False,
+                                   wait=False):
+    """Refresh all the materialized views, in the order of their
+    dependencies
+
+    With ``parallel`` greater than 1, the independent views are refreshed at
+    the same time, each one on its own connection and in its own
+    transaction: these refreshes are committed at once, and only see the
+    committed data.
+
+    :param registry: the current registry
+    :param parallel: number of views refreshed at the same time
+    :param concurrently: if True, the readers are not blocked
+    :param wait: if True, wait the end of the refreshes of the other
+                 transactions instead of skipping their views
+    """
+    registry.flush()
+    views = get_materialized_views(registry)
+    dependencies = get_view_dependencies(registry, set(views))
+    if parallel <= 1:
+        for name in get_refresh_order(dependencies):
+            refresh_view(registry, views[name], concurrently=concurrently,
+                         wait=wait)
+    else:
+        refresh_on_connections(registry, views, dependencies,
+                               parallel=parallel, concurrently=concurrently,
+                               wait=wait)
+
+
+def refresh_on_connections(registry, views, dependencies, parallel=1,
+                           **kwargs):
+    """Refresh the views, each one on its own connection and after the
+    views it reads
+
+    :param registry: the current registry
+    :param views: dict ``{view name: table clause of the view}``
+    :param dependencies: dict ``{view name: set of the names of the views it
+                         reads}``
+    :param parallel: number of views refreshed at the same time
+    :param kwargs: options of :func:`refresh_view`
+    """
+    def refresh(name):
+        with registry.engine.connect() as connection:
+            with connection.begin():
+                refresh_view(connection, views[name], **kwargs)
+
+    with ThreadPoolExecutor(max_workers=parallel) as executor:
+        waiting = {name: set(sources) for name, sources in dependencies.items()}
+        running = {}
+        while waiting or running:
+            for name in [x for x, y in waiting.items() if not y]:
+                del waiting[name]
+                running[executor.submit(refresh, name)] = name
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                future.result()
+                for sources in waiting.values():
+                    sources.discard(name)
+
+
+def warm_up_materialized_views(registry, parallel=1, background=True):
+    """Populate the materialized views created without data
+
+    The views to populate are found in the current transaction, then they
+    are refreshed in a background thread, each one on its own connection,
+    so the installation of the bloks does not wait their queries.
+
+    :param registry: the current registry
+    :param parallel: number of views refreshed at the same time
+    :param background: False to populate the views in the current
+                       transaction
+    :rtype: the started thread, None if there is nothing to populate in
+            background
+    """
+    registry.flush()
+    views = {name: view
+             for name, view in get_materialized_views(registry).items()
+             if not is_populated(registry, view)}
+    dependencies = get_view_dependencies(registry, set(views))
+    if not background:
+        for name in get_refresh_order(dependencies):
+            refresh_view(registry, views[name], full=True)
+
+        return None
+
+    if not views:
+        return None
+
+    def warm_up():
+        try:
+            refresh_on_connections(registry, views, dependencies,
+                                   parallel=parallel, full=True)
+        except Exception:
+            logger.exception('The warm-up of the materialized views failed')
+
+    thread = Thread(target=warm_up, daemon=True,
+                    name='anyblok-materialized-view-warm-up')
+    thread.start()
+    return thread
+
+
+def get_refresh_order(dependencies):
+    """Return the names of the views, each one after the views it reads
+
+    :param dependencies: dict ``{view name: set of the names of the views it
+                         reads}``
+    :exception: ViewException if the dependencies have a cycle
+    """
+    waiting = {name: set(sources) for name, sources in dependencies.items()}
+    res = []
+    while waiting:
+        ready = sorted(name for name, sources in waiting.items()
+                       if not sources)
+        if not ready:
+            raise ViewException(
+                "Cycle in the dependencies of the materialized views %r" %
+                sorted(waiting))
+
+        for name in ready:
+            del waiting[name]
+
+        for sources in waiting.values():
+            sources.difference_update(ready)
+
+        res.extend(ready)
+
+    return res
 
 
 class MaterializedViewFactory(ViewFactory):
+    """Factory of the models mapped on a materialized view
+
+    The model defines the query of the view with the
+    ``sqlalchemy_view_declaration`` classmethod, and can also define:
+
+    * ``with_data``: False to create the view without data
+    * ``warm_up``: True to create the view without data, populated later by
+      :func:`warm_up_materialized_views`
+    * ``unpopulated_read``: read of the view before its population,
+      ``'error'`` (default), ``'wait'`` for the population during
+      ``unpopulated_timeout`` seconds (30 by default), or ``'fallback'`` to
+      run the query of the view instead
+    * ``max_staleness``: ``timedelta`` or number of seconds, the queries run
+      the query of the view when the view is stale for longer, and the view
+      is refreshed in background
+    * ``incremental_refresh``: True to refresh only the rows changed in the
+      source tables, see :mod:`anyblok_postgres.incremental`. The query
+      shapes not supported keep the full refresh
+    * ``view_indexes``: list of the tuples of column names to index, in
+      addition to the columns declared with ``index=True``
+    * ``refresh_interval`` and ``refresh_policy``: the refresh by the
+      scheduler, see :mod:`anyblok_postgres.scheduler`
+    * ``partition_key``: a materialized view by partition, see
+      :mod:`anyblok_postgres.partition`
+
+    A unique index is created on the primary keys, so the view can be
+    refreshed with ``concurrently=True``. The changes of the source tables
+    are counted, see :mod:`anyblok_postgres.staleness`.
+    """
 
     def insert_core_bases(self, bases, properties):
         bases.append(Refresh)
@@ -69,31 +1233,9 @@ class MaterializedViewFactory(ViewFactory):
         elif tablename in self.registry.loaded_views:
             view = self.registry.loaded_views[tablename]
         else:
-            if not hasattr(base, 'sqlalchemy_view_declaration'):
-                raise ViewException(
-                    "%r.'sqlalchemy_view_declaration' is required to "
-                    "define the query to apply of the view" % base)
-
-            view = table(tablename)
-
-            self.registry.loaded_views[tablename] = view
-            selectable = getattr(base, 'sqlalchemy_view_declaration')()
-
-            if isinstance(selectable, Query):
-                selectable = selectable.subquery()
-
-            for c in selectable.subquery().columns:
-                col = c._make_proxy(view)[1]
-                view._columns.replace(col)
-
-            metadata = self.registry.declarativebase.metadata
-            event.listen(metadata, 'after_create', CreateMaterializedView(
-                view, selectable, getattr(base, 'with_data', None)))
-
-        pks = [col for col in properties['loaded_columns']
-               if getattr(getattr(base, anyblok_column_prefix + col),
-                          'primary_key', False)]
+            view = self.create_view(base, properties)
 
+        pks = self.get_pks(base, properties)
         if not pks:
             raise ViewException(
                 "%r have any primary key defined" % base)
@@ -103,3 +1245,174 @@ class MaterializedViewFactory(ViewFactory):
         base.anyblok.declarativebase.registry.map_imperatively(
             base, view, primary_key=pks, properties=mapper_properties)
         setattr(base, '__view__', view)
+
+    def get_pks(self, base, properties):
+        """Return the names of the primary keys of the view"""
+        return [col for col in properties['loaded_columns']
+                if getattr(getattr(base, anyblok_column_prefix + col),
+                           'primary_key', False)]
+
+    def create_view(self, base, properties):
+        """Return the table clause of the view, and declare its creation
+
+        :param base: Model cls
+        :param properties: properties of the model
+        :exception: ViewException
+        """
+        tablename = base.__tablename__
+        if not hasattr(base, 'sqlalchemy_view_declaration'):
+            raise ViewException(
+                "%r.'sqlalchemy_view_declaration' is required to "
+                "define the query to apply of the view" % base)
+
+        view = MaterializedView(tablename)
+        self.set_refresh_options(base, view)
+        self.registry.loaded_views[tablename] = view
+        selectable = getattr(base, 'sqlalchemy_view_declaration')()
+
+        if isinstance(selectable, Query):
+            selectable = selectable.subquery()
+
+        view.definition = selectable
+        view.fallback = selectable.subquery()
+        for c in view.fallback.columns:
+            col = c._make_proxy(view)[1]
+            view._columns.replace(col)
+
+        self.set_incremental_refresh(base, view, properties)
+        self.set_partitioning(base, view)
+        view.tracking = ChangeTracking.from_selectable(tablename, selectable)
+        view.ddl = self.get_view_ddl(base, view, properties)
+        event.listen(self.registry.declarativebase.metadata, 'after_create',
+                     view.ddl)
+
+        return view
+
+    def set_incremental_refresh(self, base, view, properties):
+        """Set the incremental refresh of the view, if the model asks it"""
+        if not getattr(base, 'incremental_refresh', False):
+            return
+
+        view.incremental = IncrementalRefresh.from_selectable(
+            view.name, view.definition, self.get_pks(base, properties))
+        if view.incremental is None:
+            logger.warning(
+                "The query of the view %r is not supported by the "
+                "incremental refresh, the full refresh is used", view.name)
+
+    def set_partitioning(self, base, view):
+        """Set the partitions of the view, if the model declares them
+
+        :exception: ViewException
+        """
+        key = getattr(base, 'partition_key', None)
+        if key is None:
+            return
+
+        if view.incremental is not None:
+            raise ViewException(
+                "%r can not be both partitioned and incrementally "
+                "refreshed" % base)
+
+        if not hasattr(base, 'sqlalchemy_view_partitions'):
+            raise ViewException(
+                "%r.'sqlalchemy_view_partitions' is required to define the "
+                "partitions of the view" % base)
+
+        view.partitioning = Partitioning(
+            view.name, view.definition, key,
+            base.sqlalchemy_view_partitions())
+
+    def get_ddl(self, base, view, properties):
+        """Return the DDL elements to create the view
+
+        :param base: Model cls
+        :param view: table clause of the view
+        :param properties: properties of the model
+        """
+        with_data = getattr(base, 'with_data', None)
+        if getattr(base, 'warm_up', False):
+            with_data = False
+
+        res = view.tracking.get_ddl()
+        if view.incremental is not None:
+            res.extend(view.incremental.get_ddl(with_data=with_data))
+            res.extend(self.get_indexes(base, view, properties))
+        elif view.partitioning is not None:
+            partitions = view.partitioning.get_partition_selectables()
+            for name, selectable in partitions.items():
+                res.append(CreateMaterializedView(name, selectable, with_data))
+                res.extend(self.get_indexes(base, table(name), properties))
+
+            res.append(CreateView(
+                view, view.partitioning.get_union(view.c.keys()),
+                or_replace=True))
+        else:
+            res.append(CreateMaterializedView(
+                view, view.definition, with_data))
+            res.extend(self.get_indexes(base, view, properties))
+
+        res.append(view.tracking.get_init_ddl(with_data=with_data))
+        return res
+
+    def get_view_ddl(self, base, view, properties):
+        """Return the :class:`ViewDDL` creating the view"""
+        return ViewDDL(view, self.get_relation_kind(view),
+                       self.get_ddl(base, view, properties),
+                       self.registry.engine.dialect)
+
+    def get_relation_kind(self, view):
+        """Return the kind of the relation of the view, for its comment"""
+        if view.incremental is not None:
+            return 'TABLE'
+
+        if view.partitioning is not None:
+            return 'VIEW'
+
+        return 'MATERIALIZED VIEW'
+
+    def set_refresh_options(self, base, view):
+        """Copy the options of the refresh from the model on the view
+
+        :exception: ViewException
+        """
+        view.refresh_interval = getattr(base, 'refresh_interval', None)
+        view.refresh_policy = getattr(base, 'refresh_policy', 'stale')
+        if view.refresh_policy not in REFRESH_POLICIES:
+            raise ViewException(
+                "%r.'refresh_policy' must be one of %r" % (
+                    base, REFRESH_POLICIES))
+
+        view.unpopulated_read = getattr(base, 'unpopulated_read', 'error')
+        view.unpopulated_timeout = getattr(base, 'unpopulated_timeout', 30)
+        view.max_staleness = getattr(base, 'max_staleness', None)
+        if view.unpopulated_read not in UNPOPULATED_READS:
+            raise ViewException(
+                "%r.'unpopulated_read' must be one of %r" % (
+                    base, UNPOPULATED_READS))
+
+    def get_indexes(self, base, view, properties):
+        """Return the DDL elements of the indexes of the view
+
+        :param base: Model cls
+        :param view: table clause of the view
+        :param properties: properties of the model
+        """
+        tablename = view.name
+        res = []
+        pks = self.get_pks(base, properties)
+        if pks:
+            res.append(CreateMaterializedViewIndex(
+                index_name(tablename, 'pk', unique=True), view, pks,
+                unique=True))
+
+        indexes = [(col,) for col in properties['loaded_columns']
+                   if getattr(getattr(base, anyblok_column_prefix + col),
+                              'index', False)]
+        indexes.extend(tuple(index) for index in getattr(
+            base, 'view_indexes', ()))
+        for columns in indexes:
+            res.append(CreateMaterializedViewIndex(
+                index_name(tablename, '_'.join(columns)), view, columns))
+
+        return res
@@ -0,0 +1,186 @@
+# This file is a part of the AnyBlok / postgres api project
+#
+#    Copyright (C) 2026 Jean-Sebastien SUZANNE <js.suzanne@gmail.com>
+#
+# This Source Code Form is subject to the terms of the Mozilla Public License,
+# v. 2.0. If a copy of the MPL was not distributed with this file,You can
+# obtain one at http://mozilla.org/MPL/2.0/.
+"""Partitioned materialized views
+
+A model declaring ``partition_key``, the name of one column of the view, and
+the ``sqlalchemy_view_partitions`` classmethod is stored in one materialized
+view per partition::
+
+    @Declarations.register(Declarations.Model,
+                           factory=MaterializedViewFactory)
+    class TestView:
+        partition_key = 'date'
+        code = String(primary_key=True)
+        date = Date(primary_key=True)
+        val = Integer()
+
+        @classmethod
+        def sqlalchemy_view_declaration(cls):
+            ...
+
+        @classmethod
+        def sqlalchemy_view_partitions(cls):
+            return {
+                '2018_01': (date(2018, 1, 1), date(2018, 2, 1)),
+                '2018_02': (date(2018, 2, 1), date(2018, 3, 1)),
+            }
+
+Each partition is a half open interval ``[lower, upper)`` of the key, None
+for an unbounded side, and the intervals must not overlap. The rows outside
+of these intervals, or with a NULL key, are stored in the ``default``
+partition. The materialized view of the partition ``2018_01`` is named
+``testview__2018_01``, and the model is mapped on the plain view
+``testview``, the ``UNION ALL`` of the partitions.
+
+The branches of the ``UNION ALL`` repeat the interval of their partition, so
+PostgreSQL skips the partitions excluded by the conditions on the key when
+``constraint_exclusion`` is ``on``. With the default value, ``partition``,
+these partitions are still scanned: an index on the key, as the unique index
+of the primary keys if the key is the first one, keeps these scans cheap.
+
+The partitions are refreshed independently::
+
+    registry.TestView.refresh_materialized_view(partitions=['2018_02'])
+"""
+from itertools import combinations
+from sqlalchemy import and_, or_, not_, cast, literal, union_all
+from sqlalchemy.sql import select, table, column
+from anyblok.model.exceptions import ViewException
+
+DEFAULT_PARTITION = 'default'
+
+
+def partition_name(name, partition):
+    return '%s__%s' % (name, partition)
+
+
+def is_before(lower, upper):
+    """Return True if the lower bound is before the upper bound, None being
+    unbounded"""
+    return lower is None or upper is None or lower < upper
+
+
+class Partitioning:
+    """Partitions of one view
+
+    :param name: name of the view
+    :param selectable: query of the view
+    :param key: name of the column of the partition key
+    :param partitions: dict ``{partition: (lower, upper)}``
+    """
+
+    def __init__(self, name, selectable, key, partitions):
+        if key not in selectable.selected_columns:
+            raise ViewException(
+                "The partition key %r is not a column of the view %r" % (
+                    key, name))
+
+        if DEFAULT_PARTITION in partitions:
+            raise ViewException(
+                "%r is the name of the default partition of the view %r" % (
+                    DEFAULT_PARTITION, name))
+
+        self.name = name
+        self.selectable = selectable
+        self.key = key
+        self.type = selectable.selected_columns[key].type
+        self.partitions = dict(partitions)
+        self.check_intervals()
+
+    def check_intervals(self):
+        """Check that the intervals of the partitions are not empty and do
+        not overlap, a row belonging to one partition at most
+
+        :exception: ViewException
+        """
+        for partition, (lower, upper) in sorted(self.partitions.items()):
+            if lower is not None and upper is not None and lower >= upper:
+                raise ViewException(
+                    "The interval [%r, %r) of the partition %r of the view "
+                    "%r is empty" % (lower, upper, partition, self.name))
+
+        for (partition1, (lower1, upper1)), (partition2, (lower2, upper2)) in (
+                combinations(sorted(self.partitions.items()), 2)):
+            if is_before(lower1, upper2) and is_before(lower2, upper1):
+                raise ViewException(
+                    "The partitions %r and %r of the view %r overlap" % (
+                        partition1, partition2, self.name))
+
+    def get_names(self):
+        """Return the names of the materialized views of the partitions
+
+        :rtype: dict ``{partition: name of its materialized view}``
+        """
+        res = {partition: partition_name(self.name, partition)
+               for partition in self.partitions}
+        res[DEFAULT_PARTITION] = partition_name(self.name, DEFAULT_PARTITION)
+        return res
+
+    def get_condition(self, key, partition):
+        """Return the condition on the key of the rows of the partition"""
+        if partition == DEFAULT_PARTITION:
+            conditions = [self.get_condition(key, x) for x in self.partitions]
+            return or_(key.is_(None), not_(or_(*conditions)))
+
+        lower, upper = self.partitions[partition]
+        conditions = []
+        if lower is not None:
+            conditions.append(key >= self.bound(lower))
+
+        if upper is not None:
+            conditions.append(key < self.bound(upper))
+
+        return and_(key.isnot(None), *conditions)
+
+    def bound(self, value):
+        # the literal of the bound is rendered in the DDL, as a string cast
+        # on the type of the key, because the dates can not be rendered
+        return cast(literal(str(value)), self.type)
+
+    def get_partition_selectables(self):
+        """Return the query of each partition
+
+        :rtype: dict ``{name of the materialized view: query}``
+        """
+        query = self.selectable.subquery('query')
+        return {
+            name: select(query).where(
+                self.get_condition(query.c[self.key], partition))
+            for partition, name in self.get_names().items()
+        }
+
+    def get_union(self, columns):
+        """Return the query of the view, the union of its partitions
+
+        :param columns: names of the columns of the view
+        """
+        queries = []
+        for partition, name in self.get_names().items():
+            relation = table(name, *[column(x) for x in columns])
+            key = relation.c[self.key]
+            queries.append(select(relation).where(
+                self.get_condition(key, partition)))
+
+        return union_all(*queries)
+
+    def get_refreshed_names(self, partitions=None):
+        """Return the names of the materialized views to refresh
+
+        :param partitions: names of the partitions, all of them by default
+        :exception: ViewException
+        """
+        names = self.get_names()
+        if partitions is None:
+            return list(names.values())
+
+        unknown = [x for x in partitions if x not in names]
+        if unknown:
+            raise ViewException("Unknown partitions %r of the view %r" % (
+                unknown, self.name))
+
+        return [names[x] for x in partitions]
@@ -0,0 +1,369 @@
+# This file is a part of the AnyBlok / postgres api project
+#
+#    Copyright (C) 2026 Jean-Sebastien SUZANNE <js.suzanne@gmail.com>
+#
+# This Source Code Form is subject to the terms of the Mozilla Public License,
+# v. 2.0. If a copy of the MPL was not distributed with this file,You can
+# obtain one at http://mozilla.org/MPL/2.0/.
+"""Profiling of the operations of the columns and of the views
+
+The operations run out of the queries of SQLAlchemy are measured in
+:class:`Span`, with their duration and their attributes:
+
+* ``large_object.read``, ``large_object.write`` and ``large_object.unlink``:
+  ``model``, ``field``, ``bytes`` and ``round_trips``, the estimated number
+  of calls of the large object functions of libpq, from the operations
+  run, not counted
+* ``jsonb.encode`` and ``jsonb.decode``: ``bytes`` of the JSON document
+* ``view.refresh``: ``view`` and ``mode`` of the refresh
+* ``sql``: ``round_trips``, the statements executed by the registry, only
+  in the reports
+
+The hooks added to :data:`profiler` are called with each span::
+
+    from anyblok_postgres.profiling import profiler, log_span
+
+    profiler.add_hook(log_span, registry=registry)
+
+:class:`OpenTelemetryExporter` is a hook sending the spans to OpenTelemetry,
+if installed. A report sums the spans of the current thread, for example
+for one request::
+
+    with profiler.report(registry) as report:
+        ...
+
+    print(report.format())
+
+Without hook nor report, the operations are not measured.
+
+.. note::
+
+    The JSONB documents are decoded by psycopg2, the decoding is measured
+    on the connections of the registries given to :meth:`Profiler.add_hook`
+    or :meth:`Profiler.report`, from their next statement, and their
+    previous decoders are restored once nothing is profiled.
+"""
+from contextlib import contextmanager
+from json import loads
+from logging import getLogger
+from threading import Lock, local
+from weakref import WeakKeyDictionary
+from time import perf_counter, time_ns
+from sqlalchemy import event
+
+try:
+    from psycopg2 import extras as psycopg2_extras
+except ImportError:  # pragma: no cover
+    psycopg2_extras = None
+
+try:
+    from opentelemetry import trace
+except ImportError:  # pragma: no cover
+    trace = None
+
+logger = getLogger(__name__)
+
+
+class Span:
+    """One measured operation
+
+    * ``name``: name of the operation
+    * ``attributes``: dict of the attributes of the operation
+    * ``start_time``: start of the operation, in nanoseconds since the epoch
+    * ``duration``: duration of the operation in seconds
+    """
+
+    def __init__(self, name, attributes):
+        self.name = name
+        self.attributes = attributes
+        self.start_time = time_ns()
+        self.duration = None
+
+    @property
+    def end_time(self):
+        return self.start_time + int(self.duration * 1e9)
+
+    def to_dict(self):
+        return dict(name=self.name, start_time=self.start_time,
+                    end_time=self.end_time, duration=self.duration,
+                    attributes=dict(self.attributes))
+
+
+class ProfileReport:
+    """Sum of the spans of one thread
+
+    :param registry: registry whose statements are counted in ``sql`` spans,
+                     optional
+    """
+
+    def __init__(self, registry=None):
+        self.registry = registry
+        self.spans = []
+
+    def start(self):
+        if self.registry is not None:
+            event.listen(self.registry.bind, 'before_cursor_execute',
+                         self.before_execute)
+            event.listen(self.registry.bind, 'after_cursor_execute',
+                         self.after_execute)
+
+    def stop(self):
+        if self.registry is not None:
+            event.remove(self.registry.bind, 'before_cursor_execute',
+                         self.before_execute)
+            event.remove(self.registry.bind, 'after_cursor_execute',
+                         self.after_execute)
+
+    def before_execute(self, conn, cursor, statement, parameters, context,
+                       executemany):
+        context.anyblok_profile_start = perf_counter()
+
+    def after_execute(self, conn, cursor, statement, parameters, context,
+                      executemany):
+        start = getattr(context, 'anyblok_profile_start', None)
+        if start is None or self not in profiler.get_reports():
+            return
+
+        span = Span('sql', dict(round_trips=1))
+        span.duration = perf_counter() - start
+        self.spans.append(span)
+
+    def add_span(self, span):
+        self.spans.append(span)
+
+    def summary(self):
+        """Return the sums of the spans
+
+        :rtype: dict ``{(name, model, field): dict(count, duration, bytes,
+                round_trips)}``
+        """
+        res = {}
+        for span in self.spans:
+            key = (span.name, span.attributes.get('model'),
+                   span.attributes.get('field'))
+            total = res.setdefault(key, dict(count=0, duration=0., bytes=0,
+                                             round_trips=0))
+            total['count'] += 1
+            total['duration'] += span.duration
+            total['bytes'] += span.attributes.get('bytes') or 0
+            total['round_trips'] += span.attributes.get('round_trips') or 0
+
+        return res
+
+    def format(self):
+        """Return the sums of the spans as a text table"""
+        lines = ['%-20s %-30s %-20s %8s %12s %12s %12s' % (
+            'operation', 'model', 'field', 'count', 'time', 'bytes',
+            'round trips')]
+        for (name, model, field), total in sorted(
+                self.summary().items(), key=lambda x: -x[1]['duration']):
+            lines.append('%-20s %-30s %-20s %8d %12.3f %12d %12d' % (
+                name, model or '', field or '', total['count'],
+                total['duration'], total['bytes'], total['round_trips']))
+
+        return '\n'.join(lines)
+
+
+class Profiler:
+    """Hooks and reports called with the spans"""
+
+    def __init__(self):
+        self.hooks = []
+        self.local = local()
+        self.hook_registries = {}
+        self.jsonb_lock = Lock()
+        self.jsonb_decoder_users = 0
+        self.jsonb_listeners = set()
+        self.jsonb_connections = WeakKeyDictionary()
+
+    @property
+    def enabled(self):
+        """True if the operations must be measured"""
+        return bool(self.hooks) or bool(self.get_reports())
+
+    def get_reports(self):
+        """Return the active reports of the current thread"""
+        return getattr(self.local, 'reports', ())
+
+    def add_hook(self, hook, registry=None):
+        """Add a callable called with each span
+
+        :param registry: registry whose JSONB decoding is measured, optional
+        """
+        if hook in self.hooks:
+            return
+
+        self.hooks.append(hook)
+        self.hook_registries[hook] = registry
+        if registry is not None:
+            self.install_jsonb_decoder(registry)
+
+    def remove_hook(self, hook):
+        if hook in self.hooks:
+            self.hooks.remove(hook)
+            if self.hook_registries.pop(hook) is not None:
+                self.uninstall_jsonb_decoder()
+
+    @contextmanager
+    def report(self, registry=None):
+        """Sum the spans of the current thread run in the context
+
+        :param registry: registry whose statements are counted, optional
+        :rtype: :class:`ProfileReport`
+        """
+        report = ProfileReport(registry=registry)
+        self.local.reports = self.get_reports() + (report,)
+        if registry is not None:
+            self.install_jsonb_decoder(registry)
+
+        report.start()
+        try:
+            yield report
+        finally:
+            report.stop()
+            self.local.reports = tuple(
+                x for x in self.get_reports() if x is not report)
+            if registry is not None:
+                self.uninstall_jsonb_decoder()
+
+    @contextmanager
+    def span(self, name, **attributes):
+        """Measure the operation run in the context
+
+        :param name: name of the operation
+        :param attributes: attributes of the span, completed in the context
+        :rtype: the :class:`Span`, None if nothing is profiled
+        """
+        if not self.enabled:
+            yield None
+            return
+
+        span = Span(name, attributes)
+        start = perf_counter()
+        try:
+            yield span
+        finally:
+            span.duration = perf_counter() - start
+            self.send(span)
+
+    def send(self, span):
+        for report in self.get_reports():
+            report.add_span(span)
+
+        for hook in self.hooks:
+            try:
+                hook(span)
+            except Exception:
+                logger.exception('The profiling hook %r failed', hook)
+
+    def install_jsonb_decoder(self, registry):
+        """Decode the JSONB documents with :func:`decode_jsonb` on the
+        connections of the registry, at their next checkout out of the pool
+        or their next statement
+
+        No connection is opened: the connection already used by the
+        registry is only changed at its next statement.
+        """
+        if psycopg2_extras is None:  # pragma: no cover
+            return
+
+        with self.jsonb_lock:
+            self.jsonb_decoder_users += 1
+            for target, identifier, listener in (
+                (registry.bind.engine, 'checkout', self.checkout_connection),
+                (registry.bind, 'before_cursor_execute',
+                 self.before_cursor_execute),
+            ):
+                if (target, identifier, listener) not in self.jsonb_listeners:
+                    event.listen(target, identifier, listener)
+                    self.jsonb_listeners.add((target, identifier, listener))
+
+    def uninstall_jsonb_decoder(self):
+        """Restore the previous decoders on the connections, once no hook
+        nor report installed :func:`decode_jsonb`"""
+        if psycopg2_extras is None:  # pragma: no cover
+            return
+
+        with self.jsonb_lock:
+            self.jsonb_decoder_users -= 1
+            if self.jsonb_decoder_users:
+                return
+
+            for target, identifier, listener in self.jsonb_listeners:
+                event.remove(target, identifier, listener)
+
+            self.jsonb_listeners.clear()
+            for dbapi_connection, previous in list(
+                    self.jsonb_connections.items()):
+                for oid, typecaster in previous.items():
+                    if typecaster is None:
+                        dbapi_connection.string_types.pop(oid, None)
+                    else:
+                        dbapi_connection.string_types[oid] = typecaster
+
+            self.jsonb_connections.clear()
+
+    def checkout_connection(self, dbapi_connection, connection_record,
+                            connection_proxy):
+        self.register_jsonb_decoder(dbapi_connection)
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters,
+                              context, executemany):
+        self.register_jsonb_decoder(cursor.connection)
+
+    def register_jsonb_decoder(self, dbapi_connection):
+        """Register :func:`decode_jsonb` on the connection, saving the
+        decoders it replaces"""
+        with self.jsonb_lock:
+            if (not self.jsonb_decoder_users or
+                    dbapi_connection in self.jsonb_connections):
+                return
+
+            string_types = dict(dbapi_connection.string_types)
+            typecasters = psycopg2_extras.register_default_jsonb(
+                conn_or_curs=dbapi_connection, loads=decode_jsonb)
+            self.jsonb_connections[dbapi_connection] = {
+                oid: string_types.get(oid)
+                for typecaster in typecasters for oid in typecaster.values}
+
+
+profiler = Profiler()
+
+
+def decode_jsonb(document):
+    """Decode the JSONB document, measured in a ``jsonb.decode`` span"""
+    if not profiler.enabled:
+        return loads(document)
+
+    with profiler.span('jsonb.decode', bytes=len(document)):
+        return loads(document)
+
+
+def log_span(span):
+    """Hook writing the span in the logs"""
+    logger.info('%s: %.6fs %r', span.name, span.duration, span.attributes)
+
+
+class OpenTelemetryExporter:
+    """Hook sending the spans to an OpenTelemetry tracer
+
+    :param tracer: the tracer, by default the one of this module from the
+                   tracer provider of OpenTelemetry
+    """
+
+    def __init__(self, tracer=None):
+        if tracer is None:
+            if trace is None:
+                raise ImportError(
+                    'opentelemetry-api is required without tracer')
+
+            tracer = trace.get_tracer(__name__)
+
+        self.tracer = tracer
+
+    def __call__(self, span):
+        otel_span = self.tracer.start_span(
+            span.name, start_time=span.start_time,
+            attributes={key: value for key, value in span.attributes.items()
+                        if value is not None})
+        otel_span.end(end_time=span.end_time)
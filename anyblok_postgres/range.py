@@ -0,0 +1,495 @@
+# This file is a part of the AnyBlok / Postgres api project
+#
+#    Copyright (C) 2026 Jean-Sebastien SUZANNE <js.suzanne@gmail.com>
+#
+# This Source Code Form is subject to the terms of the Mozilla Public License,
+# v. 2.0. If a copy of the MPL was not distributed with this file,You can
+# obtain one at http://mozilla.org/MPL/2.0/.
+"""Driver independent range values
+
+The range columns (:class:`~anyblok_postgres.column.Int4Range`, ...) load
+their values as :class:`Range` instances and accept them as input, so the
+interval math can be done without knowing which DBAPI driver is used::
+
+    from anyblok_postgres.range import Range, merge_ranges
+
+    r = Range(1, 10)
+    r.contains(5)                       # True
+    r.overlaps(Range(8, 12, '[]'))      # True
+    r.intersection(Range(8, 12))        # Range(8, 10, '[)')
+    merge_ranges([Range(1, 3), Range(3, 5), Range(7, 8)])
+    # [Range(1, 5, '[)'), Range(7, 8, '[)')]
+
+The batch utilities :func:`find_overlaps` and :func:`merge_ranges` use a
+sorted sweep, vectorized with NumPy when it is installed and the bounds are
+plain numbers.
+"""
+from functools import total_ordering
+from heapq import heappush, heappop
+from importlib import import_module
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+
+BOUNDS = ('[)', '(]', '()', '[]')
+# float64 represents exactly every integer up to this value
+MAX_EXACT_INTEGER = 1 << 53
+
+
+@total_ordering
+class Range:
+    """Immutable PostgreSQL range value
+
+    :param lower: lower bound, ``None`` means unbounded
+    :param upper: upper bound, ``None`` means unbounded
+    :param bounds: one of ``'[)'``, ``'(]'``, ``'()'``, ``'[]'``
+    :param empty: if True, the range is empty
+
+    The attributes mirror the DBAPI range objects (``lower``, ``upper``,
+    ``lower_inc``, ``upper_inc``, ``lower_inf``, ``upper_inf``,
+    ``isempty``). The ordering is the one of PostgreSQL: empty ranges
+    first, then by lower bound, then by upper bound.
+
+    .. note::
+
+        Like PostgreSQL, the discrete ranges must be canonical to be
+        compared: the database always returns them with ``'[)'`` bounds.
+    """
+
+    __slots__ = ('lower', 'upper', 'lower_inc', 'upper_inc', 'isempty')
+
+    def __init__(self, lower=None, upper=None, bounds='[)', empty=False):
+        if bounds not in BOUNDS:
+            raise ValueError("Invalid range bounds %r" % bounds)
+
+        if empty:
+            lower = upper = None
+
+        setter = object.__setattr__
+        setter(self, 'lower', lower)
+        setter(self, 'upper', upper)
+        setter(self, 'lower_inc', not empty and lower is not None and
+               bounds[0] == '[')
+        setter(self, 'upper_inc', not empty and upper is not None and
+               bounds[1] == ']')
+        setter(self, 'isempty', bool(empty))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("%r is immutable" % self.__class__.__name__)
+
+    def __delattr__(self, name):
+        raise AttributeError("%r is immutable" % self.__class__.__name__)
+
+    def __reduce__(self):
+        return (self.__class__, (self.lower, self.upper, self.bounds,
+                                 self.isempty))
+
+    @property
+    def bounds(self):
+        """Bounds flags, as given to the constructor"""
+        return ('[' if self.lower_inc else '(') + (
+            ']' if self.upper_inc else ')')
+
+    @property
+    def lower_inf(self):
+        """True if the range has no lower bound"""
+        return not self.isempty and self.lower is None
+
+    @property
+    def upper_inf(self):
+        """True if the range has no upper bound"""
+        return not self.isempty and self.upper is None
+
+    @classmethod
+    def from_driver(cls, value):
+        """Return a Range from a DBAPI range object
+
+        :param value: range object loaded by the driver, such as
+                      ``psycopg2.extras.NumericRange``
+        :rtype: :class:`Range`
+        :exception: TypeError
+        """
+        if isinstance(value, cls) or value is None:
+            return value
+
+        if not hasattr(value, 'isempty'):
+            raise TypeError('%r is not a range object of the DBAPI '
+                            'driver' % (value,))
+
+        if value.isempty:
+            return cls(empty=True)
+
+        return cls(value.lower, value.upper,
+                   ('[' if value.lower_inc else '(') +
+                   (']' if value.upper_inc else ')'))
+
+    def to_driver(self, driver_range):
+        """Return the DBAPI range object of this value
+
+        :param driver_range: DBAPI range class, such as
+                             ``psycopg2.extras.NumericRange``
+        """
+        if self.isempty:
+            return driver_range(empty=True)
+
+        return driver_range(self.lower, self.upper, self.bounds)
+
+    def __repr__(self):
+        if self.isempty:
+            return '%s(empty=True)' % self.__class__.__name__
+
+        return '%s(%r, %r, %r)' % (self.__class__.__name__, self.lower,
+                                   self.upper, self.bounds)
+
+    def __str__(self):
+        if self.isempty:
+            return 'empty'
+
+        return '%s%s,%s%s' % (
+            '[' if self.lower_inc else '(',
+            '' if self.lower is None else self.lower,
+            '' if self.upper is None else self.upper,
+            ']' if self.upper_inc else ')')
+
+    def __bool__(self):
+        return not self.isempty
+
+    def __hash__(self):
+        return hash((self.lower, self.upper, self.lower_inc, self.upper_inc,
+                     self.isempty))
+
+    def __eq__(self, other):
+        if not isinstance(other, Range):
+            return NotImplemented
+
+        return (self.isempty == other.isempty and
+                self.lower == other.lower and
+                self.upper == other.upper and
+                self.lower_inc == other.lower_inc and
+                self.upper_inc == other.upper_inc)
+
+    def __lt__(self, other):
+        if not isinstance(other, Range):
+            return NotImplemented
+
+        if self.isempty or other.isempty:
+            return self.isempty and not other.isempty
+
+        if lower_key(self) != lower_key(other):
+            return lower_key(self) < lower_key(other)
+
+        return upper_key(self) < upper_key(other)
+
+    def __contains__(self, value):
+        return self.contains(value)
+
+    def contains(self, value):
+        """Return True if value, an element or a Range, is in this range"""
+        if isinstance(value, Range):
+            return self._contains_range(value)
+
+        if self.isempty:
+            return False
+
+        lower = self.lower
+        if lower is not None:
+            if value < lower or (value == lower and not self.lower_inc):
+                return False
+
+        upper = self.upper
+        if upper is not None:
+            if value > upper or (value == upper and not self.upper_inc):
+                return False
+
+        return True
+
+    def _contains_range(self, other):
+        if other.isempty:
+            return True
+
+        if self.isempty:
+            return False
+
+        if self.lower is not None:
+            if other.lower is None or other.lower < self.lower:
+                return False
+
+            if (other.lower == self.lower and other.lower_inc and
+                    not self.lower_inc):
+                return False
+
+        if self.upper is not None:
+            if other.upper is None or other.upper > self.upper:
+                return False
+
+            if (other.upper == self.upper and other.upper_inc and
+                    not self.upper_inc):
+                return False
+
+        return True
+
+    def overlaps(self, other):
+        """Return True if both ranges have at least one element in common"""
+        if self.isempty or other.isempty:
+            return False
+
+        return starts_before_end(self, other) and starts_before_end(
+            other, self)
+
+    def intersection(self, other):
+        """Return the range of the elements in both ranges
+
+        An empty range is returned if they do not overlap.
+        """
+        if not self.overlaps(other):
+            return self.__class__(empty=True)
+
+        if self.lower is None or (other.lower is not None and (
+                other.lower > self.lower or (
+                    other.lower == self.lower and not other.lower_inc))):
+            lower, lower_inc = other.lower, other.lower_inc
+        else:
+            lower, lower_inc = self.lower, self.lower_inc
+
+        if self.upper is None or (other.upper is not None and (
+                other.upper < self.upper or (
+                    other.upper == self.upper and not other.upper_inc))):
+            upper, upper_inc = other.upper, other.upper_inc
+        else:
+            upper, upper_inc = self.upper, self.upper_inc
+
+        return self.__class__(
+            lower, upper,
+            ('[' if lower_inc else '(') + (']' if upper_inc else ')'))
+
+
+def lower_key(value):
+    """Sort key of the lower bound of a non empty range
+
+    unbounded first, and inclusive before exclusive for the same value
+    """
+    if value.lower is None:
+        return (0,)
+
+    return (1, value.lower, not value.lower_inc)
+
+
+def upper_key(value):
+    """Sort key of the upper bound of a non empty range
+
+    unbounded last, and exclusive before inclusive for the same value
+    """
+    if value.upper is None:
+        return (1,)
+
+    return (0, value.upper, value.upper_inc)
+
+
+def starts_before_end(first, second):
+    """Return True if the lower bound of ``second`` is before the upper
+    bound of ``first``, both ranges being non empty"""
+    if first.upper is None or second.lower is None:
+        return True
+
+    if second.lower < first.upper:
+        return True
+
+    return (second.lower == first.upper and second.lower_inc and
+            first.upper_inc)
+
+
+def get_driver_range(dbapi, name):
+    """Return the range class ``name`` of the DBAPI driver
+
+    Only the drivers with the range classes of ``psycopg2.extras``,
+    psycopg2 and psycopg2cffi, are supported.
+
+    :param dbapi: DBAPI module of the dialect (psycopg2, psycopg2cffi, ...)
+    :param name: ``NumericRange``, ``DateRange``, ``DateTimeRange`` or
+                 ``DateTimeTZRange``
+    :exception: NotImplementedError
+    """
+    try:
+        return getattr(import_module(dbapi.__name__ + '.extras'), name)
+    except (ImportError, AttributeError):
+        raise NotImplementedError(
+            'The range values can not be bound with the DBAPI driver %r, '
+            'only the drivers with the range classes of psycopg2.extras '
+            '(psycopg2, psycopg2cffi) are supported' % dbapi.__name__)
+
+
+def use_numpy_for(ranges):
+    """Return True if the NumPy path can handle these (non empty) ranges
+
+    Only the plain numbers are vectorized; the integers must be exactly
+    represented as float64.
+    """
+    if numpy is None or not ranges:
+        return False
+
+    for value in ranges:
+        for bound in (value.lower, value.upper):
+            if bound is None or type(bound) is float:
+                continue
+
+            if type(bound) is not int or abs(bound) > MAX_EXACT_INTEGER:
+                return False
+
+    return True
+
+
+def ranges_to_arrays(ranges):
+    inf = float('inf')
+    lower = numpy.array([-inf if r.lower is None else r.lower
+                         for r in ranges], dtype=numpy.float64)
+    upper = numpy.array([inf if r.upper is None else r.upper
+                         for r in ranges], dtype=numpy.float64)
+    lower_inc = numpy.array([r.lower_inc for r in ranges], dtype=bool)
+    upper_inc = numpy.array([r.upper_inc for r in ranges], dtype=bool)
+    # lexsort uses the last key as the primary one
+    order = numpy.lexsort((~lower_inc, lower))
+    return (lower[order], upper[order], lower_inc[order], upper_inc[order],
+            order)
+
+
+def find_overlaps(ranges, use_numpy=None):
+    """Return the pairs of indexes of the overlapping ranges
+
+    :param ranges: list of :class:`Range`
+    :param use_numpy: force (True) or forbid (False) the NumPy path, by
+                      default it is used when possible
+    :rtype: sorted list of ``(i, j)`` tuples, with ``i < j``
+    """
+    indexes = [i for i, r in enumerate(ranges) if not r.isempty]
+    values = [ranges[i] for i in indexes]
+    if use_numpy is None:
+        use_numpy = use_numpy_for(values)
+
+    if use_numpy:
+        pairs = _find_overlaps_numpy(values)
+    else:
+        pairs = _find_overlaps_python(values)
+
+    return sorted(
+        (min(indexes[i], indexes[j]), max(indexes[i], indexes[j]))
+        for i, j in pairs)
+
+
+def _find_overlaps_python(ranges):
+    order = sorted(range(len(ranges)), key=lambda i: lower_key(ranges[i]))
+    actives = []
+    pairs = []
+    for position, index in enumerate(order):
+        current = ranges[index]
+        # the active ranges start before the current one, those which end
+        # before it starts can't overlap any of the following ranges
+        while actives and not starts_before_end(
+                ranges[actives[0][2]], current):
+            heappop(actives)
+
+        pairs.extend((active[2], index) for active in actives)
+        heappush(actives, (upper_key(current), position, index))
+
+    return pairs
+
+
+def _find_overlaps_numpy(ranges):
+    lower, upper, lower_inc, upper_inc, order = ranges_to_arrays(ranges)
+    # sorted by lower bound, the ranges overlapping the range ``i`` and
+    # starting after it are contiguous: from i + 1 to the last one starting
+    # before its end
+    end = numpy.searchsorted(lower, upper, side='left')
+    end_same = numpy.searchsorted(lower, upper, side='right')
+    inc_count = numpy.concatenate(([0], numpy.cumsum(lower_inc)))
+    # for the same lower value the inclusive bounds are sorted first
+    end = end + numpy.where(upper_inc, inc_count[end_same] - inc_count[end],
+                            0)
+    start = numpy.arange(len(ranges)) + 1
+    counts = numpy.maximum(end - start, 0)
+    first = numpy.repeat(numpy.arange(len(ranges)), counts)
+    offsets = numpy.arange(counts.sum()) - numpy.repeat(
+        numpy.cumsum(counts) - counts, counts)
+    second = numpy.repeat(start, counts) + offsets
+    return zip(order[first].tolist(), order[second].tolist())
+
+
+def merge_ranges(ranges, use_numpy=None):
+    """Return the union of the ranges, as sorted disjoint ranges
+
+    The overlapping and adjacent ranges are merged, the empty ones are
+    dropped.
+
+    :param ranges: list of :class:`Range`
+    :param use_numpy: force (True) or forbid (False) the NumPy path, by
+                      default it is used when possible
+    :rtype: list of :class:`Range`
+    """
+    values = [r for r in ranges if not r.isempty]
+    if use_numpy is None:
+        use_numpy = use_numpy_for(values)
+
+    if use_numpy:
+        return _merge_ranges_numpy(values)
+
+    return _merge_ranges_python(values)
+
+
+def _merge_ranges_python(ranges):
+    merged = []
+    current = None
+    for value in sorted(ranges, key=lower_key):
+        if current is None:
+            current = value
+        elif starts_before_end(current, value) or (
+            current.upper == value.lower and
+            (current.upper_inc or value.lower_inc)
+        ):
+            if upper_key(value) > upper_key(current):
+                current = Range(current.lower, value.upper,
+                                current.bounds[0] + value.bounds[1])
+        else:
+            merged.append(current)
+            current = value
+
+    if current is not None:
+        merged.append(current)
+
+    return merged
+
+
+def _merge_ranges_numpy(ranges):
+    if not ranges:
+        return []
+
+    integers = all(type(bound) is not float for r in ranges
+                   for bound in (r.lower, r.upper))
+    lower, upper, lower_inc, upper_inc, _ = ranges_to_arrays(ranges)
+    # running maximum of the upper bounds, and if it is included
+    ends = numpy.maximum.accumulate(upper)
+    at_end = (upper == ends) & upper_inc
+    changes = numpy.concatenate(([True], ends[1:] != ends[:-1]))
+    segment = numpy.cumsum(changes) - 1
+    count = numpy.cumsum(at_end)
+    before = (count - at_end)[changes]
+    ends_inc = (count - before[segment]) > 0
+    # a new range starts when it is after the previous end, and not adjacent
+    starts = numpy.concatenate(([True], (lower[1:] > ends[:-1]) | (
+        (lower[1:] == ends[:-1]) & ~lower_inc[1:] & ~ends_inc[:-1])))
+    firsts = numpy.flatnonzero(starts)
+    lasts = numpy.concatenate((firsts[1:] - 1, [len(ranges) - 1]))
+
+    def to_bound(value):
+        if numpy.isinf(value):
+            return None
+
+        return int(value) if integers else float(value)
+
+    return [
+        Range(to_bound(lower[first]), to_bound(ends[last]),
+              ('[' if lower_inc[first] else '(') +
+              (']' if ends_inc[last] else ')'))
+        for first, last in zip(firsts.tolist(), lasts.tolist())
+    ]
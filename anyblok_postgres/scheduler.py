@@ -0,0 +1,171 @@
+# This file is a part of the AnyBlok / postgres api project
+#
+#    Copyright (C) 2026 Jean-Sebastien SUZANNE <js.suzanne@gmail.com>
+#
+# This Source Code Form is subject to the terms of the Mozilla Public License,
+# v. 2.0. If a copy of the MPL was not distributed with this file,You can
+# obtain one at http://mozilla.org/MPL/2.0/.
+"""Background refresh of the materialized views
+
+The models declare when their view is refreshed::
+
+    @Declarations.register(Declarations.Model,
+                           factory=MaterializedViewFactory)
+    class TestView:
+        refresh_interval = 300  # seconds, or timedelta
+        refresh_policy = 'stale'
+
+With the ``'stale'`` policy, the default one, the view is only refreshed if
+one of its sources changed, see :mod:`anyblok_postgres.staleness`. With the
+``'always'`` policy, it is refreshed at each interval.
+
+The :class:`RefreshScheduler` thread refreshes the views on their own
+connections. Each refresh takes a transaction level advisory lock on the
+view, without waiting: when several processes or nodes run a scheduler, only
+one of them refreshes a given view, the others skip it.
+
+The refreshes requested with :meth:`RefreshScheduler.request_refresh` are
+run after the ``debounce`` delay, and the requests received meanwhile are
+merged in the same refresh.
+"""
+from datetime import timedelta
+from logging import getLogger
+from threading import Condition, Thread
+from time import monotonic
+from anyblok_postgres.materialized_view import (
+    get_materialized_views, try_refresh_view)
+
+logger = getLogger(__name__)
+
+
+def get_interval(view):
+    """Return the refresh interval of the view in seconds, or None"""
+    interval = view.refresh_interval
+    if isinstance(interval, timedelta):
+        interval = interval.total_seconds()
+
+    return interval
+
+
+class RefreshScheduler:
+    """Refresh the materialized views in a background thread
+
+    :param registry: the current registry
+    :param debounce: delay in seconds before the requested refreshes
+    :param concurrently: if True, the readers are not blocked
+    """
+
+    def __init__(self, registry, debounce=1.0, concurrently=False):
+        self.registry = registry
+        self.debounce = debounce
+        self.concurrently = concurrently
+        self.views = get_materialized_views(registry)
+        self.condition = Condition()
+        self.thread = None
+        self.stopped = False
+        self.due = {}
+        self.requested = set()
+        now = monotonic()
+        for name, view in self.views.items():
+            interval = get_interval(view)
+            if interval:
+                self.due[name] = now + interval
+
+    def request_refresh(self, name, now=None):
+        """Ask a refresh of the view after the debounce delay
+
+        :param name: name of the view
+        :param now: monotonic time of the request
+        """
+        if name not in self.views:
+            raise KeyError(name)
+
+        if now is None:
+            now = monotonic()
+
+        with self.condition:
+            if name not in self.requested:
+                self.requested.add(name)
+                self.due[name] = min(self.due.get(name, now + self.debounce),
+                                     now + self.debounce)
+                self.condition.notify()
+
+    def run_pending(self, bind=None, now=None):
+        """Refresh the views whose time is reached
+
+        :param bind: registry or connection to execute the queries, by
+                     default each refresh is committed on its own connection
+        :param now: monotonic time of the run
+        :rtype: list of the names of the refreshed views
+        """
+        if now is None:
+            now = monotonic()
+
+        with self.condition:
+            names = sorted(name for name, due in self.due.items()
+                           if due <= now)
+            for name in names:
+                self.reschedule(name, now)
+
+        return [name for name in names if self.refresh(name, bind=bind)]
+
+    def reschedule(self, name, now):
+        self.requested.discard(name)
+        interval = get_interval(self.views[name])
+        if interval:
+            self.due[name] = now + interval
+        else:
+            del self.due[name]
+
+    def refresh(self, name, bind=None):
+        view = self.views[name]
+        policy = view.refresh_policy
+        if bind is not None:
+            return try_refresh_view(bind, view, policy=policy,
+                                    concurrently=self.concurrently)
+
+        try:
+            with self.registry.engine.connect() as connection:
+                with connection.begin():
+                    return try_refresh_view(
+                        connection, view, policy=policy,
+                        concurrently=self.concurrently)
+        except Exception:
+            logger.exception('Refresh of the materialized view %r failed',
+                             name)
+            return False
+
+    def start(self):
+        """Start the background thread"""
+        self.stopped = False
+        self.thread = Thread(target=self.run, daemon=True,
+                             name='anyblok-materialized-view-refresh')
+        self.thread.start()
+
+    def stop(self, timeout=None):
+        """Stop the background thread, after the running refresh"""
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
+
+        if self.thread is not None:
+            self.thread.join(timeout)
+            self.thread = None
+
+    def run(self):
+        while True:
+            with self.condition:
+                if self.stopped:
+                    return
+
+                now = monotonic()
+                if self.due:
+                    delay = min(self.due.values()) - now
+                else:
+                    delay = None
+
+                if delay is None or delay > 0:
+                    self.condition.wait(delay)
+                    continue
+
+            self.run_pending()
@@ -0,0 +1,280 @@
+# This file is a part of the AnyBlok / postgres api project
+#
+#    Copyright (C) 2026 Jean-Sebastien SUZANNE <js.suzanne@gmail.com>
+#
+# This Source Code Form is subject to the terms of the Mozilla Public License,
+# v. 2.0. If a copy of the MPL was not distributed with this file,You can
+# obtain one at http://mozilla.org/MPL/2.0/.
+"""Staleness tracking of the materialized views
+
+Each source table of a materialized view has a change counter, a sequence
+incremented by a statement trigger on ``INSERT``, ``UPDATE``, ``DELETE`` and
+``TRUNCATE``. The counter of a materialized view is incremented by its
+refresh, so the views reading other views are tracked too.
+
+Each refresh saves the date of the refresh and the counters of the sources
+in the ``anyblok_materialized_view_state`` table: the view is stale when
+one of these counters changed since.
+
+.. note::
+
+    The sequences are not transactional: the changes rolled back, or not
+    committed yet by the other transactions, also mark the views as stale.
+    The views reading other relations than the tables and the materialized
+    views (plain views, ...) are always stale.
+"""
+from datetime import timedelta
+from json import dumps
+from sqlalchemy import text
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.schema import DDLElement, Table
+from sqlalchemy.sql import TableClause, visitors
+from anyblok_postgres.common import truncate_name
+
+
+STATE_TABLE = 'anyblok_materialized_view_state'
+COUNT_FUNCTION = 'anyblok_count_change'
+COUNT_TRIGGER = 'anyblok_change_counter'
+
+
+class CreateViewState(DDLElement):
+    """Create the state table and the function of the change triggers"""
+
+
+@compiles(CreateViewState)
+def compile_create_view_state(element, compiler, **kw):
+    return (
+        'CREATE TABLE IF NOT EXISTS %(table)s ('
+        'name VARCHAR(64) PRIMARY KEY, '
+        'refreshed_at TIMESTAMP WITH TIME ZONE, '
+        'counters JSONB);'
+        'CREATE OR REPLACE FUNCTION %(function)s() RETURNS trigger AS $$\n'
+        'BEGIN\n'
+        '    PERFORM nextval(TG_ARGV[0]::regclass);\n'
+        '    RETURN NULL;\n'
+        'END;\n'
+        '$$ LANGUAGE plpgsql'
+    ) % dict(table=STATE_TABLE, function=COUNT_FUNCTION)
+
+
+class CreateChangeCounter(DDLElement):
+    """Create the counter of one relation, and its trigger for a table"""
+
+    def __init__(self, name, table=None):
+        self.name = name
+        self.table = table
+
+
+@compiles(CreateChangeCounter)
+def compile_create_change_counter(element, compiler, **kw):
+    quote = compiler.preparer.quote
+    counter = quote(counter_name(element.name))
+    res = 'CREATE SEQUENCE IF NOT EXISTS %s' % counter
+    if element.table is not None:
+        table = compiler.preparer.format_table(element.table)
+        res += (
+            ';DROP TRIGGER IF EXISTS %(trigger)s ON %(table)s;'
+            'CREATE TRIGGER %(trigger)s '
+            'AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON %(table)s '
+            "FOR EACH STATEMENT EXECUTE PROCEDURE %(function)s('%(counter)s')"
+        ) % dict(trigger=COUNT_TRIGGER, table=table, function=COUNT_FUNCTION,
+                 counter=counter)
+
+    return res
+
+
+class InitViewState(DDLElement):
+    """Save the state of a view just created"""
+
+    def __init__(self, name, sources, with_data=None):
+        self.name = name
+        self.sources = sources
+        self.with_data = with_data
+
+
+@compiles(InitViewState)
+def compile_init_view_state(element, compiler, **kw):
+    sources = element.sources or ()
+    return (
+        'INSERT INTO %(table)s (name, refreshed_at, counters) '
+        "SELECT '%(name)s', %(refreshed_at)s, "
+        "COALESCE(jsonb_object_agg(name, counter), '{}') "
+        'FROM (%(counters)s) AS counters '
+        'ON CONFLICT (name) DO NOTHING'
+    ) % dict(
+        table=STATE_TABLE,
+        name=element.name,
+        refreshed_at='NULL' if element.with_data is False else 'now()',
+        counters=get_counters_query(
+            sql_array(sources),
+            sql_array([counter_name(source) for source in sources])),
+    )
+
+
+def sql_array(values):
+    return 'ARRAY[%s]::TEXT[]' % ', '.join("'%s'" % value for value in values)
+
+
+def get_counters_query(names, counters):
+    """Return the query of the counters of the relations, from the SQL
+    arrays of their names and of the names of their counters
+
+    The names of the relations are not read from the names of the
+    sequences, which are truncated, see :func:`counter_name`.
+    """
+    return (
+        'SELECT relations.name, COALESCE(s.last_value, 0) AS counter '
+        'FROM unnest(%s, %s) AS relations(name, counter) '
+        'JOIN pg_sequences s ON s.sequencename = relations.counter '
+        'AND s.schemaname = current_schema()' % (names, counters)
+    )
+
+
+def counter_name(name):
+    """Return the name of the sequence of the counter of the relation,
+    truncated with a hash if it is too long, see
+    :func:`~anyblok_postgres.common.truncate_name`"""
+    return truncate_name(name + '__change_counter')
+
+
+def get_source_relations(selectable):
+    """Return the names of the relations read by the query, or None if one
+    of them is not tracked
+
+    The tracked relations are the tables and the materialized views, the
+    hybrid views excepted
+    """
+    res = []
+    for element in visitors.iterate(selectable):
+        if not isinstance(element, TableClause):
+            continue
+
+        if not (isinstance(element, Table) or
+                (getattr(element, 'tracking', None) is not None and
+                 not element.hybrid)):
+            return None
+
+        if element.name not in res:
+            res.append(element.name)
+
+    return res
+
+
+class ChangeTracking:
+    """Staleness tracking of one view
+
+    :param name: name of the view
+    :param sources: names of the relations read by the view, None if they
+                    are not all tracked
+    :param tables: source tables, to create their triggers
+    """
+
+    def __init__(self, name, sources, tables=()):
+        self.name = name
+        self.sources = sources
+        self.tables = tables
+
+    def get_ddl(self):
+        """Return the DDL elements to create the counters and the triggers,
+        to run before the creation of the view"""
+        res = [CreateViewState(), CreateChangeCounter(self.name)]
+        for table in self.tables:
+            res.append(CreateChangeCounter(table.name, table))
+
+        return res
+
+    def get_init_ddl(self, with_data=None):
+        """Return the DDL element to save the first state of the view, to
+        run after the creation of the view"""
+        return InitViewState(self.name, self.sources, with_data=with_data)
+
+    def get_counters(self, bind):
+        """Return the current counters of the sources
+
+        :param bind: registry or connection to execute the queries
+        :rtype: dict ``{relation name: counter}``
+        """
+        if not self.sources:
+            return {}
+
+        query = text(get_counters_query(':names', ':counters'))
+        return dict(bind.execute(query, dict(
+            names=list(self.sources),
+            counters=[counter_name(source) for source in self.sources]
+        )).fetchall())
+
+    def get_state(self, bind):
+        """Return the state saved by the last refresh, with its age, or
+        None"""
+        return bind.execute(text(
+            'SELECT refreshed_at, now() - refreshed_at AS age, counters '
+            'FROM %s WHERE name = :name' % STATE_TABLE
+        ), dict(name=self.name)).fetchone()
+
+    def is_stale(self, bind, max_age=None, state=None):
+        """Return True if one source changed since the last refresh
+
+        :param bind: registry or connection to execute the queries
+        :param max_age: ``timedelta`` or number of seconds, the view is not
+                        stale before this age
+        :param state: the state already read by :meth:`get_state`, optional
+        """
+        if state is None:
+            state = self.get_state(bind)
+
+        if state is None or state.refreshed_at is None:
+            return True
+
+        if max_age is not None:
+            if not isinstance(max_age, timedelta):
+                max_age = timedelta(seconds=max_age)
+
+            if state.age < max_age:
+                return False
+
+        if self.sources is None:
+            return True
+
+        return self.get_counters(bind) != state.counters
+
+    def refreshed(self, bind, counters):
+        """Save the state of the view after a refresh
+
+        :param bind: registry or connection to execute the queries
+        :param counters: counters of the sources, read before the refresh
+        """
+        bind.execute(text(
+            'INSERT INTO %s (name, refreshed_at, counters) '
+            'VALUES (:name, now(), CAST(:counters AS JSONB)) '
+            'ON CONFLICT (name) DO UPDATE '
+            'SET refreshed_at = EXCLUDED.refreshed_at, '
+            'counters = EXCLUDED.counters' % STATE_TABLE
+        ), dict(name=self.name, counters=dumps(counters)))
+        self.changed(bind)
+
+    def forget(self, bind):
+        """Remove the state of the view, saved again by the creation of the
+        view"""
+        bind.execute(text('DELETE FROM %s WHERE name = :name' % STATE_TABLE),
+                     dict(name=self.name))
+
+    def changed(self, bind):
+        """Increment the counter of the view, to mark the views reading it
+        as stale
+
+        :param bind: registry or connection to execute the queries
+        """
+        bind.execute(text('SELECT nextval(:counter)'),
+                     dict(counter=counter_name(self.name)))
+
+    @classmethod
+    def from_selectable(cls, name, selectable):
+        """Return the staleness tracking of the view"""
+        sources = get_source_relations(selectable)
+        tables = []
+        if sources is not None:
+            tables = [element for element in visitors.iterate(selectable)
+                      if isinstance(element, Table)]
+            tables = list({table.name: table for table in tables}.values())
+
+        return cls(name, sources, tables)
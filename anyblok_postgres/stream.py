@@ -0,0 +1,62 @@
+# This file is a part of the AnyBlok / postgres api project
+#
+#    Copyright (C) 2026 Jean-Sebastien SUZANNE <js.suzanne@gmail.com>
+#
+# This Source Code Form is subject to the terms of the Mozilla Public License,
+# v. 2.0. If a copy of the MPL was not distributed with this file,You can
+# obtain one at http://mozilla.org/MPL/2.0/.
+"""Streaming of the results of the queries
+
+By default the whole result of a query is loaded in the memory of the
+client before the first row. :func:`stream_query` reads it from a named
+server-side cursor, ``itersize`` rows at a time, so the exports of whole
+tables run in constant memory::
+
+    from anyblok_postgres.stream import stream_query, stream_batches
+
+    for test in stream_query(registry.Test.query(), itersize=500):
+        export(test)
+
+    for tests in stream_batches(registry.Test.query(), itersize=500):
+        reindex(tests)
+
+The content of the **LargeObject** columns is only read when the attribute
+is read, as the documents of the **Jsonb** columns declared with
+``lazy_decode=True`` are only decoded when the attribute is read.
+
+.. warning::
+
+    The server-side cursor only lives in its transaction: the stream must
+    be consumed before the commit or the rollback of the session. The
+    relationships can not be eagerly loaded by a collection join.
+"""
+from itertools import islice
+
+ITERSIZE = 1000
+
+
+def stream_query(query, itersize=ITERSIZE):
+    """Return an iterator on the results of the query, fetched from a
+    server-side cursor
+
+    :param query: the query of the model
+    :param itersize: number of rows fetched at a time
+    """
+    if itersize < 1:
+        raise ValueError('itersize must be positive, not %r' % itersize)
+
+    return iter(query.yield_per(itersize))
+
+
+def stream_batches(query, itersize=ITERSIZE):
+    """Yield the results of the query by lists of ``itersize`` results,
+    fetched from a server-side cursor
+
+    :param query: the query of the model
+    :param itersize: number of rows fetched at a time, and size of the lists
+    """
+    results = stream_query(query, itersize=itersize)
+    batch = list(islice(results, itersize))
+    while batch:
+        yield batch
+        batch = list(islice(results, itersize))
@@ -0,0 +1,126 @@
+# This file is a part of the AnyBlok / Postgres project
+#
+#    Copyright (C) 2026 Jean-Sebastien SUZANNE <js.suzanne@gmail.com>
+#
+# This Source Code Form is subject to the terms of the Mozilla Public License,
+# v. 2.0. If a copy of the MPL was not distributed with this file,You can
+# obtain one at http://mozilla.org/MPL/2.0/.
+import pytest
+from anyblok import Declarations
+from anyblok.column import Integer, String
+from anyblok.tests.conftest import init_registry_with_bloks
+from sqlalchemy.sql import select
+from anyblok_postgres.materialized_view import MaterializedViewFactory
+from anyblok_postgres.advisor import (
+    covers, get_indexes, recommend_view_indexes, recommend_indexes,
+    create_recommended_indexes, format_recommendations)
+from anyblok_postgres.usage import UsageCollector, ViewUsage
+
+register = Declarations.register
+Model = Declarations.Model
+
+
+def advised_view():
+
+    @register(Model)
+    class T1:
+        id = Integer(primary_key=True)
+        code = String()
+        val = Integer()
+        val2 = Integer()
+
+    @register(Model, factory=MaterializedViewFactory)
+    class TestAdvisedView:
+        view_indexes = [('val2',)]
+        code = String(primary_key=True)
+        val = Integer()
+        val2 = Integer()
+
+        @classmethod
+        def sqlalchemy_view_declaration(cls):
+            T1 = cls.anyblok.T1
+            return select([T1.code.label('code'), T1.val.label('val'),
+                           T1.val2.label('val2')])
+
+
+@pytest.fixture(scope="class")
+def registry_advised_view(request, bloks_loaded):
+    registry = init_registry_with_bloks([], advised_view)
+    request.addfinalizer(registry.close)
+    return registry
+
+
+class TestAdvisor:
+
+    @pytest.fixture(autouse=True)
+    def transact(self, request, registry_advised_view):
+        transaction = registry_advised_view.begin_nested()
+        request.addfinalizer(transaction.rollback)
+
+    def test_read_patterns(self, registry_advised_view):
+        registry = registry_advised_view
+        TestAdvisedView = registry.TestAdvisedView
+        collector = UsageCollector(registry)
+        collector.start()
+        try:
+            for _ in range(3):
+                TestAdvisedView.query().filter_by(val=1, code='test').order_by(
+                    TestAdvisedView.val2, TestAdvisedView.val).all()
+
+            TestAdvisedView.query().all()
+        finally:
+            collector.stop()
+
+        patterns = collector.usages['testadvisedview'].patterns
+        assert sorted(patterns) == [
+            ((), ()), (('code', 'val'), ('val2', 'val'))]
+        assert patterns[(('code', 'val'), ('val2', 'val'))][0] == 3
+
+    def test_get_indexes(self, registry_advised_view):
+        indexes = get_indexes(registry_advised_view, ['testadvisedview'])
+        assert indexes[('code',)][:2] == [
+            ['anyblok_uix_testadvisedview__pk'], True]
+        assert indexes[('val2',)][:2] == [
+            ['anyblok_ix_testadvisedview__val2'], False]
+
+    def test_covers(self):
+        assert covers(('val', 'code'), ('val',), ('code',))
+        assert covers(('b', 'a', 'c'), ('a', 'b'), ())
+        assert not covers(('code', 'val'), ('val',), ('code',))
+        assert not covers(('val',), ('val',), ('code',))
+
+    def test_recommend_view_indexes(self):
+        usage = ViewUsage('testadvisedview', reads=30)
+        usage.patterns = {
+            (('val',), ('code',)): [20, 2.],
+            (('val',), ()): [5, 0.5],
+            (('code',), ()): [5, 0.1],
+            (('val2',), ('val2',)): [9, 1.],
+        }
+        indexes = {('code',): [['pk'], True, 0], ('val2',): [['ix'], False, 0]}
+        recommendations = recommend_view_indexes(
+            'testadvisedview', usage, indexes)
+        assert [(x.action, x.columns, x.queries)
+                for x in recommendations] == [
+            ('create', ('val', 'code'), 20),
+            ('drop', ('val2',), 0),
+        ]
+        assert recommendations[1].indexes == ('ix',)
+        indexes[('val2',)][2] = 1
+        assert len(recommend_view_indexes(
+            'testadvisedview', usage, indexes, min_queries=5)) == 1
+
+    def test_create_recommended_indexes(self, registry_advised_view):
+        registry = registry_advised_view
+        usage = ViewUsage('testadvisedview', reads=10)
+        usage.patterns = {(('val',), ('code',)): [10, 1.]}
+        recommendations = recommend_indexes(
+            registry, {'testadvisedview': usage})
+        assert [(x.action, x.columns) for x in recommendations] == [
+            ('create', ('val', 'code')), ('drop', ('val2',))]
+        assert 'never scanned' in format_recommendations(recommendations)
+        assert create_recommended_indexes(registry, recommendations) == [
+            'anyblok_ix_testadvisedview__val_code']
+        assert ('val', 'code') in get_indexes(registry, ['testadvisedview'])
+        assert recommend_indexes(registry, {'testadvisedview': usage})[
+            0].action == 'drop'
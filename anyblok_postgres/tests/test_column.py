@@ -12,7 +12,9 @@ from datetime import date, datetime, timezone
 from anyblok.tests.test_column import simple_column
 from anyblok_postgres.column import Jsonb, LargeObject
 from anyblok_postgres import column as pgcol
+from anyblok_postgres.range import Range
 from anyblok.tests.conftest import init_registry
+from anyblok.common import anyblok_column_prefix
 
 from os import urandom
 
@@ -62,6 +64,37 @@ class TestColumns:
         assert Test.query().filter(Test.col.is_(None)).count() == 2
         assert Test.query().filter(Test.col.isnot(None)).count() == 1
 
+    def test_jsonb_lazy_decode(self):
+        registry = self.init_registry(
+            simple_column, ColumnType=Jsonb, lazy_decode=True)
+        Test = registry.Test
+        test = Test.insert(col={'a': 'test'})
+        registry.flush()
+        registry.expire(test)
+        raw = pgcol.get_raw_json(test, 'col')
+        assert raw == '{"a": "test"}'
+        document = test.__dict__[anyblok_column_prefix + 'col']
+        assert isinstance(document, pgcol.LazyDocument)
+        assert document._value is pgcol.not_decoded
+        assert test.col == {'a': 'test'}
+        assert test.col is test.col
+        assert Test.query('col').scalar().raw == raw
+        Test.insert(col=Test.query('col').scalar())
+        assert Test.query().filter(
+            Test.col['a'].astext == 'test').count() == 2
+        document = Test.query('col').filter_by(id=test.id).scalar()
+        document.value['a'] = 'changed'
+        Test.insert(col=document)
+        assert Test.query().filter(
+            Test.col['a'].astext == 'changed').count() == 1
+
+    def test_jsonb_raw_without_lazy_decode(self):
+        registry = self.init_registry(simple_column, ColumnType=Jsonb)
+        test = registry.Test.insert(col={'a': 'test'})
+        assert pgcol.get_raw_json(test, 'col') == '{"a": "test"}'
+        test.col = None
+        assert pgcol.get_raw_json(test, 'col') is None
+
     def assert_query_contains(self, Model, c, expected):
         """Useful factorisation for range types."""
         assert set(Model.query().filter(
@@ -90,9 +123,11 @@ class TestColumns:
                                    "({}, {})".format(bigint, bigint + 10),
                                    [t2])
 
-        # just plain '2' literal wouldn't work as-is because it's
-        # not passed as 2::bigint to PG
+        # plain '2' literal is passed as 2::bigint to PG
         self.assert_query_contains(Test, "[2, 2]", [t1])
+        self.assert_query_contains(Test, 2, [t1])
+        self.assert_query_contains(Test, [1, 2], [t1])
+        self.assert_query_contains(Test, [2, bigint + 10], ())
 
     def test_numrange(self):
         registry = self.init_registry(simple_column,
@@ -104,9 +139,12 @@ class TestColumns:
         self.assert_query_contains(Test, Decimal('7.5'), ())
         self.assert_query_contains(Test, "[5,6]", [t2])
 
-        # unfortunately, even Decimal(2) doesn't work, it gets passed as just
-        # '2', so we need an explict range here too
+        # Decimal(2) and 2 are passed as 2::numeric to PG
         self.assert_query_contains(Test, "[2, 2]", [t1])
+        self.assert_query_contains(Test, Decimal(2), [t1])
+        self.assert_query_contains(Test, 2, [t1])
+        self.assert_query_contains(Test, (Decimal(2), 5), ())
+        self.assert_query_contains(Test, [5, Decimal('6.5')], [t2])
 
     def test_daterange(self):
         registry = self.init_registry(simple_column,
@@ -159,3 +197,96 @@ class TestColumns:
         assert test.col == hugefile2
         oid2 = registry.execute('select col from test').fetchone()[0]
         assert oid1 == oid2
+
+    def test_large_object_shorter_value(self):
+        registry = self.init_registry(simple_column, ColumnType=LargeObject)
+        test = registry.Test.insert(col=urandom(1000))
+        hugefile = urandom(10)
+        test.col = hugefile
+        registry.flush()
+        assert test.col == hugefile
+
+    def test_large_object_handles_closed(self, monkeypatch):
+        registry = self.init_registry(simple_column, ColumnType=LargeObject)
+        get_dbapi_connection = pgcol.get_dbapi_connection
+        lobjects = []
+
+        class RecordingConnection:
+
+            def __init__(self, connection):
+                self.connection = connection
+
+            def lobject(self, *args):
+                lobj = self.connection.lobject(*args)
+                lobjects.append(lobj)
+                return lobj
+
+        monkeypatch.setattr(
+            pgcol, 'get_dbapi_connection',
+            lambda registry: RecordingConnection(
+                get_dbapi_connection(registry)))
+        test = registry.Test.insert(col=urandom(1000))
+        assert len(test.col) == 1000
+        test.col = urandom(100)
+        assert len(test.col) == 100
+        test.col = None
+        assert len(lobjects) == 5
+        assert all(lobj.closed for lobj in lobjects)
+
+    @pytest.mark.parametrize('ColumnType,value', [
+        (pgcol.Int4Range, Range(1, 3)),
+        (pgcol.Int8Range, Range(1 << 32, 1 << 33)),
+        (pgcol.NumRange, Range(Decimal('1.5'), Decimal('3'), '(]')),
+        (pgcol.DateRange, Range(date(2001, 3, 12), None)),
+        (pgcol.TsRange, Range(datetime(2001, 3, 12), datetime(2002, 1, 1),
+                              '[]')),
+        (pgcol.TsTzRange, Range(datetime(2018, 1, 1, tzinfo=timezone.utc),
+                                datetime(2019, 1, 1, tzinfo=timezone.utc))),
+        (pgcol.Int4Range, Range(empty=True)),
+    ])
+    def test_range_round_trip(self, ColumnType, value):
+        registry = self.init_registry(simple_column, ColumnType=ColumnType)
+        Test = registry.Test
+        test = Test.insert(col=value)
+        registry.flush()
+        registry.expire(test, ['col'])
+        assert isinstance(test.col, Range)
+        assert test.col == value
+        if not value.isempty:
+            self.assert_query_contains(Test, value, [test])
+
+    def test_range_loaded_from_string(self):
+        registry = self.init_registry(simple_column,
+                                      ColumnType=pgcol.Int4Range)
+        test = registry.Test.insert(col="[1,3]")
+        registry.flush()
+        registry.expire(test, ['col'])
+        assert test.col == Range(1, 4)
+        assert 3 in test.col
+
+    def test_find_containing(self):
+        registry = self.init_registry(simple_column,
+                                      ColumnType=pgcol.TsTzRange)
+        Test = registry.Test
+        utc = timezone.utc
+        t1 = Test.insert(col=Range(datetime(2018, 1, 1, tzinfo=utc),
+                                   datetime(2019, 1, 1, tzinfo=utc)))
+        t2 = Test.insert(col=Range(datetime(2018, 6, 1, tzinfo=utc), None))
+        points = [datetime(2020, 1, 1, tzinfo=utc),
+                  datetime(2017, 1, 1, tzinfo=utc),
+                  datetime(2018, 7, 1, tzinfo=utc),
+                  datetime(2018, 2, 1, tzinfo=utc)]
+        res = pgcol.find_containing(Test, 'col', points)
+        assert res[0] == [t2]
+        assert res[1] == []
+        assert set(res[2]) == {t1, t2}
+        assert res[3] == [t1]
+        assert pgcol.find_containing(Test, 'col', []) == []
+
+    def test_query_containing_int8range(self):
+        registry = self.init_registry(simple_column,
+                                      ColumnType=pgcol.Int8Range)
+        Test = registry.Test
+        t1 = Test.insert(col=Range(1, 3))
+        query = pgcol.query_containing(Test, 'col', [5, 2, 1 << 40, 1])
+        assert query.all() == [(1, t1), (3, t1)]
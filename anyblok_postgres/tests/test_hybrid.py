@@ -0,0 +1,199 @@
+# This file is a part of the AnyBlok / Postgres project
+#
+#    Copyright (C) 2026 Jean-Sebastien SUZANNE <js.suzanne@gmail.com>
+#
+# This Source Code Form is subject to the terms of the Mozilla Public License,
+# v. 2.0. If a copy of the MPL was not distributed with this file,You can
+# obtain one at http://mozilla.org/MPL/2.0/.
+import pytest
+from anyblok import Declarations
+from anyblok.column import Integer, String
+from anyblok.model.exceptions import ViewException
+from anyblok.tests.conftest import init_registry_with_bloks
+from sqlalchemy.sql import select
+from anyblok_postgres.materialized_view import MaterializedViewFactory
+from anyblok_postgres.hybrid import (
+    HybridViewFactory, decide, get_view_decisions, apply_view_decisions,
+    format_report)
+from anyblok_postgres.usage import UsageCollector, ViewUsage, get_usages
+
+register = Declarations.register
+Model = Declarations.Model
+
+
+def hybrid_views():
+
+    @register(Model)
+    class T1:
+        id = Integer(primary_key=True)
+        code = String()
+        val = Integer()
+
+    @register(Model, factory=HybridViewFactory)
+    class TestHybridView:
+        code = String(primary_key=True)
+        val = Integer()
+
+        @classmethod
+        def sqlalchemy_view_declaration(cls):
+            T1 = cls.anyblok.T1
+            return select([T1.code.label('code'), T1.val.label('val')])
+
+    @register(Model, factory=HybridViewFactory)
+    class TestMaterializedHybridView:
+        materialize = True
+        code = String(primary_key=True)
+        val = Integer()
+
+        @classmethod
+        def sqlalchemy_view_declaration(cls):
+            T1 = cls.anyblok.T1
+            return select([T1.code.label('code'), (T1.val + 1).label('val')])
+
+    @register(Model, factory=MaterializedViewFactory)
+    class TestViewOnHybridView:
+        code = String(primary_key=True)
+        val = Integer()
+
+        @classmethod
+        def sqlalchemy_view_declaration(cls):
+            TestHybridView = cls.anyblok.TestHybridView
+            return select([TestHybridView.code.label('code'),
+                           TestHybridView.val.label('val')])
+
+
+@pytest.fixture(scope="class")
+def registry_hybrid_views(request, bloks_loaded):
+    registry = init_registry_with_bloks([], hybrid_views)
+    request.addfinalizer(registry.close)
+    return registry
+
+
+def get_relkind(registry, name):
+    return registry.execute(
+        "select relkind from pg_class where relname = '%s'" % name).scalar()
+
+
+class TestHybridViews:
+
+    @pytest.fixture(autouse=True)
+    def transact(self, request, registry_hybrid_views):
+        transaction = registry_hybrid_views.begin_nested()
+        request.addfinalizer(transaction.rollback)
+
+    def test_storage(self, registry_hybrid_views):
+        registry = registry_hybrid_views
+        assert get_relkind(registry, 'testhybridview') == 'v'
+        assert get_relkind(registry, 'testmaterializedhybridview') == 'm'
+
+    def test_plain_view(self, registry_hybrid_views):
+        registry = registry_hybrid_views
+        TestHybridView = registry.TestHybridView
+        registry.T1.insert(code='test1', val=1)
+        assert TestHybridView.query().one().val == 1
+        TestHybridView.refresh_materialized_view()
+        assert not TestHybridView.is_stale()
+        assert not TestHybridView.refresh_if_stale()
+
+    def test_view_on_hybrid_view_is_always_stale(self, registry_hybrid_views):
+        registry = registry_hybrid_views
+        TestViewOnHybridView = registry.TestViewOnHybridView
+        assert TestViewOnHybridView.__view__.tracking.sources is None
+        TestViewOnHybridView.refresh_materialized_view()
+        assert TestViewOnHybridView.is_stale()
+
+    def test_usage_collector(self, registry_hybrid_views):
+        registry = registry_hybrid_views
+        registry.T1.insert(code='test1', val=1)
+        collector = UsageCollector(registry)
+        collector.start()
+        try:
+            for _ in range(3):
+                registry.TestHybridView.query().all()
+
+            registry.T1.query().all()
+            registry.TestMaterializedHybridView.refresh_materialized_view()
+        finally:
+            collector.stop()
+
+        usage = collector.usages['testhybridview']
+        assert usage.reads == 3
+        assert usage.max_read_time > 0
+        assert collector.usages['testmaterializedhybridview'].refreshes == 1
+        collector.save(registry)
+        collector.usages['testhybridview'] = ViewUsage(
+            'testhybridview', reads=2, read_time=1., max_read_time=0.75)
+        collector.save(registry)
+        usage = get_usages(registry)['testhybridview']
+        assert usage.reads == 5
+        assert usage.max_read_time == 0.75
+
+    def test_decide(self, registry_hybrid_views):
+        view = registry_hybrid_views.TestHybridView.__view__
+        usage = ViewUsage('testhybridview', reads=200, read_time=20.,
+                          max_read_time=0.5, age=3600)
+        decision = decide(view, usage, False)
+        assert decision.recommended is True
+        assert decision.plain_cost == 20.
+        assert decision.materialized_cost == 0.5
+        assert decide(view, usage, False, min_reads=1000).recommended is False
+        assert decide(view, usage, False, materialize=False).changed is False
+        usage = ViewUsage('testhybridview', reads=100, read_time=0.2,
+                          refreshes=500, refresh_time=500., age=3600)
+        decision = decide(view, usage, True)
+        assert decision.recommended is False
+        assert decision.plain_cost == 100.
+        assert decision.materialized_cost == pytest.approx(500.2)
+        assert decide(view, usage, True, ratio=10).recommended is True
+
+    def test_apply_view_decisions(self, registry_hybrid_views):
+        registry = registry_hybrid_views
+        registry.T1.insert(code='test1', val=1)
+        collector = UsageCollector(registry)
+        collector.usages['testhybridview'] = ViewUsage(
+            'testhybridview', reads=200, read_time=20., max_read_time=0.5)
+        collector.save(registry)
+        decisions = get_view_decisions(registry)
+        assert [(x.view, x.materialized, x.recommended)
+                for x in decisions] == [
+            ('testhybridview', False, True),
+            ('testmaterializedhybridview', True, True),
+        ]
+        report = format_report(decisions)
+        assert 'reads cost more than refreshes' in report
+        assert apply_view_decisions(registry, decisions) == ['testhybridview']
+        assert get_relkind(registry, 'testhybridview') == 'm'
+        assert get_relkind(registry, 'testviewonhybridview') == 'm'
+        assert get_usages(registry)['testhybridview'].reads == 0
+        assert registry.TestHybridView.query().one().val == 1
+        registry.T1.query().update({'val': 2})
+        registry.TestHybridView.refresh_materialized_view()
+        assert registry.TestHybridView.query().one().val == 2
+        assert [x.view for x in get_view_decisions(registry)
+                if x.materialized] == [
+            'testhybridview', 'testmaterializedhybridview']
+
+
+def hybrid_view_with_invalid_materialize():
+
+    @register(Model)
+    class T1:
+        id = Integer(primary_key=True)
+        code = String()
+
+    @register(Model, factory=HybridViewFactory)
+    class TestHybridView:
+        materialize = 'sometimes'
+        code = String(primary_key=True)
+
+        @classmethod
+        def sqlalchemy_view_declaration(cls):
+            T1 = cls.anyblok.T1
+            return select([T1.code.label('code')])
+
+
+class TestHybridViewWithException:
+
+    def test_invalid_materialize(self, bloks_loaded):
+        with pytest.raises(ViewException):
+            init_registry_with_bloks([], hybrid_view_with_invalid_materialize)
@@ -7,17 +7,35 @@
 # v. 2.0. If a copy of the MPL was not distributed with this file,You can
 # obtain one at http://mozilla.org/MPL/2.0/.
 import pytest
-from anyblok_postgres.materialized_view import MaterializedViewFactory
+from anyblok_postgres.materialized_view import (
+    MaterializedViewFactory, get_materialized_views, get_view_dependencies,
+    get_refresh_order, refresh_all_materialized_views, is_populated,
+    warm_up_materialized_views, refresh_in_background, get_definition_hash,
+    ViewDDL, CreateMaterializedView, index_name, get_advisory_lock_key,
+    ADVISORY_LOCK_NAMESPACE)
+from anyblok_postgres.instrumentation import instrumentation, log_refresh
+from anyblok_postgres.partition import Partitioning
+from anyblok_postgres.staleness import (
+    ChangeTracking, CreateChangeCounter, InitViewState, counter_name)
+from anyblok_postgres.incremental import (
+    CollectChanges, CreateChangeTrigger, IncrementalRefresh,
+    change_function_name, change_log_name, change_trigger_name,
+    get_equivalent_columns, pending_name)
 from anyblok.model.exceptions import ViewException
 from anyblok import Declarations
-from sqlalchemy.sql import select, expression, union
+from sqlalchemy.sql import select, expression, union, func, join, exists
 from sqlalchemy.exc import OperationalError
-from anyblok.column import Integer, String
+from sqlalchemy.dialects import postgresql
+from anyblok.column import Integer, String, Date
 from anyblok.relationship import Many2One
 from anyblok.config import get_url
-from sqlalchemy import create_engine
+from sqlalchemy import (
+    Column as SaColumn, MetaData, Table, create_engine, event, text, types)
 from anyblok.tests.conftest import init_registry_with_bloks
+from anyblok.environment import EnvironmentManager
 from contextlib import contextmanager
+from time import monotonic
+from datetime import date
 
 register = Declarations.register
 Model = Declarations.Model
@@ -39,8 +57,9 @@ def simple_view():
 
     @register(Model, factory=MaterializedViewFactory)
     class TestView:
+        view_indexes = [('val2', 'val1')]
         code = String(primary_key=True)
-        val1 = Integer()
+        val1 = Integer(index=True)
         val2 = Integer()
 
         @classmethod
@@ -96,6 +115,319 @@ class TestSimpleView:
         assert v3.val1 == 5
         assert v3.val2 == 6
 
+    def test_refresh_concurrently(self, registry_simple_view):
+        registry = registry_simple_view
+        TestView = registry.TestView
+        TestView.refresh_materialized_view()
+        registry.T1.insert(code='test3', val=5)
+        registry.T2.insert(code='test3', val=6)
+        TestView.refresh_materialized_view(concurrently=True)
+        v3 = TestView.query().filter(TestView.code == 'test3').one()
+        assert v3.val1 == 5
+
+    def test_refresh_locked(self, registry_simple_view):
+        registry = registry_simple_view
+        TestView = registry.TestView
+        view = TestView.__view__
+        with registry.engine.connect() as connection:
+            with connection.begin():
+                connection.execute(
+                    text('SELECT pg_advisory_xact_lock(:namespace, :key)'),
+                    dict(namespace=ADVISORY_LOCK_NAMESPACE,
+                         key=get_advisory_lock_key(view.name)))
+                assert TestView.refresh_materialized_view() is False
+                transaction = registry.begin_nested()
+                registry.execute("SET LOCAL lock_timeout = '100ms'")
+                with pytest.raises(OperationalError):
+                    TestView.refresh_materialized_view(wait=True)
+
+                transaction.rollback()
+
+        assert TestView.refresh_materialized_view() is True
+
+    def test_refresh_swap(self, registry_simple_view):
+        registry = registry_simple_view
+        TestView = registry.TestView
+        registry.execute(
+            'CREATE INDEX "custom index" ON testview (val2)')
+        TestView.refresh_materialized_view(strategy='swap')
+        assert TestView.query().count() == 2
+        registry.T1.insert(code='test3', val=5)
+        registry.T2.insert(code='test3', val=6)
+        TestView.refresh_materialized_view(strategy='swap')
+        assert TestView.query().filter_by(code='test3').one().val2 == 6
+        indexes = dict(registry.execute(
+            "select indexname, indexdef from pg_indexes "
+            "where tablename = 'testview'").fetchall())
+        assert set(indexes) == {
+            'anyblok_uix_testview__pk', 'anyblok_ix_testview__val1',
+            'anyblok_ix_testview__val2_val1', 'custom index'}
+        assert 'UNIQUE' in indexes['anyblok_uix_testview__pk']
+        assert not registry.execute(
+            "select count(*) from pg_class "
+            "where relname like '%\\_\\_shadow'").scalar()
+
+    def test_refresh_swap_with_dependent_view(self, registry_simple_view):
+        registry = registry_simple_view
+        registry.execute(
+            'CREATE VIEW testview_reader AS SELECT code FROM testview')
+        with pytest.raises(ViewException) as error:
+            registry.TestView.refresh_materialized_view(strategy='swap')
+
+        assert 'testview_reader' in str(error.value)
+
+    def test_refresh_swap_then_definition_changed(self, registry_simple_view):
+        registry = registry_simple_view
+        TestView = registry.TestView
+        view = TestView.__view__
+        TestView.refresh_materialized_view(strategy='swap')
+        assert get_definition_hash(
+            registry, 'testview') == view.ddl.definition_hash
+        T1 = registry.T1
+        ddl = ViewDDL(view, 'MATERIALIZED VIEW', [
+            CreateMaterializedView(view, select([
+                T1.code.label('code'), T1.val.label('val1'),
+                T1.val.label('val2')]))], registry.engine.dialect)
+        ddl(None, registry.session.connection())
+        assert get_definition_hash(
+            registry, 'testview') == ddl.definition_hash
+        assert sorted(TestView.query('val2').all()) == [(1,), (3,)]
+
+    def test_refresh_metrics(self, registry_simple_view):
+        registry = registry_simple_view
+        collected = []
+        instrumentation.add_hook(collected.append)
+        instrumentation.add_hook(log_refresh)
+        try:
+            registry.TestView.refresh_materialized_view()
+            registry.T1.insert(code='test3', val=5)
+            registry.T2.insert(code='test3', val=6)
+            instrumentation.explain_threshold = 0
+            instrumentation.exact_counts = True
+            registry.TestView.refresh_materialized_view(concurrently=True)
+        finally:
+            instrumentation.remove_hook(collected.append)
+            instrumentation.remove_hook(log_refresh)
+            instrumentation.explain_threshold = None
+            instrumentation.exact_counts = False
+
+        assert [x.mode for x in collected] == ['blocking', 'concurrently']
+        assert collected[0].plan is None
+        metrics = collected[1].to_dict()
+        assert metrics['view'] == 'testview'
+        assert metrics['rows_before'] == 2
+        assert metrics['rows_after'] == 3
+        assert metrics['size_after'] > 0
+        assert metrics['duration'] >= metrics['advisory_lock_wait'] >= 0
+        assert 'Buffers' in metrics['plan'] or 'actual' in metrics['plan']
+
+    def test_refresh_metrics_estimated_rows(self, registry_simple_view):
+        registry = registry_simple_view
+        collected = []
+        instrumentation.add_hook(collected.append)
+        try:
+            registry.TestView.refresh_materialized_view()
+            registry.execute('ANALYZE testview')
+            registry.TestView.refresh_materialized_view()
+        finally:
+            instrumentation.remove_hook(collected.append)
+
+        assert collected[0].rows_before is None
+        assert collected[1].rows_before == 2
+
+    def test_refresh_partitions_not_partitioned(self, registry_simple_view):
+        with pytest.raises(ViewException):
+            registry_simple_view.TestView.refresh_materialized_view(
+                partitions=['default'])
+
+    def test_refresh_with_unknown_strategy(self, registry_simple_view):
+        with pytest.raises(ViewException):
+            registry_simple_view.TestView.refresh_materialized_view(
+                strategy='unknown')
+
+    def test_indexes(self, registry_simple_view):
+        registry = registry_simple_view
+        indexes = dict(registry.execute(
+            "select indexname, indexdef from pg_indexes "
+            "where tablename = 'testview'").fetchall())
+        assert 'UNIQUE' in indexes['anyblok_uix_testview__pk']
+        assert '(code)' in indexes['anyblok_uix_testview__pk']
+        assert '(val1)' in indexes['anyblok_ix_testview__val1']
+        assert '(val2, val1)' in indexes['anyblok_ix_testview__val2_val1']
+
+    def test_counters_with_long_names(self, registry_simple_view):
+        registry = registry_simple_view
+        sources = ['source_relation_with_a_long_name_to_check_the_counter_1',
+                   'source_relation_with_a_long_name_to_check_the_counter_2']
+        for source in sources:
+            registry.execute(CreateChangeCounter(source))
+
+        registry.execute(text('SELECT nextval(:counter)'),
+                         dict(counter=counter_name(sources[1])))
+        tracking = ChangeTracking('testview', sources)
+        assert tracking.get_counters(registry) == {
+            sources[0]: 0, sources[1]: 1}
+        registry.execute(InitViewState('testlongview', sources))
+        assert registry.execute(text(
+            'SELECT counters FROM anyblok_materialized_view_state '
+            "WHERE name = 'testlongview'")).scalar() == {
+                sources[0]: 0, sources[1]: 1}
+
+    def test_is_stale(self, registry_simple_view):
+        registry = registry_simple_view
+        TestView = registry.TestView
+        assert TestView.is_stale()
+        TestView.refresh_materialized_view()
+        assert not TestView.is_stale()
+        assert TestView.last_refreshed_at() is not None
+        registry.T2.query().filter_by(code='test1').update({'val': 7})
+        assert TestView.is_stale()
+
+    def test_refresh_if_stale(self, registry_simple_view):
+        registry = registry_simple_view
+        TestView = registry.TestView
+        assert TestView.refresh_if_stale()
+        assert not TestView.refresh_if_stale()
+        registry.T1.insert(code='test3', val=5)
+        registry.T2.insert(code='test3', val=6)
+        assert not TestView.refresh_if_stale(max_age=3600)
+        assert TestView.query().filter_by(code='test3').one_or_none() is None
+        assert TestView.refresh_if_stale(max_age=0)
+        assert TestView.query().filter_by(code='test3').one().val1 == 5
+
+    def test_max_staleness(self, registry_simple_view, monkeypatch):
+        registry = registry_simple_view
+        TestView = registry.TestView
+        view = TestView.__view__
+        requests = []
+        monkeypatch.setattr(TestView, 'refresh_in_background',
+                            lambda: requests.append(view.name))
+        monkeypatch.setattr(view, 'max_staleness', 3600)
+        monkeypatch.setattr(view, 'fresh_until', 0)
+        TestView.refresh_materialized_view()
+        registry.T1.insert(code='test3', val=5)
+        registry.T2.insert(code='test3', val=6)
+        assert TestView.query().filter_by(code='test3').one_or_none() is None
+        assert view.fresh_until > 0
+        monkeypatch.setattr(view, 'max_staleness', 0)
+        monkeypatch.setattr(view, 'fresh_until', 0)
+        assert TestView.query().filter_by(code='test3').one().val1 == 5
+        assert TestView.query('val2').filter_by(code='test3').scalar() == 6
+        assert requests == ['testview', 'testview']
+        TestView.refresh_materialized_view()
+        assert TestView.read_from_view()
+        assert len(requests) == 2
+
+    def test_max_staleness_without_change(self, registry_simple_view,
+                                          monkeypatch):
+        registry = registry_simple_view
+        TestView = registry.TestView
+        view = TestView.__view__
+        monkeypatch.setattr(view, 'max_staleness', 3600)
+        monkeypatch.setattr(view, 'fresh_until', 0)
+        TestView.refresh_materialized_view()
+        registry.execute(
+            "UPDATE anyblok_materialized_view_state "
+            "SET refreshed_at = now() - interval '2 hours' "
+            "WHERE name = 'testview'")
+        assert TestView.read_from_view()
+        assert view.fresh_until > monotonic() + 3000
+        statements = []
+
+        def count(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(registry.bind, 'before_cursor_execute', count)
+        try:
+            assert TestView.read_from_view()
+        finally:
+            event.remove(registry.bind, 'before_cursor_execute', count)
+
+        assert statements == []
+
+    def test_fallback_query(self, registry_simple_view, monkeypatch):
+        registry = registry_simple_view
+        TestView = registry.TestView
+        TestView.refresh_materialized_view()
+        registry.T1.insert(code='test3', val=5)
+        registry.T2.insert(code='test3', val=6)
+        monkeypatch.setattr(TestView, 'read_from_view', lambda: False)
+        query = TestView.query().filter(TestView.code == 'test3')
+        assert query.one().val2 == 6
+        assert TestView.query('val1').filter(
+            TestView.val2 > 2).order_by('val1').all() == [(3,), (5,)]
+        assert TestView.query().filter(TestView.val1 > 0).order_by(
+            TestView.val1.desc()).first().code == 'test3'
+        assert TestView.query().count() == 3
+
+    def test_refresh_in_background_already_running(
+        self, registry_simple_view
+    ):
+        view = registry_simple_view.TestView.__view__
+        with view.background_refresh:
+            assert refresh_in_background(registry_simple_view, view) is None
+
+    def test_definition_hash(self, registry_simple_view):
+        registry = registry_simple_view
+        view = registry.TestView.__view__
+        assert get_definition_hash(
+            registry, 'testview') == view.ddl.definition_hash
+        dialect = registry.engine.dialect
+        ddl = ViewDDL(view, 'MATERIALIZED VIEW', [
+            CreateMaterializedView(view, view.definition, False)], dialect)
+        assert ddl.statements is None
+        assert ddl.definition_hash == ViewDDL(view, 'MATERIALIZED VIEW', [
+            CreateMaterializedView(view, view.definition)], dialect
+        ).definition_hash
+        assert len(ddl.statements) == 1
+
+    def test_ddl_skipped_while_the_definition_is_the_same(
+        self, registry_simple_view
+    ):
+        registry = registry_simple_view
+        view = registry.TestView.__view__
+        registry.execute('DROP INDEX anyblok_ix_testview__val1')
+        view.ddl(None, registry.session.connection())
+        assert not registry.execute(
+            "select count(*) from pg_indexes "
+            "where indexname = 'anyblok_ix_testview__val1'").scalar()
+
+    def test_view_recreated_if_the_definition_changed(
+        self, registry_simple_view
+    ):
+        registry = registry_simple_view
+        view = registry.TestView.__view__
+        registry.execute('DROP INDEX anyblok_ix_testview__val1')
+        registry.execute(
+            "COMMENT ON MATERIALIZED VIEW testview "
+            "IS 'anyblok_postgres:other'")
+        view.ddl(None, registry.session.connection())
+        assert registry.execute(
+            "select count(*) from pg_indexes "
+            "where indexname = 'anyblok_ix_testview__val1'").scalar()
+        assert get_definition_hash(
+            registry, 'testview') == view.ddl.definition_hash
+        assert registry.TestView.query().count() == 2
+        assert not registry.execute(
+            "select count(*) from pg_class "
+            "where relname like '%\\_\\_shadow'").scalar()
+
+    def test_view_without_hash_recreated(self, registry_simple_view):
+        registry = registry_simple_view
+        view = registry.TestView.__view__
+        registry.execute('DROP MATERIALIZED VIEW testview')
+        registry.execute(
+            'CREATE MATERIALIZED VIEW testview AS '
+            'SELECT code, val AS val1, 0 AS val2 FROM t1')
+        assert get_definition_hash(registry, 'testview') is None
+        view.ddl(None, registry.session.connection())
+        assert get_definition_hash(
+            registry, 'testview') == view.ddl.definition_hash
+        assert registry.execute(
+            "select count(*) from pg_indexes "
+            "where indexname = 'anyblok_ix_testview__val1'").scalar()
+        assert sorted(registry.TestView.query('val2').all()) == [(2,), (4,)]
+
     def test_view_update_method(self, registry_simple_view):
         registry = registry_simple_view
         registry.TestView.refresh_materialized_view()
@@ -111,6 +443,104 @@ class TestSimpleView:
                 registry.TestView.delete_sql_statement())
 
 
+def view_with_long_names():
+
+    @register(Model)
+    class T1:
+        id = Integer(primary_key=True)
+        code = String()
+        val = Integer()
+
+    @register(Model, factory=MaterializedViewFactory)
+    class TestLongView:
+        code = String(primary_key=True)
+        amount_of_the_invoices_in_currency_of_company = Integer(index=True)
+        amount_of_the_invoices_in_currency_of_customer = Integer(index=True)
+
+        @classmethod
+        def sqlalchemy_view_declaration(cls):
+            T1 = cls.anyblok.T1
+            return select([
+                T1.code.label('code'),
+                T1.val.label('amount_of_the_invoices_in_currency_of_company'),
+                T1.val.label('amount_of_the_invoices_in_currency_of_customer'),
+            ])
+
+
+@pytest.fixture(scope="class")
+def registry_view_with_long_names(request, bloks_loaded):
+    registry = init_registry_with_bloks([], view_with_long_names)
+    request.addfinalizer(registry.close)
+    registry.T1.insert(code='test1', val=1)
+    return registry
+
+
+class TestViewWithLongNames:
+
+    @pytest.fixture(autouse=True)
+    def transact(self, request, registry_view_with_long_names):
+        transaction = registry_view_with_long_names.begin_nested()
+        request.addfinalizer(transaction.rollback)
+
+    def get_indexes(self, registry):
+        return sorted(registry.execute(
+            "select indexname, indexdef from pg_indexes "
+            "where tablename = 'testlongview'").fetchall())
+
+    def test_index_name(self):
+        assert index_name('testview', 'pk', unique=True) == (
+            'anyblok_uix_testview__pk')
+        name = index_name('testview', 'x' * 60)
+        assert len(name) == 55
+        assert name != index_name('testview', 'x' * 61)
+        assert name[:46] == index_name('testview', 'x' * 61)[:46]
+
+    def test_indexes(self, registry_view_with_long_names):
+        registry = registry_view_with_long_names
+        indexes = self.get_indexes(registry)
+        assert len(indexes) == 3
+        assert all(len(name) <= 55 for name, definition in indexes)
+        assert sorted(definition.split(' USING btree ')[1]
+                      for name, definition in indexes) == [
+            '(amount_of_the_invoices_in_currency_of_company)',
+            '(amount_of_the_invoices_in_currency_of_customer)',
+            '(code)']
+
+    def test_refresh_swap(self, registry_view_with_long_names):
+        registry = registry_view_with_long_names
+        indexes = self.get_indexes(registry)
+        registry.TestLongView.refresh_materialized_view(
+            strategy='swap')
+        assert self.get_indexes(registry) == indexes
+        assert registry.TestLongView.query().count() == 1
+
+
+class TestScheduleRefresh:
+
+    @pytest.fixture
+    def registry(self, request, bloks_loaded):
+        registry = init_registry_with_bloks([], simple_view)
+        request.addfinalizer(registry.close)
+        registry.T1.insert(code='test1', val=1)
+        registry.T2.insert(code='test1', val=2)
+        return registry
+
+    def test_refresh_after_commit(self, registry):
+        registry.TestView.schedule_refresh()
+        registry.TestView.schedule_refresh()
+        assert len(EnvironmentManager.get('_postcommit_hook')) == 1
+        assert registry.TestView.query().count() == 0
+        registry.commit()
+        assert EnvironmentManager.get('_postcommit_hook') == []
+        assert registry.TestView.query().one().val2 == 2
+        assert not registry.TestView.is_stale()
+
+    def test_no_refresh_after_rollback(self, registry):
+        registry.TestView.schedule_refresh()
+        registry.rollback()
+        assert EnvironmentManager.get('_postcommit_hook') == []
+
+
 def view_with_relationship():
 
     @register(Model)
@@ -518,11 +948,32 @@ def simple_view_without_view_declaration():
         val2 = Integer()
 
 
+def simple_view_with_invalid_refresh_policy():
+
+    @register(Model)
+    class T1:
+        id = Integer(primary_key=True)
+        code = String()
+        val = Integer()
+
+    @register(Model, factory=MaterializedViewFactory)
+    class TestView:
+        refresh_policy = 'never'
+        code = String(primary_key=True)
+        val = Integer()
+
+        @classmethod
+        def sqlalchemy_view_declaration(cls):
+            T1 = cls.anyblok.T1
+            return select([T1.code.label('code'), T1.val.label('val')])
+
+
 @pytest.fixture(
     scope="class",
     params=[
         simple_view_without_primary_key,
         simple_view_without_view_declaration,
+        simple_view_with_invalid_refresh_policy,
     ]
 )
 def registry_view_with_exception(request, bloks_loaded):
@@ -607,6 +1058,44 @@ def simple_view_with_data():
             return query.where(T1.code == T2.code)
 
 
+def simple_view_with_warm_up(unpopulated_read):
+
+    def declare():
+
+        @register(Model)
+        class T1:
+            id = Integer(primary_key=True)
+            code = String()
+            val = Integer()
+
+        @register(Model)
+        class T2:
+            id = Integer(primary_key=True)
+            code = String()
+            val = Integer()
+
+        @register(Model, factory=MaterializedViewFactory)
+        class TestView:
+            warm_up = True
+            code = String(primary_key=True)
+            val1 = Integer()
+            val2 = Integer()
+
+            @classmethod
+            def sqlalchemy_view_declaration(cls):
+                T1 = cls.anyblok.T1
+                T2 = cls.anyblok.T2
+                query = select([T1.code.label('code'),
+                                T1.val.label('val1'),
+                                T2.val.label('val2')])
+                return query.where(T1.code == T2.code)
+
+        TestView.unpopulated_read = unpopulated_read
+        TestView.unpopulated_timeout = 0.2
+
+    return declare
+
+
 class TestView:
 
     @contextmanager
@@ -660,3 +1149,628 @@ class TestView:
             assert v1.val2 == 2
             assert v2.val1 == 3
             assert v2.val2 == 4
+
+    def test_simple_view_with_warm_up(self, bloks_loaded, monkeypatch):
+        function = simple_view_with_warm_up('fallback')
+        with self.get_registry(function) as registry:
+            TestView = registry.TestView
+            requests = []
+            monkeypatch.setattr(TestView, 'refresh_in_background',
+                                lambda: requests.append(True))
+            assert is_populated(registry, TestView.__view__) is False
+            query = TestView.query().filter(TestView.code == 'test1')
+            assert 'FROM testview' not in str(query)
+            assert query.one().val2 == 2
+            assert TestView.query('val1').order_by('val1').all() == [
+                (1,), (3,)]
+            assert len(requests) == 2
+            warm_up_materialized_views(registry, background=False)
+            assert is_populated(registry, TestView.__view__) is True
+            query = TestView.query().filter(TestView.code == 'test1')
+            assert 'FROM testview' in str(query)
+            assert query.one().val2 == 2
+            assert warm_up_materialized_views(registry) is None
+
+    def test_simple_view_with_warm_up_wait(self, bloks_loaded):
+        with self.get_registry(simple_view_with_warm_up('wait')) as registry:
+            with pytest.raises(ViewException):
+                registry.TestView.query().all()
+
+            warm_up_materialized_views(registry, background=False)
+            assert len(registry.TestView.query().all()) == 2
+
+
+def simple_view_with_incremental_refresh():
+
+    @register(Model)
+    class T1:
+        id = Integer(primary_key=True)
+        code = String()
+        val = Integer()
+
+    @register(Model)
+    class T2:
+        id = Integer(primary_key=True)
+        code = String()
+        val = Integer()
+
+    @register(Model, factory=MaterializedViewFactory)
+    class TestView:
+        incremental_refresh = True
+        code = String(primary_key=True)
+        val1 = Integer()
+        val2 = Integer()
+
+        @classmethod
+        def sqlalchemy_view_declaration(cls):
+            T1 = cls.anyblok.T1
+            T2 = cls.anyblok.T2
+            query = select([T1.code.label('code'),
+                            T1.val.label('val1'),
+                            T2.val.label('val2')])
+            return query.where(T1.code == T2.code)
+
+
+def group_by_view_with_incremental_refresh():
+
+    @register(Model)
+    class T1:
+        id = Integer(primary_key=True)
+        code = String()
+        val = Integer()
+
+    @register(Model)
+    class T2:
+        id = Integer(primary_key=True)
+        code = String()
+        val = Integer()
+
+    @register(Model, factory=MaterializedViewFactory)
+    class TestView:
+        incremental_refresh = True
+        code = String(primary_key=True)
+        val1 = Integer()
+        val2 = Integer()
+
+        @classmethod
+        def sqlalchemy_view_declaration(cls):
+            T1 = cls.anyblok.T1
+            T2 = cls.anyblok.T2
+            query = select([T2.code.label('code'),
+                            func.sum(T1.val).label('val1'),
+                            func.count(T2.val).label('val2')])
+            query = query.select_from(
+                join(T1.__table__, T2.__table__, T1.code == T2.code))
+            return query.group_by(T2.code)
+
+
+@pytest.fixture(
+    scope="class",
+    params=[
+        simple_view_with_incremental_refresh,
+        group_by_view_with_incremental_refresh,
+    ]
+)
+def registry_view_with_incremental_refresh(request, bloks_loaded):
+    registry = init_registry_with_bloks([], request.param)
+    request.addfinalizer(registry.close)
+    registry.T1.insert(code='test1', val=1)
+    registry.T2.insert(code='test1', val=2)
+    registry.T1.insert(code='test2', val=3)
+    registry.T2.insert(code='test2', val=4)
+    return registry
+
+
+class TestViewWithIncrementalRefresh:
+
+    @pytest.fixture(autouse=True)
+    def transact(self, request, registry_view_with_incremental_refresh):
+        transaction = registry_view_with_incremental_refresh.begin_nested()
+        request.addfinalizer(transaction.rollback)
+
+    def get_values(self, registry):
+        TestView = registry.TestView
+        return {x.code: x.val1 for x in TestView.query().all()}
+
+    def count_changes(self, registry):
+        return registry.execute(
+            'select count(*) from testview__changes').fetchone()[0]
+
+    def test_is_incremental(self, registry_view_with_incremental_refresh):
+        registry = registry_view_with_incremental_refresh
+        assert registry.TestView.__view__.incremental is not None
+
+    def test_refresh(self, registry_view_with_incremental_refresh):
+        registry = registry_view_with_incremental_refresh
+        registry.TestView.refresh_materialized_view()
+        assert self.get_values(registry) == {'test1': 1, 'test2': 3}
+        assert self.count_changes(registry) == 0
+        registry.T1.insert(code='test3', val=5)
+        registry.T2.insert(code='test3', val=6)
+        t1 = registry.T1.query().filter_by(code='test1').one()
+        t1.val = 10
+        registry.T1.query().filter_by(code='test2').delete()
+        registry.flush()
+        assert self.get_values(registry) == {'test1': 1, 'test2': 3}
+        assert self.count_changes(registry) > 0
+        registry.TestView.refresh_materialized_view()
+        assert self.get_values(registry) == {'test1': 10, 'test3': 5}
+        assert self.count_changes(registry) == 0
+
+    def test_full_refresh(self, registry_view_with_incremental_refresh):
+        registry = registry_view_with_incremental_refresh
+        t2 = registry.T1.query().filter_by(code='test2').one()
+        t2.val = 7
+        registry.TestView.refresh_materialized_view(full=True)
+        assert self.count_changes(registry) == 0
+        assert self.get_values(registry) == {'test1': 1, 'test2': 7}
+
+    def test_rebuild(self, registry_view_with_incremental_refresh):
+        registry = registry_view_with_incremental_refresh
+        registry.execute(
+            "COMMENT ON TABLE testview IS 'anyblok_postgres:other'")
+        view = registry.TestView.__view__
+        view.ddl(None, registry.session.connection())
+        assert self.get_values(registry) == {'test1': 1, 'test2': 3}
+        t2 = registry.T1.query().filter_by(code='test2').one()
+        t2.val = 7
+        registry.TestView.refresh_materialized_view()
+        assert self.get_values(registry) == {'test1': 1, 'test2': 7}
+
+    def get_aggregates(self, plan):
+        if plan['Node Type'] == 'Aggregate':
+            yield plan
+
+        for child in plan.get('Plans', ()):
+            yield from self.get_aggregates(child)
+
+    def test_changed_rows_query(self, registry_view_with_incremental_refresh):
+        registry = registry_view_with_incremental_refresh
+        registry.TestView.refresh_materialized_view()
+        t1 = registry.T1.query().filter_by(code='test1').one()
+        t1.val = 10
+        registry.flush()
+        incremental = registry.TestView.__view__.incremental
+        registry.execute(CollectChanges(incremental.name, incremental.keys))
+        query = incremental.get_changed_rows_query().compile(
+            dialect=registry.bind.dialect,
+            compile_kwargs={'literal_binds': True})
+        plan = registry.execute(
+            'EXPLAIN (ANALYZE, FORMAT JSON) %s' % query).scalar()[0]['Plan']
+        assert plan['Actual Rows'] == 1
+        for aggregate in self.get_aggregates(plan):
+            assert aggregate['Actual Rows'] == 1
+
+
+def or_view_with_incremental_refresh():
+
+    @register(Model)
+    class T1:
+        id = Integer(primary_key=True)
+        code = String()
+        val = Integer()
+
+    @register(Model)
+    class T2:
+        id = Integer(primary_key=True)
+        code = String()
+        val = Integer()
+
+    @register(Model, factory=MaterializedViewFactory)
+    class TestView:
+        incremental_refresh = True
+        id = Integer(primary_key=True)
+        val1 = Integer()
+        val2 = Integer()
+
+        @classmethod
+        def sqlalchemy_view_declaration(cls):
+            T1 = cls.anyblok.T1
+            T2 = cls.anyblok.T2
+            query = select([T1.id.label('id'),
+                            T1.val.label('val1'),
+                            T2.val.label('val2')])
+            return query.where(
+                (T1.code == T2.code) | (T2.id == T1.id))
+
+
+def union_view_with_incremental_refresh():
+
+    @register(Model)
+    class T1:
+        id = Integer(primary_key=True)
+        code = String()
+        val = Integer()
+
+    @register(Model)
+    class T2:
+        id = Integer(primary_key=True)
+        code = String()
+        val = Integer()
+
+    @register(Model, factory=MaterializedViewFactory)
+    class TestView:
+        incremental_refresh = True
+        code = String(primary_key=True)
+        val1 = Integer()
+
+        @classmethod
+        def sqlalchemy_view_declaration(cls):
+            T1 = cls.anyblok.T1
+            T2 = cls.anyblok.T2
+            return union(
+                select([T1.code.label('code'), T1.val.label('val1')]),
+                select([T2.code.label('code'), T2.val.label('val1')]))
+
+
+class TestViewWithIncrementalRefreshFallback:
+
+    def test_get_equivalent_columns(self):
+        t1 = expression.table('t1', expression.column('id'),
+                              expression.column('code'))
+        t2 = expression.table('t2', expression.column('id'),
+                              expression.column('code'))
+        query = select([t1.c.id]).where(
+            (t1.c.code == t2.c.code) & (
+                (t1.c.id == t2.c.id) | t2.c.id.is_(None)) &
+            ~(t1.c.id == t2.c.code))
+        assert get_equivalent_columns([t1, t2], query) == {
+            t1.c.code: [t1.c.code, t2.c.code],
+            t2.c.code: [t1.c.code, t2.c.code],
+        }
+
+    def get_source_tables(self):
+        metadata = MetaData()
+        return [
+            Table(name, metadata,
+                  SaColumn('id', types.Integer, primary_key=True),
+                  SaColumn('code', types.String),
+                  SaColumn('val', types.Integer))
+            for name in ('t1', 't2')]
+
+    def test_supported_shape(self):
+        t1, t2 = self.get_source_tables()
+        query = select([t1.c.id, func.sum(t2.c.val).label('val')]).where(
+            t1.c.id == t2.c.id).group_by(t1.c.id)
+        assert IncrementalRefresh.from_selectable(
+            'testview', query, ['id']) is not None
+
+    @pytest.mark.parametrize('shape', [
+        'correlated exists', 'scalar subquery', 'uncorrelated subquery',
+        'window function', 'distinct on', 'other relation'])
+    def test_unsupported_shapes(self, shape):
+        t1, t2 = self.get_source_tables()
+        t3 = expression.table('t3', expression.column('val'))
+        query = select([t1.c.id, t1.c.val])
+        if shape == 'correlated exists':
+            query = query.where(exists().where(t2.c.code == t1.c.code))
+        elif shape == 'scalar subquery':
+            query = select([t1.c.id, select([func.max(t2.c.val)]).where(
+                t2.c.code == t1.c.code).scalar_subquery().label('val')])
+        elif shape == 'uncorrelated subquery':
+            query = query.where(
+                t1.c.val < select([func.max(t2.c.val)]).scalar_subquery())
+        elif shape == 'window function':
+            query = select([t1.c.id, func.sum(t1.c.val).over().label('val')])
+        elif shape == 'distinct on':
+            query = query.distinct(t1.c.code)
+        else:
+            query = query.where(t1.c.val == t3.c.val)
+
+        assert IncrementalRefresh.from_selectable(
+            'testview', query, ['id']) is None
+
+    def test_long_names(self):
+        t1, t2 = self.get_source_tables()
+        dialect = postgresql.dialect()
+        names = set()
+        for name in ('view_with_a_long_name_to_check_the_truncated_names_1',
+                     'view_with_a_long_name_to_check_the_truncated_names_2'):
+            view_names = {
+                change_function_name(name, 'other_table_with_a_long_name'),
+                change_trigger_name(name + '_and_more'),
+                change_log_name(name + '_and_more'),
+                pending_name(name + '_and_more'),
+            }
+            trigger = str(CreateChangeTrigger(
+                name + '_and_more', t1, [t1.c.id], ['id']).compile(
+                    dialect=dialect))
+            assert change_trigger_name(name + '_and_more') in trigger
+            assert change_log_name(name + '_and_more') in trigger
+            names.update(view_names)
+
+        assert len(names) == 8
+        assert all(len(name) == 63 for name in names)
+
+    def test_or(self, bloks_loaded):
+        registry = init_registry_with_bloks(
+            [], or_view_with_incremental_refresh)
+        try:
+            assert registry.TestView.__view__.incremental is None
+        finally:
+            registry.close()
+
+    def test_union(self, bloks_loaded):
+        registry = init_registry_with_bloks(
+            [], union_view_with_incremental_refresh)
+        try:
+            TestView = registry.TestView
+            assert TestView.__view__.incremental is None
+            registry.T1.insert(code='test1', val=1)
+            registry.T2.insert(code='test2', val=2)
+            TestView.refresh_materialized_view()
+            assert TestView.query().count() == 2
+        finally:
+            registry.close()
+
+
+def view_on_view():
+
+    @register(Model)
+    class T1:
+        id = Integer(primary_key=True)
+        code = String()
+        val = Integer()
+
+    @register(Model, factory=MaterializedViewFactory)
+    class TestView:
+        code = String(primary_key=True)
+        val = Integer()
+
+        @classmethod
+        def sqlalchemy_view_declaration(cls):
+            T1 = cls.anyblok.T1
+            return select([T1.code.label('code'), T1.val.label('val')])
+
+    @register(Model, factory=MaterializedViewFactory)
+    class TestViewOnView:
+        code = String(primary_key=True)
+        val = Integer()
+
+        @classmethod
+        def sqlalchemy_view_declaration(cls):
+            TestView = cls.anyblok.TestView
+            return select([TestView.code.label('code'),
+                           (TestView.val * 2).label('val')])
+
+    @register(Model, factory=MaterializedViewFactory)
+    class TestOtherView:
+        code = String(primary_key=True)
+        val = Integer()
+
+        @classmethod
+        def sqlalchemy_view_declaration(cls):
+            T1 = cls.anyblok.T1
+            return select([T1.code.label('code'), (T1.val + 1).label('val')])
+
+
+@pytest.fixture(scope="class")
+def registry_view_on_view(request, bloks_loaded):
+    registry = init_registry_with_bloks([], view_on_view)
+    request.addfinalizer(registry.close)
+    return registry
+
+
+class TestRefreshAllMaterializedViews:
+
+    @pytest.fixture(autouse=True)
+    def transact(self, request, registry_view_on_view):
+        transaction = registry_view_on_view.begin_nested()
+        request.addfinalizer(transaction.rollback)
+
+    def test_get_materialized_views(self, registry_view_on_view):
+        registry = registry_view_on_view
+        assert set(get_materialized_views(registry)) == {
+            'testview', 'testviewonview', 'testotherview'}
+
+    def test_get_view_dependencies(self, registry_view_on_view):
+        registry = registry_view_on_view
+        assert get_view_dependencies(
+            registry, {'testview', 'testviewonview', 'testotherview'}) == {
+                'testview': set(),
+                'testviewonview': {'testview'},
+                'testotherview': set(),
+        }
+
+    def test_is_stale_after_refresh_of_source_view(
+        self, registry_view_on_view
+    ):
+        registry = registry_view_on_view
+        refresh_all_materialized_views(registry)
+        assert not registry.TestViewOnView.is_stale()
+        registry.TestView.refresh_materialized_view()
+        assert registry.TestViewOnView.is_stale()
+        assert not registry.TestOtherView.is_stale()
+
+    def test_refresh_all(self, registry_view_on_view):
+        registry = registry_view_on_view
+        registry.T1.insert(code='test1', val=1)
+        refresh_all_materialized_views(registry)
+        assert registry.TestViewOnView.query().one().val == 2
+        assert registry.TestOtherView.query().one().val == 2
+
+    def test_rebuild_with_dependent_views(self, registry_view_on_view):
+        registry = registry_view_on_view
+        registry.T1.insert(code='test1', val=1)
+        refresh_all_materialized_views(registry)
+        registry.execute(
+            "CREATE VIEW testplainview AS "
+            "SELECT code, val FROM testviewonview WHERE code LIKE 'test%'")
+        registry.execute(
+            'CREATE INDEX "custom index" ON testviewonview (val)')
+        registry.execute(
+            "COMMENT ON MATERIALIZED VIEW testview "
+            "IS 'anyblok_postgres:other'")
+        view = registry.TestView.__view__
+        view.ddl(None, registry.session.connection())
+        assert get_definition_hash(
+            registry, 'testview') == view.ddl.definition_hash
+        assert get_definition_hash(
+            registry, 'testviewonview'
+        ) == registry.TestViewOnView.__view__.ddl.definition_hash
+        assert registry.TestView.query().one().val == 1
+        assert registry.TestViewOnView.query().one().val == 2
+        assert registry.execute(
+            'select val from testplainview').scalar() == 2
+        assert {x for x, in registry.execute(
+            "select indexname from pg_indexes "
+            "where tablename in ('testview', 'testviewonview')")} == {
+                'anyblok_uix_testview__pk', 'anyblok_uix_testviewonview__pk',
+                'custom index'}
+        assert not registry.execute(
+            "select count(*) from pg_class "
+            "where relname like '%\\_\\_shadow'").scalar()
+
+    def test_get_refresh_order(self):
+        assert get_refresh_order({
+            'c': {'b'}, 'b': {'a'}, 'a': set(), 'd': set()
+        }) == ['a', 'd', 'b', 'c']
+
+    def test_get_refresh_order_with_cycle(self):
+        with pytest.raises(ViewException):
+            get_refresh_order({'a': {'b'}, 'b': {'a'}})
+
+
+def partitioned_view():
+
+    @register(Model)
+    class T1:
+        id = Integer(primary_key=True)
+        code = String()
+        date = Date()
+        val = Integer()
+
+    @register(Model, factory=MaterializedViewFactory)
+    class TestView:
+        partition_key = 'date'
+        code = String(primary_key=True)
+        date = Date(primary_key=True)
+        val = Integer(index=True)
+
+        @classmethod
+        def sqlalchemy_view_declaration(cls):
+            T1 = cls.anyblok.T1
+            return select([T1.code.label('code'), T1.date.label('date'),
+                           T1.val.label('val')])
+
+        @classmethod
+        def sqlalchemy_view_partitions(cls):
+            return {
+                '2018_01': (date(2018, 1, 1), date(2018, 2, 1)),
+                '2018_02': (date(2018, 2, 1), date(2018, 3, 1)),
+            }
+
+
+@pytest.fixture(scope="class")
+def registry_partitioned_view(request, bloks_loaded):
+    registry = init_registry_with_bloks([], partitioned_view)
+    request.addfinalizer(registry.close)
+    registry.T1.insert(code='test1', date=date(2018, 1, 15), val=1)
+    registry.T1.insert(code='test2', date=date(2018, 2, 15), val=2)
+    registry.T1.insert(code='test3', date=date(2019, 1, 1), val=3)
+    registry.T1.insert(code='test4', val=4)
+    return registry
+
+
+class TestPartitionedView:
+
+    @pytest.fixture(autouse=True)
+    def transact(self, request, registry_partitioned_view):
+        transaction = registry_partitioned_view.begin_nested()
+        request.addfinalizer(transaction.rollback)
+
+    def test_relations(self, registry_partitioned_view):
+        registry = registry_partitioned_view
+        assert {x for x, in registry.execute(
+            "select matviewname from pg_matviews "
+            "where matviewname like 'testview%'")} == {
+                'testview__2018_01', 'testview__2018_02',
+                'testview__default'}
+        assert registry.execute(
+            "select count(*) from pg_views "
+            "where viewname = 'testview'").scalar() == 1
+        indexes = {x for x, in registry.execute(
+            "select indexname from pg_indexes "
+            "where tablename = 'testview__2018_01'")}
+        assert indexes == {'anyblok_uix_testview__2018_01__pk',
+                           'anyblok_ix_testview__2018_01__val'}
+
+    def test_refresh(self, registry_partitioned_view):
+        registry = registry_partitioned_view
+        TestView = registry.TestView
+        TestView.refresh_materialized_view()
+        assert {(x.code, x.val) for x in TestView.query()} == {
+            ('test1', 1), ('test2', 2), ('test3', 3), ('test4', 4)}
+        assert registry.execute(
+            "select count(*) from testview__default").scalar() == 2
+
+    def test_refresh_partitions(self, registry_partitioned_view):
+        registry = registry_partitioned_view
+        TestView = registry.TestView
+        TestView.refresh_materialized_view()
+        registry.T1.query().update({'val': registry.T1.val + 10})
+        TestView.refresh_materialized_view(partitions=['2018_02'])
+        assert TestView.is_stale()
+        assert {(x.code, x.val) for x in TestView.query()} == {
+            ('test1', 1), ('test2', 12), ('test3', 3), ('test4', 4)}
+        TestView.refresh_materialized_view(concurrently=True)
+        assert not TestView.is_stale()
+        assert {x.val for x in TestView.query()} == {11, 12, 13, 14}
+
+    def test_partitions_excluded_by_the_key(self, registry_partitioned_view):
+        registry = registry_partitioned_view
+        registry.execute('set local constraint_exclusion = on')
+        plan = '\n'.join(x for x, in registry.execute(
+            "explain select * from testview "
+            "where date >= '2018-02-01' and date < '2018-03-01'"))
+        assert 'testview__2018_02' in plan
+        assert 'testview__2018_01' not in plan
+
+    def test_view_recreated_if_the_definition_changed(
+        self, registry_partitioned_view
+    ):
+        registry = registry_partitioned_view
+        view = registry.TestView.__view__
+        registry.execute('CREATE MATERIALIZED VIEW testview__2017 AS SELECT 1')
+        registry.execute("COMMENT ON VIEW testview IS 'anyblok_postgres:other'")
+        view.ddl(None, registry.session.connection())
+        assert {x for x, in registry.execute(
+            "select matviewname from pg_matviews "
+            "where matviewname like 'testview%'")} == {
+                'testview__2018_01', 'testview__2018_02',
+                'testview__default'}
+        registry.TestView.refresh_materialized_view()
+        assert registry.TestView.query().count() == 4
+
+    def test_refresh_unknown_partition(self, registry_partitioned_view):
+        with pytest.raises(ViewException):
+            registry_partitioned_view.TestView.refresh_materialized_view(
+                partitions=['2017_12'])
+
+    def test_refresh_swap(self, registry_partitioned_view):
+        with pytest.raises(ViewException):
+            registry_partitioned_view.TestView.refresh_materialized_view(
+                strategy='swap')
+
+    @pytest.mark.parametrize('partitions', [
+        {'2018': (date(2018, 1, 1), date(2019, 1, 1)),
+         '2018_06': (date(2018, 6, 1), date(2018, 7, 1))},
+        {'before': (None, date(2018, 2, 1)),
+         'after': (date(2018, 1, 1), None)},
+        {'before': (None, date(2018, 1, 1)),
+         'all': (None, None)},
+        {'empty': (date(2018, 2, 1), date(2018, 1, 1))},
+        {'empty': (date(2018, 1, 1), date(2018, 1, 1))},
+    ])
+    def test_invalid_partitions(self, registry_partitioned_view, partitions):
+        TestView = registry_partitioned_view.TestView
+        with pytest.raises(ViewException):
+            Partitioning('testview', TestView.sqlalchemy_view_declaration(),
+                         'date', partitions)
+
+    def test_adjacent_partitions(self, registry_partitioned_view):
+        TestView = registry_partitioned_view.TestView
+        Partitioning('testview', TestView.sqlalchemy_view_declaration(),
+                     'date', {'before': (None, date(2018, 1, 1)),
+                              '2018': (date(2018, 1, 1), date(2019, 1, 1)),
+                              'after': (date(2019, 1, 1), None)})
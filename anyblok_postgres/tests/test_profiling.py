@@ -0,0 +1,174 @@
+# This file is a part of the AnyBlok / Postgres project
+#
+#    Copyright (C) 2026 Jean-Sebastien SUZANNE <js.suzanne@gmail.com>
+#
+# This Source Code Form is subject to the terms of the Mozilla Public License,
+# v. 2.0. If a copy of the MPL was not distributed with this file,You can
+# obtain one at http://mozilla.org/MPL/2.0/.
+import pytest
+from os import urandom
+from psycopg2.extras import register_default_jsonb
+from anyblok import Declarations
+from anyblok.column import Integer, String
+from anyblok.tests.conftest import init_registry_with_bloks
+from sqlalchemy import event
+from sqlalchemy.sql import select
+from anyblok_postgres.column import Jsonb, LargeObject
+from anyblok_postgres.materialized_view import MaterializedViewFactory
+from anyblok_postgres.profiling import (
+    OpenTelemetryExporter, Span, profiler)
+
+register = Declarations.register
+Model = Declarations.Model
+
+
+def profiled_models():
+
+    @register(Model)
+    class T1:
+        id = Integer(primary_key=True)
+        code = String()
+        doc = Jsonb()
+        data = LargeObject()
+
+    @register(Model, factory=MaterializedViewFactory)
+    class TestProfiledView:
+        code = String(primary_key=True)
+
+        @classmethod
+        def sqlalchemy_view_declaration(cls):
+            T1 = cls.anyblok.T1
+            return select([T1.code.label('code')])
+
+
+@pytest.fixture(scope="class")
+def registry_profiled_models(request, bloks_loaded):
+    registry = init_registry_with_bloks([], profiled_models)
+    request.addfinalizer(registry.close)
+    return registry
+
+
+class FakeTracer:
+
+    def __init__(self):
+        self.spans = []
+
+    def start_span(self, name, start_time=None, attributes=None):
+        tracer = self
+
+        class FakeSpan:
+
+            def end(self, end_time=None):
+                tracer.spans.append((name, start_time, end_time, attributes))
+
+        return FakeSpan()
+
+
+class TestProfiling:
+
+    @pytest.fixture(autouse=True)
+    def transact(self, request, registry_profiled_models):
+        transaction = registry_profiled_models.begin_nested()
+        request.addfinalizer(transaction.rollback)
+
+    def test_disabled(self):
+        assert not profiler.enabled
+        with profiler.span('test') as span:
+            assert span is None
+
+    def test_large_object(self, registry_profiled_models):
+        registry = registry_profiled_models
+        data = urandom(1000)
+        with profiler.report(registry) as report:
+            test = registry.T1.insert(code='test1', data=data)
+            assert test.data == data
+            test.data = None
+
+        summary = report.summary()
+        write = summary[('large_object.write', 'Model.T1', 'data')]
+        assert (write['count'], write['bytes'], write['round_trips']) == (
+            1, 1000, 4)
+        read = summary[('large_object.read', 'Model.T1', 'data')]
+        assert (read['bytes'], read['round_trips']) == (1000, 6)
+        unlink = summary[('large_object.unlink', 'Model.T1', 'data')]
+        assert unlink['round_trips'] == 3
+        assert summary[('sql', None, None)]['round_trips'] > 0
+        assert 'large_object.write' in report.format()
+        assert not profiler.enabled
+
+    def test_jsonb(self, registry_profiled_models):
+        registry = registry_profiled_models
+        with profiler.report(registry) as report:
+            registry.T1.insert(code='test1', doc={'a': 'test'})
+            assert registry.T1.query('doc').scalar() == {'a': 'test'}
+
+        summary = report.summary()
+        assert summary[('jsonb.encode', None, None)]['bytes'] == len(
+            '{"a": "test"}')
+        assert summary[('jsonb.decode', None, None)]['count'] == 1
+
+    def test_jsonb_decoder_restored(self, registry_profiled_models):
+        registry = registry_profiled_models
+        connection = registry.session.connection().connection.connection
+        typecasters = set(connection.string_types)
+        with profiler.report(registry):
+            assert set(connection.string_types) == typecasters
+            registry.execute('SELECT 1')
+            installed = set(connection.string_types) - typecasters
+            assert installed
+            with profiler.report(registry):
+                pass
+
+            assert installed <= set(connection.string_types)
+
+        assert set(connection.string_types) == typecasters
+        assert not profiler.jsonb_connections
+        assert not event.contains(registry.bind.engine, 'checkout',
+                                  profiler.checkout_connection)
+        assert not event.contains(registry.bind, 'before_cursor_execute',
+                                  profiler.before_cursor_execute)
+        registry.T1.insert(code='test1', doc={'a': 'test'})
+        with profiler.report() as report:
+            assert registry.T1.query('doc').scalar() == {'a': 'test'}
+
+        assert ('jsonb.decode', None, None) not in report.summary()
+
+    def test_jsonb_previous_decoder_restored(self, registry_profiled_models):
+        registry = registry_profiled_models
+        connection = registry.session.connection().connection.connection
+        typecasters = dict(connection.string_types)
+        register_default_jsonb(conn_or_curs=connection,
+                               loads=lambda document: 'previous')
+        try:
+            registry.T1.insert(code='test1', doc={'a': 'test'})
+            with profiler.report(registry) as report:
+                assert registry.T1.query('doc').scalar() == {'a': 'test'}
+
+            assert report.summary()[('jsonb.decode', None, None)]['count']
+            assert registry.T1.query('doc').scalar() == 'previous'
+        finally:
+            connection.string_types.clear()
+            connection.string_types.update(typecasters)
+
+    def test_hook(self, registry_profiled_models):
+        registry = registry_profiled_models
+        spans = []
+        profiler.add_hook(spans.append, registry=registry)
+        try:
+            registry.TestProfiledView.refresh_materialized_view()
+        finally:
+            profiler.remove_hook(spans.append)
+
+        assert [(x.name, x.attributes) for x in spans] == [
+            ('view.refresh', dict(view='testprofiledview',
+                                  mode='blocking'))]
+        assert spans[0].end_time >= spans[0].start_time
+
+    def test_open_telemetry_exporter(self):
+        tracer = FakeTracer()
+        span = Span('large_object.read', dict(bytes=10, model=None))
+        span.duration = 0.5
+        OpenTelemetryExporter(tracer)(span)
+        assert tracer.spans == [
+            ('large_object.read', span.start_time,
+             span.start_time + 500000000, dict(bytes=10))]
@@ -0,0 +1,132 @@
+# This file is a part of the AnyBlok / Postgres project
+#
+#    Copyright (C) 2026 Jean-Sebastien SUZANNE <js.suzanne@gmail.com>
+#
+# This Source Code Form is subject to the terms of the Mozilla Public License,
+# v. 2.0. If a copy of the MPL was not distributed with this file,You can
+# obtain one at http://mozilla.org/MPL/2.0/.
+import pytest
+import pickle
+from datetime import date
+from types import ModuleType
+from anyblok_postgres.range import Range, find_overlaps, merge_ranges
+from anyblok_postgres import range as pgrange
+
+
+class TestRange:
+
+    def test_immutable(self):
+        value = Range(1, 3)
+        with pytest.raises(AttributeError):
+            value.lower = 2
+
+        assert not hasattr(value, '__dict__')
+
+    def test_invalid_bounds(self):
+        with pytest.raises(ValueError):
+            Range(1, 3, '[[')
+
+    def test_attributes(self):
+        value = Range(None, 3, '[]')
+        assert value.lower_inf
+        assert not value.lower_inc
+        assert value.upper_inc
+        assert value.bounds == '(]'
+        assert not Range(empty=True)
+        assert Range(empty=True).bounds == '()'
+
+    def test_hash_and_pickle(self):
+        value = Range(date(2018, 1, 1), date(2019, 1, 1))
+        assert value == Range(date(2018, 1, 1), date(2019, 1, 1))
+        assert len({value, Range(date(2018, 1, 1), date(2019, 1, 1))}) == 1
+        assert pickle.loads(pickle.dumps(value)) == value
+
+    def test_ordering(self):
+        values = [Range(1, 3, '()'), Range(None, 2), Range(1, 3, '[]'),
+                  Range(empty=True), Range(1, 3), Range(1, None)]
+        assert sorted(values) == [
+            Range(empty=True), Range(None, 2), Range(1, 3), Range(1, 3, '[]'),
+            Range(1, None), Range(1, 3, '()')]
+
+    def test_contains(self):
+        value = Range(1, 3)
+        assert value.contains(1)
+        assert 2 in value
+        assert not value.contains(3)
+        assert value.contains(Range(1, 2, '[]'))
+        assert not value.contains(Range(1, 3, '[]'))
+        assert value.contains(Range(empty=True))
+        assert Range().contains(Range(None, 5))
+        assert not Range(empty=True).contains(1)
+
+    def test_overlaps(self):
+        assert Range(1, 3).overlaps(Range(2, 5))
+        assert not Range(1, 3).overlaps(Range(3, 5))
+        assert Range(1, 3, '[]').overlaps(Range(3, 5))
+        assert Range(None, 3).overlaps(Range(None, 1))
+        assert not Range(1, 3).overlaps(Range(empty=True))
+
+    def test_intersection(self):
+        assert Range(1, 5).intersection(Range(3, 8, '(]')) == Range(
+            3, 5, '()')
+        assert Range(None, 5).intersection(Range(3, None)) == Range(3, 5)
+        assert Range(1, 3).intersection(Range(3, 5)).isempty
+
+    def test_driver(self):
+        from psycopg2.extras import NumericRange
+        value = Range(1, 3, '(]')
+        driver_value = value.to_driver(NumericRange)
+        assert isinstance(driver_value, NumericRange)
+        assert Range.from_driver(driver_value) == value
+        assert Range.from_driver(NumericRange(empty=True)).isempty
+
+    def test_from_driver_not_a_range(self):
+        with pytest.raises(TypeError):
+            Range.from_driver('[1,3)')
+
+    def test_get_driver_range(self):
+        import psycopg2
+        from psycopg2.extras import DateRange
+        assert pgrange.get_driver_range(psycopg2, 'DateRange') is DateRange
+        with pytest.raises(NotImplementedError) as excinfo:
+            pgrange.get_driver_range(ModuleType('otherdriver'), 'DateRange')
+
+        assert 'otherdriver' in str(excinfo.value)
+
+
+@pytest.fixture(params=[True, False], ids=['numpy', 'python'])
+def use_numpy(request):
+    if request.param and pgrange.numpy is None:
+        pytest.skip('NumPy is not installed')
+
+    return request.param
+
+
+class TestBatch:
+
+    def test_find_overlaps(self, use_numpy):
+        values = [Range(5, 8), Range(1, 3), Range(empty=True),
+                  Range(2, 6, '[]'), Range(8, 9), Range(None, 1, '[]')]
+        assert find_overlaps(values, use_numpy=use_numpy) == [
+            (0, 3), (1, 3), (1, 5)]
+
+    def test_merge_ranges(self, use_numpy):
+        values = [Range(5, 8), Range(1, 3), Range(3, 4), Range(empty=True),
+                  Range(10, 12, '()'), Range(12, None, '()'), Range(2, 3)]
+        assert merge_ranges(values, use_numpy=use_numpy) == [
+            Range(1, 4), Range(5, 8), Range(10, 12, '()'),
+            Range(12, None, '()')]
+
+    def test_merge_ranges_float(self, use_numpy):
+        values = [Range(0.5, 1.5, '[]'), Range(1.5, 2)]
+        merged = merge_ranges(values, use_numpy=use_numpy)
+        assert merged == [Range(0.5, 2)]
+        assert isinstance(merged[0].lower, float)
+
+    def test_numpy_not_used_for_dates(self):
+        values = [Range(date(2018, 1, 1), date(2018, 2, 1)),
+                  Range(date(2018, 1, 15), date(2018, 3, 1))]
+        assert not pgrange.use_numpy_for(values)
+        assert find_overlaps(values) == [(0, 1)]
+        assert merge_ranges(values) == [
+            Range(date(2018, 1, 1), date(2018, 3, 1))]
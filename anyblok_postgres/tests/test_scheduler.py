@@ -0,0 +1,144 @@
+# This file is a part of the AnyBlok / Postgres project
+#
+#    Copyright (C) 2026 Jean-Sebastien SUZANNE <js.suzanne@gmail.com>
+#
+# This Source Code Form is subject to the terms of the Mozilla Public License,
+# v. 2.0. If a copy of the MPL was not distributed with this file,You can
+# obtain one at http://mozilla.org/MPL/2.0/.
+import pytest
+from datetime import timedelta
+from anyblok import Declarations
+from anyblok.column import Integer, String
+from anyblok.tests.conftest import init_registry_with_bloks
+from sqlalchemy import text
+from sqlalchemy.sql import select
+from anyblok_postgres.materialized_view import (
+    MaterializedViewFactory, try_refresh_view, get_advisory_lock_key,
+    ADVISORY_LOCK_NAMESPACE)
+from anyblok_postgres.scheduler import RefreshScheduler
+
+register = Declarations.register
+Model = Declarations.Model
+
+
+def scheduled_views():
+
+    @register(Model)
+    class T1:
+        id = Integer(primary_key=True)
+        code = String()
+        val = Integer()
+
+    @register(Model, factory=MaterializedViewFactory)
+    class TestView:
+        refresh_interval = 60
+        code = String(primary_key=True)
+        val = Integer()
+
+        @classmethod
+        def sqlalchemy_view_declaration(cls):
+            T1 = cls.anyblok.T1
+            return select([T1.code.label('code'), T1.val.label('val')])
+
+    @register(Model, factory=MaterializedViewFactory)
+    class TestOtherView:
+        refresh_interval = timedelta(minutes=5)
+        refresh_policy = 'always'
+        code = String(primary_key=True)
+        val = Integer()
+
+        @classmethod
+        def sqlalchemy_view_declaration(cls):
+            T1 = cls.anyblok.T1
+            return select([T1.code.label('code'), (T1.val + 1).label('val')])
+
+    @register(Model, factory=MaterializedViewFactory)
+    class TestRequestedView:
+        code = String(primary_key=True)
+        val = Integer()
+
+        @classmethod
+        def sqlalchemy_view_declaration(cls):
+            T1 = cls.anyblok.T1
+            return select([T1.code.label('code'), (T1.val + 2).label('val')])
+
+
+@pytest.fixture(scope="class")
+def registry_scheduled_views(request, bloks_loaded):
+    registry = init_registry_with_bloks([], scheduled_views)
+    request.addfinalizer(registry.close)
+    return registry
+
+
+class TestRefreshScheduler:
+
+    @pytest.fixture(autouse=True)
+    def transact(self, request, registry_scheduled_views):
+        transaction = registry_scheduled_views.begin_nested()
+        request.addfinalizer(transaction.rollback)
+
+    def test_intervals(self, registry_scheduled_views):
+        registry = registry_scheduled_views
+        scheduler = RefreshScheduler(registry)
+        assert set(scheduler.due) == {'testview', 'testotherview'}
+        start = min(scheduler.due.values())
+        assert scheduler.due['testotherview'] - start == pytest.approx(240)
+
+    def test_run_pending(self, registry_scheduled_views):
+        registry = registry_scheduled_views
+        scheduler = RefreshScheduler(registry)
+        now = scheduler.due['testview']
+        registry.T1.insert(code='test1', val=1)
+        registry.flush()
+        assert scheduler.run_pending(bind=registry, now=now) == ['testview']
+        assert registry.TestView.query().one().val == 1
+        assert scheduler.due['testview'] == now + 60
+        assert scheduler.run_pending(bind=registry, now=now + 60) == []
+
+    def test_run_pending_with_always_policy(self, registry_scheduled_views):
+        registry = registry_scheduled_views
+        scheduler = RefreshScheduler(registry)
+        now = scheduler.due['testotherview']
+        assert scheduler.run_pending(bind=registry, now=now) == [
+            'testotherview', 'testview']
+        assert scheduler.run_pending(bind=registry, now=now + 300) == [
+            'testotherview']
+
+    def test_request_refresh_debounced(self, registry_scheduled_views):
+        registry = registry_scheduled_views
+        scheduler = RefreshScheduler(registry, debounce=1)
+        registry.T1.insert(code='test1', val=1)
+        registry.flush()
+        scheduler.request_refresh('testrequestedview', now=0)
+        scheduler.request_refresh('testrequestedview', now=0.5)
+        assert scheduler.run_pending(bind=registry, now=0.5) == []
+        assert scheduler.run_pending(bind=registry, now=1) == [
+            'testrequestedview']
+        assert 'testrequestedview' not in scheduler.due
+        assert registry.TestRequestedView.query().one().val == 3
+
+    def test_request_refresh_unknown_view(self, registry_scheduled_views):
+        scheduler = RefreshScheduler(registry_scheduled_views)
+        with pytest.raises(KeyError):
+            scheduler.request_refresh('unknown')
+
+    def test_try_refresh_view_locked(self, registry_scheduled_views):
+        registry = registry_scheduled_views
+        view = registry.TestOtherView.__view__
+        with registry.engine.connect() as connection:
+            with connection.begin():
+                connection.execute(
+                    text('SELECT pg_advisory_xact_lock(:namespace, :key)'),
+                    dict(namespace=ADVISORY_LOCK_NAMESPACE,
+                         key=get_advisory_lock_key(view.name)))
+                assert not try_refresh_view(registry, view)
+
+        assert try_refresh_view(registry, view)
+
+    def test_start_and_stop(self, registry_scheduled_views):
+        scheduler = RefreshScheduler(registry_scheduled_views)
+        scheduler.start()
+        assert scheduler.thread.is_alive()
+        thread = scheduler.thread
+        scheduler.stop(timeout=5)
+        assert not thread.is_alive()
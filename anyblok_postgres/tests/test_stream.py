@@ -0,0 +1,76 @@
+# This file is a part of the AnyBlok / Postgres project
+#
+#    Copyright (C) 2026 Jean-Sebastien SUZANNE <js.suzanne@gmail.com>
+#
+# This Source Code Form is subject to the terms of the Mozilla Public License,
+# v. 2.0. If a copy of the MPL was not distributed with this file,You can
+# obtain one at http://mozilla.org/MPL/2.0/.
+import pytest
+from anyblok import Declarations
+from anyblok.column import Integer
+from anyblok.tests.conftest import init_registry_with_bloks
+from sqlalchemy import event
+from anyblok_postgres.column import Jsonb
+from anyblok_postgres.stream import stream_query, stream_batches
+
+register = Declarations.register
+Model = Declarations.Model
+
+
+def streamed_model():
+
+    @register(Model)
+    class Test:
+        id = Integer(primary_key=True)
+        doc = Jsonb()
+
+
+@pytest.fixture(scope="class")
+def registry_streamed_model(request, bloks_loaded):
+    registry = init_registry_with_bloks([], streamed_model)
+    request.addfinalizer(registry.close)
+    return registry
+
+
+class TestStream:
+
+    @pytest.fixture(autouse=True)
+    def transact(self, request, registry_streamed_model):
+        transaction = registry_streamed_model.begin_nested()
+        request.addfinalizer(transaction.rollback)
+
+    @pytest.fixture
+    def cursors(self, request, registry_streamed_model):
+        registry = registry_streamed_model
+        for i in range(25):
+            registry.Test.insert(id=i, doc={'value': i})
+
+        cursors = []
+
+        def before_execute(conn, cursor, statement, parameters, context,
+                           executemany):
+            cursors.append((cursor.name,
+                            context.execution_options.get('max_row_buffer')))
+
+        event.listen(registry.bind, 'before_cursor_execute', before_execute)
+        request.addfinalizer(lambda: event.remove(
+            registry.bind, 'before_cursor_execute', before_execute))
+        return cursors
+
+    def test_stream_query(self, registry_streamed_model, cursors):
+        Test = registry_streamed_model.Test
+        tests = stream_query(Test.query().order_by(Test.id), itersize=10)
+        assert [test.doc['value'] for test in tests] == list(range(25))
+        assert len(cursors) == 1
+        assert cursors[0][0] is not None
+        assert cursors[0][1] == 10
+
+    def test_stream_batches(self, registry_streamed_model, cursors):
+        Test = registry_streamed_model.Test
+        batches = stream_batches(Test.query().order_by(Test.id), itersize=10)
+        assert [len(batch) for batch in batches] == [10, 10, 5]
+        assert cursors[0][0] is not None
+
+    def test_invalid_itersize(self, registry_streamed_model):
+        with pytest.raises(ValueError):
+            stream_query(registry_streamed_model.Test.query(), itersize=0)
@@ -0,0 +1,134 @@
+# This file is a part of the AnyBlok / Postgres project
+#
+#    Copyright (C) 2026 Jean-Sebastien SUZANNE <js.suzanne@gmail.com>
+#
+# This Source Code Form is subject to the terms of the Mozilla Public License,
+# v. 2.0. If a copy of the MPL was not distributed with this file,You can
+# obtain one at http://mozilla.org/MPL/2.0/.
+import pytest
+from anyblok import Declarations
+from anyblok.column import Integer, String
+from anyblok.tests.conftest import init_registry_with_bloks
+from anyblok_postgres.column import Jsonb
+from anyblok_postgres.upsert import UpsertMixin, get_batches, upsert_many
+
+register = Declarations.register
+Model = Declarations.Model
+
+
+def upserted_model():
+
+    @register(Model)
+    class Event(UpsertMixin):
+        id = Integer(primary_key=True)
+        code = String(unique=True, nullable=False)
+        status = String()
+        payload = Jsonb()
+
+
+@pytest.fixture(scope="class")
+def registry_upserted_model(request, bloks_loaded):
+    registry = init_registry_with_bloks([], upserted_model)
+    request.addfinalizer(registry.close)
+    return registry
+
+
+class TestUpsert:
+
+    @pytest.fixture(autouse=True)
+    def transact(self, request, registry_upserted_model):
+        transaction = registry_upserted_model.begin_nested()
+        request.addfinalizer(transaction.rollback)
+
+    def get_events(self, registry):
+        Event = registry.Event
+        return {code: (status, payload)
+                for code, status, payload in Event.query(
+                    'code', 'status', 'payload').all()}
+
+    def insert_events(self, registry):
+        Event = registry.Event
+        Event.insert(id=1, code='event1', status='new',
+                     payload={'a': {'b': 1, 'c': 2}, 'd': [1]})
+        Event.insert(id=2, code='event2', status='new', payload=None)
+
+    @pytest.mark.parametrize('jsonb_merge,expected', [
+        ('shallow', {'a': {'b': 3}, 'd': [1], 'e': 4}),
+        ('deep', {'a': {'b': 3, 'c': 2}, 'd': [1], 'e': 4}),
+        (None, {'a': {'b': 3}, 'e': 4}),
+    ])
+    def test_upsert_many(self, registry_upserted_model, jsonb_merge,
+                         expected):
+        registry = registry_upserted_model
+        self.insert_events(registry)
+        assert upsert_many(registry.Event, [
+            dict(id=1, code='event1', status='done',
+                 payload={'a': {'b': 3}, 'e': 4}),
+            dict(id=2, code='event2', status='done', payload={'f': 5}),
+            dict(id=3, code='event3', status='new', payload={'g': 6}),
+        ], ['code'], jsonb_merge=jsonb_merge) == 3
+        registry.expire_all()
+        assert self.get_events(registry) == {
+            'event1': ('done', expected),
+            'event2': ('done', {'f': 5}),
+            'event3': ('new', {'g': 6}),
+        }
+
+    def test_upsert_many_classmethod(self, registry_upserted_model):
+        registry = registry_upserted_model
+        self.insert_events(registry)
+        assert registry.Event.upsert_many([
+            dict(id=1, code='event1', status='done', payload={'e': 4}),
+        ], ['code'], jsonb_merge='deep') == 1
+        registry.expire_all()
+        assert self.get_events(registry)['event1'] == (
+            'done', {'a': {'b': 1, 'c': 2}, 'd': [1], 'e': 4})
+
+    @pytest.mark.parametrize('jsonb_merge', ['shallow', 'deep'])
+    def test_upsert_many_none(self, registry_upserted_model, jsonb_merge):
+        registry = registry_upserted_model
+        self.insert_events(registry)
+        upsert_many(registry.Event, [
+            dict(id=1, code='event1', payload={'a': None}),
+            dict(id=1, code='event1', payload=None),
+        ], ['code'], jsonb_merge=jsonb_merge)
+        registry.expire_all()
+        assert self.get_events(registry)['event1'] == (
+            'new', {'a': None, 'd': [1]})
+
+    def test_upsert_many_partial_rows(self, registry_upserted_model):
+        registry = registry_upserted_model
+        self.insert_events(registry)
+        upsert_many(registry.Event, [
+            dict(id=1, code='event1', payload={'a': {'c': 5}}),
+            dict(id=1, code='event1', payload={'a': {'d': 6}}),
+            dict(id=4, code='event4', status='new'),
+        ], ['code'], jsonb_merge='deep', batch_size=10)
+        registry.expire_all()
+        events = self.get_events(registry)
+        assert events['event1'] == (
+            'new', {'a': {'b': 1, 'c': 5, 'd': 6}, 'd': [1]})
+        assert events['event4'] == ('new', None)
+
+    def test_upsert_many_input_order(self, registry_upserted_model):
+        registry = registry_upserted_model
+        self.insert_events(registry)
+        upsert_many(registry.Event, [
+            dict(id=1, code='event1', status='first'),
+            dict(id=1, code='event1', status='second', payload={'e': 4}),
+            dict(id=1, code='event1', status='last'),
+        ], ['code'], jsonb_merge=None, batch_size=10)
+        registry.expire_all()
+        assert self.get_events(registry)['event1'] == (
+            'last', {'e': 4})
+
+    def test_get_batches(self):
+        rows = [dict(code=code) for code in 'abcadef']
+        assert [''.join(row['code'] for row in batch)
+                for batch in get_batches(rows, ['code'], 3)] == [
+            'abc', 'ade', 'f']
+
+    def test_invalid_jsonb_merge(self, registry_upserted_model):
+        with pytest.raises(ValueError):
+            upsert_many(registry_upserted_model.Event, [], ['code'],
+                        jsonb_merge='recursive')
@@ -0,0 +1,121 @@
+# This file is a part of the AnyBlok / Postgres project
+#
+#    Copyright (C) 2026 Jean-Sebastien SUZANNE <js.suzanne@gmail.com>
+#
+# This Source Code Form is subject to the terms of the Mozilla Public License,
+# v. 2.0. If a copy of the MPL was not distributed with this file,You can
+# obtain one at http://mozilla.org/MPL/2.0/.
+import pytest
+from datetime import datetime, timezone
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import IntegrityError
+from anyblok import Declarations
+from anyblok.config import get_url
+from anyblok.column import Integer, String
+from anyblok.tests.conftest import init_registry_with_bloks
+from anyblok_postgres.column import TsTzRange
+from anyblok_postgres.range import Range
+from anyblok_postgres.versioning import VersionedMixin
+
+register = Declarations.register
+Model = Declarations.Model
+
+
+def versioned_model():
+
+    @register(Model)
+    class Rate(VersionedMixin):
+        version_keys = ('code',)
+
+        id = Integer(primary_key=True)
+        code = String(nullable=False)
+        label = String()
+        rate = Integer()
+        validity = TsTzRange(nullable=False)
+
+
+@pytest.fixture(scope="class")
+def registry_versioned_model(request, bloks_loaded):
+    engine = create_engine(get_url())
+    with engine.connect() as conn:
+        available = conn.execute(text(
+            "SELECT count(*) FROM pg_available_extensions "
+            "WHERE name = 'btree_gist'")).scalar()
+
+    engine.dispose()
+    if not available:
+        pytest.skip('The btree_gist extension is not available')
+
+    registry = init_registry_with_bloks([], versioned_model)
+    request.addfinalizer(registry.close)
+    return registry
+
+
+def day(value):
+    return datetime(2026, 1, value, tzinfo=timezone.utc)
+
+
+class TestVersioning:
+
+    @pytest.fixture(autouse=True)
+    def transact(self, request, registry_versioned_model):
+        transaction = registry_versioned_model.begin_nested()
+        request.addfinalizer(transaction.rollback)
+
+    def add_versions(self, registry):
+        Rate = registry.Rate
+        Rate.add_version(code='r1', label='Rate 1', rate=10, at=day(1))
+        Rate.add_version(code='r1', rate=12, at=day(10))
+        Rate.add_version(code='r2', label='Rate 2', rate=20, at=day(5))
+
+    def test_add_version(self, registry_versioned_model):
+        registry = registry_versioned_model
+        self.add_versions(registry)
+        registry.expire_all()
+        assert [(rate.label, rate.rate, rate.validity.lower,
+                 rate.validity.upper)
+                for rate in registry.Rate.history('r1').all()] == [
+            ('Rate 1', 10, day(1), day(10)),
+            ('Rate 1', 12, day(10), None),
+        ]
+
+    def test_add_version_in_the_past(self, registry_versioned_model):
+        registry = registry_versioned_model
+        self.add_versions(registry)
+        rate = registry.Rate.add_version(code='r1', rate=11, at=day(5))
+        assert rate.validity == Range(day(5), day(10))
+        registry.expire_all()
+        assert [rate.rate for rate in registry.Rate.history('r1').all()] == [
+            10, 11, 12]
+
+    def test_add_version_now(self, registry_versioned_model):
+        registry = registry_versioned_model
+        self.add_versions(registry)
+        rate = registry.Rate.add_version(code='r1', rate=13)
+        assert rate.label == 'Rate 1'
+        assert rate.validity.upper is None
+        assert rate.validity.lower > day(10)
+
+    def test_as_of(self, registry_versioned_model):
+        registry = registry_versioned_model
+        self.add_versions(registry)
+        Rate = registry.Rate
+        assert Rate.as_of(day(3), code='r1').one().rate == 10
+        assert Rate.as_of(day(10), code='r1').one().rate == 12
+        assert sorted(rate.rate for rate in Rate.as_of(day(7)).all()) == [
+            10, 20]
+        assert Rate.as_of(day(3), code='r2').count() == 0
+
+    def test_overlapping_versions(self, registry_versioned_model):
+        registry = registry_versioned_model
+        self.add_versions(registry)
+        with pytest.raises(IntegrityError):
+            registry.Rate.insert(code='r1', rate=0,
+                                 validity=Range(day(2), day(3)))
+
+    def test_missing_version_keys(self, registry_versioned_model):
+        with pytest.raises(ValueError):
+            registry_versioned_model.Rate.add_version(rate=1)
+
+        with pytest.raises(ValueError):
+            registry_versioned_model.Rate.history()
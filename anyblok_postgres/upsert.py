@@ -0,0 +1,222 @@
+# This file is a part of the AnyBlok / postgres api project
+#
+#    Copyright (C) 2026 Jean-Sebastien SUZANNE <js.suzanne@gmail.com>
+#
+# This Source Code Form is subject to the terms of the Mozilla Public License,
+# v. 2.0. If a copy of the MPL was not distributed with this file,You can
+# obtain one at http://mozilla.org/MPL/2.0/.
+"""Batch upsert, merging the documents of the **Jsonb** columns
+
+:func:`upsert_many` inserts the rows, or updates the rows already existing
+with the same ``conflict_keys``, with one ``INSERT ... ON CONFLICT DO
+UPDATE`` statement by batch::
+
+    from anyblok_postgres.upsert import upsert_many
+
+    upsert_many(registry.Event, [
+        dict(code='event1', payload={'status': 'done'}),
+        dict(code='event2', payload={'status': 'new', 'tags': ['a']}),
+    ], ['code'], jsonb_merge='deep')
+
+The other columns are replaced by the new values, and the documents of the
+**Jsonb** columns are merged with the existing documents:
+
+* ``'shallow'``: the keys of the new document replace the existing keys, by
+  the ``||`` operator of PostgreSQL
+* ``'deep'``: the objects of the existing and of the new documents are
+  merged recursively, the other values are replaced
+* ``None``: the new document replaces the existing one
+
+The merges never remove a key: a key with the value ``None`` is stored as
+the JSON ``null``, and a ``None`` document, the SQL ``NULL``, keeps the
+existing document. Use ``jsonb_merge=None`` to remove keys or to clear a
+document.
+
+The models inheriting :class:`UpsertMixin` get :meth:`UpsertMixin.upsert_many`
+as a classmethod::
+
+    from anyblok_postgres.upsert import UpsertMixin
+
+    @register(Model)
+    class Event(UpsertMixin):
+        ...
+
+    registry.Event.upsert_many(rows, ['code'], jsonb_merge='deep')
+
+.. note::
+
+    The conflict keys need a unique index or constraint. The rows are not
+    loaded in the session, expire the instances already loaded. The rows are
+    merged in their order: the rows with the same conflict keys are sent in
+    different statements, the last one is merged last.
+"""
+from itertools import groupby
+from sqlalchemy import func, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.schema import DDLElement
+from anyblok_postgres.column import JsonbType
+
+JSONB_MERGES = ('shallow', 'deep', None)
+BATCH_SIZE = 1000
+DEEP_MERGE_FUNCTION = 'anyblok_jsonb_deep_merge'
+
+
+class CreateJsonbDeepMerge(DDLElement):
+    """Create the function merging recursively two JSONB documents"""
+
+
+@compiles(CreateJsonbDeepMerge)
+def compile_create_jsonb_deep_merge(element, compiler, **kw):
+    return (
+        'CREATE OR REPLACE FUNCTION %(name)s(old jsonb, new jsonb) '
+        'RETURNS jsonb LANGUAGE plpgsql IMMUTABLE AS $$ '
+        'BEGIN '
+        'IF old IS NULL OR new IS NULL THEN '
+        'RETURN COALESCE(new, old); '
+        'END IF; '
+        "IF jsonb_typeof(old) <> 'object' OR "
+        "jsonb_typeof(new) <> 'object' THEN "
+        'RETURN new; '
+        'END IF; '
+        'RETURN COALESCE(('
+        'SELECT jsonb_object_agg(key, CASE '
+        'WHEN NOT new ? key THEN old -> key '
+        'WHEN NOT old ? key THEN new -> key '
+        'ELSE %(name)s(old -> key, new -> key) END) '
+        'FROM (SELECT jsonb_object_keys(old) '
+        'UNION SELECT jsonb_object_keys(new)) AS keys(key)'
+        "), '{}'::jsonb); "
+        'END $$'
+    ) % dict(name=DEEP_MERGE_FUNCTION)
+
+
+def create_jsonb_deep_merge(bind):
+    """Create the function of the deep merge, if it does not exist
+
+    The function is not replaced, as concurrent replacements of a function
+    fail.
+    """
+    exists = bind.execute(text(
+        "SELECT to_regprocedure('%s(jsonb, jsonb)') IS NOT NULL" % (
+            DEEP_MERGE_FUNCTION))).scalar()
+    if not exists:
+        bind.execute(CreateJsonbDeepMerge())
+
+
+def get_columns(Model, fieldnames):
+    """Return the columns of the table of the model
+
+    :rtype: dict ``{fieldname: column}``
+    """
+    return {fieldname: getattr(Model, fieldname).property.columns[0]
+            for fieldname in fieldnames}
+
+
+def get_update_values(table, excluded, columns, conflict_keys, jsonb_merge):
+    """Return the values of the update of the existing rows
+
+    :rtype: dict ``{column name: expression}``
+    """
+    res = {}
+    for fieldname, column in columns.items():
+        if fieldname in conflict_keys:
+            continue
+
+        old = table.c[column.name]
+        new = excluded[column.name]
+        if not isinstance(column.type, JsonbType) or jsonb_merge is None:
+            res[column.name] = new
+        elif jsonb_merge == 'shallow':
+            res[column.name] = func.coalesce(
+                old.op('||')(new), new, old, type_=column.type)
+        else:
+            res[column.name] = getattr(func, DEEP_MERGE_FUNCTION)(
+                old, new, type_=column.type)
+
+    return res
+
+
+def get_batches(rows, conflict_keys, batch_size):
+    """Yield the rows by lists of ``batch_size`` rows at most, without two
+    rows with the same values of ``conflict_keys`` in the same list"""
+    batch = []
+    keys = set()
+    for row in rows:
+        key = tuple(row[fieldname] for fieldname in conflict_keys)
+        if len(batch) >= batch_size or key in keys:
+            yield batch
+            batch = []
+            keys = set()
+
+        batch.append(row)
+        keys.add(key)
+
+    if batch:
+        yield batch
+
+
+def upsert_many(Model, rows, conflict_keys, jsonb_merge='shallow',
+                batch_size=BATCH_SIZE):
+    """Insert the rows, or update the existing rows with the same values of
+    ``conflict_keys``, by batches of one statement
+
+    :param Model: AnyBlok model
+    :param rows: list of dict ``{fieldname: value}``, the consecutive rows
+                 with the same fieldnames are sent in the same statements,
+                 the rows are upserted in their order
+    :param conflict_keys: fieldnames of the unique index identifying the rows
+    :param jsonb_merge: ``'shallow'``, ``'deep'`` or ``None``
+    :param batch_size: number of rows by statement
+    :rtype: number of the inserted or updated rows
+    :exception: ValueError
+    """
+    if jsonb_merge not in JSONB_MERGES:
+        raise ValueError('jsonb_merge must be one of %r, not %r' % (
+            JSONB_MERGES, jsonb_merge))
+
+    registry = Model.anyblok
+    table = Model.__table__
+    index_elements = [column.name for column in get_columns(
+        Model, conflict_keys).values()]
+    res = 0
+    deep_merge_created = False
+    for fieldnames, group in groupby(rows, key=lambda row: tuple(sorted(row))):
+        if jsonb_merge == 'deep' and not deep_merge_created:
+            create_jsonb_deep_merge(registry)
+            deep_merge_created = True
+
+        columns = get_columns(Model, fieldnames)
+        for batch in get_batches(group, conflict_keys, batch_size):
+            statement = insert(table).values([
+                {column.name: row[fieldname]
+                 for fieldname, column in columns.items()}
+                for row in batch])
+            values = get_update_values(
+                table, statement.excluded, columns, conflict_keys,
+                jsonb_merge)
+            if values:
+                statement = statement.on_conflict_do_update(
+                    index_elements=index_elements, set_=values)
+            else:
+                statement = statement.on_conflict_do_nothing(
+                    index_elements=index_elements)
+
+            res += registry.execute(statement).rowcount
+
+    return res
+
+
+class UpsertMixin:
+    """Mixin of the models upserted by batches, see :func:`upsert_many`"""
+
+    @classmethod
+    def upsert_many(cls, rows, conflict_keys, jsonb_merge='shallow',
+                    batch_size=BATCH_SIZE):
+        """Insert the rows, or update the existing rows with the same
+        values of ``conflict_keys``, see :func:`upsert_many`
+
+        :rtype: number of the inserted or updated rows
+        """
+        return upsert_many(cls, rows, conflict_keys, jsonb_merge=jsonb_merge,
+                           batch_size=batch_size)
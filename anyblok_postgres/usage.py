@@ -0,0 +1,292 @@
+# This file is a part of the AnyBlok / postgres api project
+#
+#    Copyright (C) 2026 Jean-Sebastien SUZANNE <js.suzanne@gmail.com>
+#
+# This Source Code Form is subject to the terms of the Mozilla Public License,
+# v. 2.0. If a copy of the MPL was not distributed with this file,You can
+# obtain one at http://mozilla.org/MPL/2.0/.
+"""Usage statistics of the materialized views
+
+The :class:`UsageCollector` counts the queries reading each view, with their
+duration and the columns they filter and sort, from the events of the
+engine, and the refreshes of the views, from
+:mod:`anyblok_postgres.instrumentation`::
+
+    from anyblok_postgres.usage import UsageCollector
+
+    collector = UsageCollector(registry)
+    collector.start()
+    ...
+    collector.save(registry)
+    registry.commit()
+
+:meth:`UsageCollector.save` adds the counts of the process to the
+``anyblok_view_usage`` table, shared by all the processes, and
+:func:`get_usages` reads them. The filtered and sorted columns are only kept
+by the collector, see :mod:`anyblok_postgres.advisor`.
+"""
+from threading import Lock
+from time import perf_counter
+from weakref import WeakKeyDictionary
+from sqlalchemy import event, text
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.schema import DDLElement
+from sqlalchemy.sql import TableClause, visitors
+from sqlalchemy.sql.expression import ColumnClause
+from anyblok_postgres.instrumentation import instrumentation
+from anyblok_postgres.materialized_view import get_materialized_views
+
+
+USAGE_TABLE = 'anyblok_view_usage'
+
+
+class CreateViewUsage(DDLElement):
+    """Create the usage table"""
+
+
+@compiles(CreateViewUsage)
+def compile_create_view_usage(element, compiler, **kw):
+    return (
+        'CREATE TABLE IF NOT EXISTS %s ('
+        'name VARCHAR(64) PRIMARY KEY, '
+        'reads BIGINT NOT NULL DEFAULT 0, '
+        'read_time DOUBLE PRECISION NOT NULL DEFAULT 0, '
+        'max_read_time DOUBLE PRECISION NOT NULL DEFAULT 0, '
+        'refreshes BIGINT NOT NULL DEFAULT 0, '
+        'refresh_time DOUBLE PRECISION NOT NULL DEFAULT 0, '
+        'since TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(), '
+        'materialized BOOLEAN)'
+    ) % USAGE_TABLE
+
+
+class ViewUsage:
+    """Usage of one view
+
+    * ``reads`` and ``read_time``: number and total duration in seconds of
+      the queries reading the view
+    * ``max_read_time``: duration of the longest query
+    * ``refreshes`` and ``refresh_time``: number and total duration of the
+      refreshes
+    * ``age``: seconds since the start of the counts, for the saved usages
+    * ``patterns``: dict ``{(filtered columns, sorted columns): [number of
+      reads, total duration]}``, for the usages of the collector
+    """
+
+    def __init__(self, name, reads=0, read_time=0., max_read_time=0.,
+                 refreshes=0, refresh_time=0., age=None):
+        self.name = name
+        self.reads = reads
+        self.read_time = read_time
+        self.max_read_time = max_read_time
+        self.refreshes = refreshes
+        self.refresh_time = refresh_time
+        self.age = age
+        self.patterns = {}
+
+    @property
+    def mean_read_time(self):
+        return self.read_time / self.reads if self.reads else 0.
+
+    @property
+    def mean_refresh_time(self):
+        return self.refresh_time / self.refreshes if self.refreshes else 0.
+
+    def add_read(self, duration, pattern=None):
+        self.reads += 1
+        self.read_time += duration
+        self.max_read_time = max(self.max_read_time, duration)
+        if pattern is not None:
+            counts = self.patterns.setdefault(pattern, [0, 0.])
+            counts[0] += 1
+            counts[1] += duration
+
+    def add_refresh(self, duration):
+        self.refreshes += 1
+        self.refresh_time += duration
+
+
+class UsageCollector:
+    """Count the reads and the refreshes of the views of the registry
+
+    :param registry: the current registry
+    """
+
+    def __init__(self, registry):
+        self.registry = registry
+        self.views = set(get_materialized_views(registry))
+        self.usages = {}
+        self.lock = Lock()
+        self.statements = WeakKeyDictionary()
+
+    def start(self):
+        """Listen the queries and the refreshes"""
+        event.listen(self.registry.bind, 'before_cursor_execute',
+                     self.before_execute)
+        event.listen(self.registry.bind, 'after_cursor_execute',
+                     self.after_execute)
+        instrumentation.add_hook(self.record_refresh)
+
+    def stop(self):
+        event.remove(self.registry.bind, 'before_cursor_execute',
+                     self.before_execute)
+        event.remove(self.registry.bind, 'after_cursor_execute',
+                     self.after_execute)
+        instrumentation.remove_hook(self.record_refresh)
+
+    def get_usage(self, name):
+        if name not in self.usages:
+            self.usages[name] = ViewUsage(name)
+
+        return self.usages[name]
+
+    def before_execute(self, conn, cursor, statement, parameters, context,
+                       executemany):
+        context.anyblok_usage_start = perf_counter()
+
+    def after_execute(self, conn, cursor, statement, parameters, context,
+                      executemany):
+        start = getattr(context, 'anyblok_usage_start', None)
+        if start is None:
+            return
+
+        patterns = self.get_patterns(context)
+        if not patterns:
+            return
+
+        duration = perf_counter() - start
+        with self.lock:
+            for name, pattern in patterns.items():
+                self.get_usage(name).add_read(duration, pattern=pattern)
+
+    def get_patterns(self, context):
+        """Return the views read by the executed statement, with their
+        filtered and sorted columns, see :func:`get_read_patterns`
+
+        The patterns are computed once by compiled statement, the compiled
+        statements being cached by SQLAlchemy.
+        """
+        compiled = getattr(context, 'compiled', None)
+        if compiled is None or compiled.statement is None:
+            return None
+
+        patterns = self.statements.get(compiled)
+        if patterns is None:
+            patterns = get_read_patterns(compiled.statement, self.views)
+            self.statements[compiled] = patterns
+
+        return patterns
+
+    def record_refresh(self, metrics):
+        """Hook of :mod:`anyblok_postgres.instrumentation`"""
+        with self.lock:
+            self.get_usage(metrics.view).add_refresh(metrics.duration)
+
+    def save(self, bind):
+        """Add the counts to the usage table, and restart them
+
+        :param bind: registry or connection to execute the queries
+        """
+        with self.lock:
+            usages, self.usages = self.usages, {}
+
+        bind.execute(CreateViewUsage())
+        for usage in usages.values():
+            bind.execute(text(
+                'INSERT INTO %(table)s (name, reads, read_time, '
+                'max_read_time, refreshes, refresh_time) '
+                'VALUES (:name, :reads, :read_time, :max_read_time, '
+                ':refreshes, :refresh_time) '
+                'ON CONFLICT (name) DO UPDATE SET '
+                'reads = %(table)s.reads + EXCLUDED.reads, '
+                'read_time = %(table)s.read_time + EXCLUDED.read_time, '
+                'max_read_time = GREATEST(%(table)s.max_read_time, '
+                'EXCLUDED.max_read_time), '
+                'refreshes = %(table)s.refreshes + EXCLUDED.refreshes, '
+                'refresh_time = %(table)s.refresh_time + '
+                'EXCLUDED.refresh_time' % dict(table=USAGE_TABLE)
+            ), dict(name=usage.name, reads=usage.reads,
+                    read_time=usage.read_time,
+                    max_read_time=usage.max_read_time,
+                    refreshes=usage.refreshes,
+                    refresh_time=usage.refresh_time))
+
+
+def get_read_patterns(statement, views):
+    """Return the columns of each view filtered and sorted by the statement
+
+    Only the ``WHERE`` and ``ORDER BY`` clauses of the statement itself are
+    read, not the ones of its subqueries.
+
+    :param statement: the executed statement
+    :param views: names of the views
+    :rtype: dict ``{view name: (filtered columns, sorted columns)}``, the
+            filtered columns are sorted by name
+    """
+    patterns = {}
+    for element in visitors.iterate(statement):
+        if isinstance(element, TableClause) and element.name in views:
+            patterns.setdefault(element.name, (set(), []))
+
+    if not patterns:
+        return {}
+
+    for name, column in get_view_columns(
+            getattr(statement, '_where_criteria', ()), patterns):
+        patterns[name][0].add(column)
+
+    for name, column in get_view_columns(
+            getattr(statement, '_order_by_clauses', ()), patterns):
+        if column not in patterns[name][1]:
+            patterns[name][1].append(column)
+
+    return {name: (tuple(sorted(filters)), tuple(sorts))
+            for name, (filters, sorts) in patterns.items()}
+
+
+def get_view_columns(clauses, views):
+    """Yield the tuples ``(view name, column name)`` of the columns of the
+    views in the clauses"""
+    for clause in clauses:
+        for element in visitors.iterate(clause):
+            if not isinstance(element, ColumnClause):
+                continue
+
+            name = getattr(element.table, 'name', None)
+            if name in views:
+                yield name, element.name
+
+
+def get_usages(bind):
+    """Return the usages saved in the usage table
+
+    :param bind: registry or connection to execute the queries
+    :rtype: dict ``{view name: ViewUsage}``
+    """
+    bind.execute(CreateViewUsage())
+    return {
+        row.name: ViewUsage(
+            row.name, reads=row.reads, read_time=row.read_time,
+            max_read_time=row.max_read_time, refreshes=row.refreshes,
+            refresh_time=row.refresh_time, age=row.age)
+        for row in bind.execute(text(
+            'SELECT name, reads, read_time, max_read_time, refreshes, '
+            'refresh_time, extract(epoch from now() - since) AS age '
+            'FROM %s' % USAGE_TABLE)).fetchall()
+    }
+
+
+def reset_usage(bind, name, materialized=None):
+    """Restart the counts of the view, and save the choice of its storage
+
+    :param bind: registry or connection to execute the queries
+    :param name: name of the view
+    :param materialized: for the hybrid views, True if the view is
+                         materialized
+    """
+    bind.execute(CreateViewUsage())
+    bind.execute(text(
+        'INSERT INTO %s (name, materialized) VALUES (:name, :materialized) '
+        'ON CONFLICT (name) DO UPDATE SET reads = 0, read_time = 0, '
+        'max_read_time = 0, refreshes = 0, refresh_time = 0, since = now(), '
+        'materialized = EXCLUDED.materialized' % USAGE_TABLE
+    ), dict(name=name, materialized=materialized))
@@ -0,0 +1,184 @@
+# This file is a part of the AnyBlok / postgres api project
+#
+#    Copyright (C) 2026 Jean-Sebastien SUZANNE <js.suzanne@gmail.com>
+#
+# This Source Code Form is subject to the terms of the Mozilla Public License,
+# v. 2.0. If a copy of the MPL was not distributed with this file,You can
+# obtain one at http://mozilla.org/MPL/2.0/.
+"""Versioned models, with the validity of each version in a **TsTzRange**
+
+Each version of a record is a row, valid in its ``validity`` range. The
+models inheriting :class:`VersionedMixin` declare the fields identifying the
+record in ``version_keys``::
+
+    from anyblok_postgres.versioning import VersionedMixin
+
+    @register(Model)
+    class Price(VersionedMixin):
+        version_keys = ('code',)
+
+        id = Integer(primary_key=True)
+        code = String(nullable=False)
+        price = Decimal()
+        validity = TsTzRange(nullable=False)
+
+    Price.add_version(code='p1', price=10)
+    Price.add_version(code='p1', price=12, at=datetime(2026, 1, 1, tzinfo=tz))
+    Price.as_of(datetime(2025, 6, 1, tzinfo=tz), code='p1').one()
+    Price.history('p1').all()
+
+An exclusion constraint forbids the overlapping versions of one record, its
+GiST index on the keys and the validity also serves the queries at one
+point in time. The constraint needs the ``btree_gist`` extension, created
+with the tables, and is checked at the end of each statement, so that one
+statement closes a version and adds the next one.
+
+.. note::
+
+    The version is added, and the current version closed, in one statement,
+    see :meth:`VersionedMixin.add_version`. The rows are not loaded in the
+    session, expire the instances of the closed versions already loaded.
+"""
+from sqlalchemy import DDL, event, func, insert, literal, select
+from sqlalchemy.dialects.postgresql import ExcludeConstraint
+
+CREATE_BTREE_GIST = DDL('CREATE EXTENSION IF NOT EXISTS btree_gist')
+
+
+def create_btree_gist_with_tables(metadata):
+    """Create the ``btree_gist`` extension before the tables of the
+    metadata"""
+    if not event.contains(metadata, 'before_create', CREATE_BTREE_GIST):
+        event.listen(metadata, 'before_create', CREATE_BTREE_GIST)
+
+
+class VersionedMixin:
+    """Mixin of the versioned models
+
+    * ``version_keys``: fieldnames identifying the record of the versions
+    * ``validity_field``: fieldname of the **TsTzRange** column of the
+      validity, ``'validity'`` by default
+
+    The fieldnames must be the names of the columns in the table.
+    """
+
+    version_keys = ()
+    validity_field = 'validity'
+
+    @classmethod
+    def define_table_args(cls):
+        table_args = super(VersionedMixin, cls).define_table_args()
+        if not cls.version_keys:
+            raise ValueError('%s must declare its version_keys' % (
+                cls.__registry_name__))
+
+        create_btree_gist_with_tables(cls.anyblok.declarativebase.metadata)
+        elements = [(key, '=') for key in cls.version_keys]
+        elements.append((cls.validity_field, '&&'))
+        return table_args + (ExcludeConstraint(
+            *elements, using='gist', deferrable=True, initially='IMMEDIATE',
+            name='anyblok_ex_%s__%s' % (cls.__tablename__,
+                                        cls.validity_field)),)
+
+    @classmethod
+    def get_version_keys(cls, keys):
+        """Return the dict ``{fieldname: value}`` of the version keys
+
+        :param keys: the values of the version keys, in their order
+        :exception: ValueError
+        """
+        if len(keys) != len(cls.version_keys):
+            raise ValueError('%s expects the values of %r, not %r' % (
+                cls.__registry_name__, cls.version_keys, keys))
+
+        return dict(zip(cls.version_keys, keys))
+
+    @classmethod
+    def as_of(cls, at, **keys):
+        """Return the query of the versions valid at ``at``
+
+        :param at: datetime with time zone
+        :param keys: values of the fields filtered, optional
+        """
+        validity = getattr(cls, cls.validity_field)
+        return cls.query().filter(validity.contains(at)).filter_by(**keys)
+
+    @classmethod
+    def history(cls, *keys):
+        """Return the query of the versions of one record, by validity
+
+        :param keys: the values of the version keys, in their order
+        """
+        validity = getattr(cls, cls.validity_field)
+        return cls.query().filter_by(**cls.get_version_keys(keys)).filter(
+            ~func.isempty(validity)).order_by(func.lower(validity))
+
+    @classmethod
+    def get_add_version_statement(cls, at, values):
+        """Return the ``INSERT`` statement adding the version valid from
+        ``at``, closing the version valid at ``at``
+
+        The columns not in ``values``, other than the primary keys, are
+        copied from the closed version. The new version is valid until the
+        end of the closed one, or without end.
+        """
+        table = cls.__table__
+        validity = table.c[cls.validity_field]
+        current = select(table).where(
+            *[table.c[key] == values[key] for key in cls.version_keys],
+            validity.op('@>')(at)).with_for_update().cte('current')
+        closed = table.update().where(
+            *[column == current.c[column.name]
+              for column in table.primary_key.columns]
+        ).values({
+            validity.name: func.tstzrange(func.lower(current.c[validity.name]),
+                                          at, type_=validity.type),
+        }).returning(validity).cte('closed')
+
+        names = []
+        columns = []
+        for column in table.columns:
+            if column is validity:
+                continue
+            elif column.name in values:
+                columns.append(literal(values[column.name], column.type))
+            elif column.primary_key:
+                continue
+            else:
+                columns.append(select(current.c[column.name]).scalar_subquery())
+
+            names.append(column.name)
+
+        names.append(validity.name)
+        columns.append(func.tstzrange(
+            at, select(func.upper(current.c[validity.name])).scalar_subquery(),
+            type_=validity.type))
+        return insert(table).from_select(names, select(*columns)).add_cte(
+            closed).returning(*table.primary_key.columns)
+
+    @classmethod
+    def add_version(cls, at=None, **values):
+        """Add the version valid from ``at``, and close the version valid at
+        ``at``, in one statement
+
+        :param at: datetime with time zone, by default the start of the
+                   transaction
+        :param values: values of the fields of the new version, with the
+                       version keys, the other fields are copied from the
+                       closed version
+        :rtype: the instance of the new version
+        :exception: ValueError
+        """
+        missing = [key for key in cls.version_keys if key not in values]
+        if missing:
+            raise ValueError('The version keys %r are required' % missing)
+
+        if at is None:
+            at = func.now()
+        else:
+            validity = cls.__table__.c[cls.validity_field]
+            at = literal(at, validity.type.element_type)
+
+        statement = cls.get_add_version_statement(at, values)
+        pks = cls.anyblok.execute(statement).one()
+        return cls.from_primary_keys(**pks._asdict())
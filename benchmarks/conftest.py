@@ -0,0 +1,31 @@
+# This file is a part of the AnyBlok / Postgres project
+#
+#    Copyright (C) 2026 Jean-Sebastien SUZANNE <js.suzanne@gmail.com>
+#
+# This Source Code Form is subject to the terms of the Mozilla Public License,
+# v. 2.0. If a copy of the MPL was not distributed with this file,You can
+# obtain one at http://mozilla.org/MPL/2.0/.
+import pytest
+from anyblok.conftest import *  # noqa
+from anyblok.tests.conftest import *  # noqa
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        '--benchmark-max-size', type=int, default=1 << 26,
+        help='size in bytes of the biggest large object to benchmark, '
+             '64 MB by default')
+    parser.addoption(
+        '--benchmark-max-rows', type=int, default=100000,
+        help='number of rows of the biggest views to benchmark, '
+             '100000 by default')
+
+
+@pytest.fixture
+def max_size(request):
+    return request.config.getoption('--benchmark-max-size')
+
+
+@pytest.fixture
+def max_rows(request):
+    return request.config.getoption('--benchmark-max-rows')
@@ -0,0 +1,88 @@
+# This file is a part of the AnyBlok / Postgres project
+#
+#    Copyright (C) 2026 Jean-Sebastien SUZANNE <js.suzanne@gmail.com>
+#
+# This Source Code Form is subject to the terms of the Mozilla Public License,
+# v. 2.0. If a copy of the MPL was not distributed with this file,You can
+# obtain one at http://mozilla.org/MPL/2.0/.
+import pytest
+from json import dumps
+from anyblok import Declarations
+from anyblok.column import Integer
+from anyblok.tests.conftest import init_registry_with_bloks
+from sqlalchemy import text
+from anyblok_postgres.column import Jsonb
+
+pytest.importorskip('pytest_benchmark')
+
+register = Declarations.register
+Model = Declarations.Model
+
+DOCUMENT_SIZES = [10, 1000, 10000]
+ROWS = 1000
+
+
+def bench_jsonb():
+
+    @register(Model)
+    class BenchJsonb:
+        id = Integer(primary_key=True)
+        doc = Jsonb()
+
+
+@pytest.fixture(scope="module")
+def registry_bench_jsonb(request, bloks_loaded):
+    registry = init_registry_with_bloks([], bench_jsonb)
+    request.addfinalizer(registry.close)
+    return registry
+
+
+def get_document(size):
+    """Return a document of ``size`` keys"""
+    return {'key%d' % i: {'value': i, 'label': 'label %d' % i}
+            for i in range(size)}
+
+
+def insert_documents(registry, size, rows):
+    registry.execute(text(
+        "INSERT INTO benchjsonb (id, doc) "
+        "SELECT g, jsonb_set(CAST(:doc AS jsonb), '{kind}', "
+        "to_jsonb(g % 10)) FROM generate_series(1, :rows) g"
+    ), dict(doc=dumps(get_document(size)), rows=rows))
+
+
+class TestBenchJsonb:
+
+    @pytest.fixture(autouse=True)
+    def transact(self, request, registry_bench_jsonb):
+        transaction = registry_bench_jsonb.begin_nested()
+        request.addfinalizer(transaction.rollback)
+
+    @pytest.mark.parametrize('size', DOCUMENT_SIZES)
+    def test_encode(self, benchmark, registry_bench_jsonb, size):
+        registry = registry_bench_jsonb
+        document = get_document(size)
+        benchmark.extra_info['keys'] = size
+
+        def insert():
+            registry.BenchJsonb.insert(doc=document)
+
+        benchmark(insert)
+
+    @pytest.mark.parametrize('size', DOCUMENT_SIZES)
+    def test_decode(self, benchmark, registry_bench_jsonb, size):
+        registry = registry_bench_jsonb
+        insert_documents(registry, size, 1)
+        query = registry.BenchJsonb.query('doc').filter_by(id=1)
+        benchmark.extra_info['keys'] = size
+        assert len(benchmark(query.scalar)) == size + 1
+
+    @pytest.mark.parametrize('size', DOCUMENT_SIZES)
+    def test_filter(self, benchmark, registry_bench_jsonb, size):
+        registry = registry_bench_jsonb
+        BenchJsonb = registry.BenchJsonb
+        insert_documents(registry, size, ROWS)
+        query = BenchJsonb.query().filter(BenchJsonb.doc['kind'].astext == '1')
+        benchmark.extra_info['keys'] = size
+        benchmark.extra_info['rows'] = ROWS
+        assert benchmark(query.count) == ROWS // 10
@@ -0,0 +1,73 @@
+# This file is a part of the AnyBlok / Postgres project
+#
+#    Copyright (C) 2026 Jean-Sebastien SUZANNE <js.suzanne@gmail.com>
+#
+# This Source Code Form is subject to the terms of the Mozilla Public License,
+# v. 2.0. If a copy of the MPL was not distributed with this file,You can
+# obtain one at http://mozilla.org/MPL/2.0/.
+import pytest
+from os import urandom
+from anyblok import Declarations
+from anyblok.column import Integer
+from anyblok.tests.conftest import init_registry_with_bloks
+from anyblok_postgres.column import LargeObject
+
+pytest.importorskip('pytest_benchmark')
+
+register = Declarations.register
+Model = Declarations.Model
+
+SIZES = [1 << 10, 1 << 20, 1 << 26, 1 << 30]
+
+
+def bench_large_object():
+
+    @register(Model)
+    class BenchLargeObject:
+        id = Integer(primary_key=True)
+        data = LargeObject()
+
+
+@pytest.fixture(scope="module")
+def registry_bench_large_object(request, bloks_loaded):
+    registry = init_registry_with_bloks([], bench_large_object)
+    request.addfinalizer(registry.close)
+    return registry
+
+
+def get_rounds(size):
+    """Return the number of rounds, to move about 256 MB by benchmark"""
+    return max(3, min(100, (1 << 28) // size))
+
+
+class TestBenchLargeObject:
+
+    @pytest.fixture(autouse=True)
+    def transact(self, request, registry_bench_large_object):
+        transaction = registry_bench_large_object.begin_nested()
+        request.addfinalizer(transaction.rollback)
+
+    @pytest.fixture(params=SIZES, ids=['1KB', '1MB', '64MB', '1GB'])
+    def data(self, request, max_size):
+        if request.param > max_size:
+            pytest.skip('bigger than --benchmark-max-size')
+
+        return urandom(request.param)
+
+    def test_write(self, benchmark, registry_bench_large_object, data):
+        test = registry_bench_large_object.BenchLargeObject.insert()
+        benchmark.extra_info['bytes'] = len(data)
+
+        def write():
+            test.data = data
+
+        benchmark.pedantic(write, rounds=get_rounds(len(data)))
+
+    def test_read(self, benchmark, registry_bench_large_object, data):
+        test = registry_bench_large_object.BenchLargeObject.insert(data=data)
+        benchmark.extra_info['bytes'] = len(data)
+
+        def read():
+            return test.data
+
+        assert benchmark.pedantic(read, rounds=get_rounds(len(data))) == data
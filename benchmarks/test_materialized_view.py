@@ -0,0 +1,81 @@
+# This file is a part of the AnyBlok / Postgres project
+#
+#    Copyright (C) 2026 Jean-Sebastien SUZANNE <js.suzanne@gmail.com>
+#
+# This Source Code Form is subject to the terms of the Mozilla Public License,
+# v. 2.0. If a copy of the MPL was not distributed with this file,You can
+# obtain one at http://mozilla.org/MPL/2.0/.
+import pytest
+from anyblok import Declarations
+from anyblok.column import Integer, String
+from anyblok.tests.conftest import init_registry_with_bloks
+from sqlalchemy import text
+from sqlalchemy.sql import select
+from anyblok_postgres.materialized_view import MaterializedViewFactory
+
+pytest.importorskip('pytest_benchmark')
+
+register = Declarations.register
+Model = Declarations.Model
+
+VOLUMES = [1000, 10000, 100000, 1000000]
+
+
+def bench_materialized_view():
+
+    @register(Model)
+    class BenchSource:
+        id = Integer(primary_key=True)
+        code = String()
+        val = Integer()
+
+    @register(Model, factory=MaterializedViewFactory)
+    class BenchView:
+        id = Integer(primary_key=True)
+        code = String()
+        val = Integer()
+
+        @classmethod
+        def sqlalchemy_view_declaration(cls):
+            BenchSource = cls.anyblok.BenchSource
+            return select([BenchSource.id.label('id'),
+                           BenchSource.code.label('code'),
+                           (BenchSource.val * 2).label('val')])
+
+
+@pytest.fixture(scope="module")
+def registry_bench_materialized_view(request, bloks_loaded):
+    registry = init_registry_with_bloks([], bench_materialized_view)
+    request.addfinalizer(registry.close)
+    return registry
+
+
+class TestBenchMaterializedView:
+
+    @pytest.fixture(autouse=True)
+    def transact(self, request, registry_bench_materialized_view):
+        transaction = registry_bench_materialized_view.begin_nested()
+        request.addfinalizer(transaction.rollback)
+
+    @pytest.fixture(params=VOLUMES)
+    def rows(self, request, registry_bench_materialized_view, max_rows):
+        if request.param > max_rows:
+            pytest.skip('more than --benchmark-max-rows')
+
+        registry = registry_bench_materialized_view
+        registry.execute(text(
+            "INSERT INTO benchsource (id, code, val) "
+            "SELECT g, 'code' || g, g FROM generate_series(1, :rows) g"
+        ), dict(rows=request.param))
+        registry.BenchView.refresh_materialized_view()
+        return request.param
+
+    @pytest.mark.parametrize('concurrently', [False, True],
+                             ids=['full', 'concurrently'])
+    def test_refresh(self, benchmark, registry_bench_materialized_view, rows,
+                     concurrently):
+        BenchView = registry_bench_materialized_view.BenchView
+        benchmark.extra_info['rows'] = rows
+        benchmark.pedantic(BenchView.refresh_materialized_view,
+                           kwargs=dict(concurrently=concurrently), rounds=5)
+        assert BenchView.query().count() == rows
@@ -0,0 +1,73 @@
+# This file is a part of the AnyBlok / Postgres project
+#
+#    Copyright (C) 2026 Jean-Sebastien SUZANNE <js.suzanne@gmail.com>
+#
+# This Source Code Form is subject to the terms of the Mozilla Public License,
+# v. 2.0. If a copy of the MPL was not distributed with this file,You can
+# obtain one at http://mozilla.org/MPL/2.0/.
+import pytest
+from anyblok import Declarations
+from anyblok.column import Integer
+from anyblok.tests.conftest import init_registry_with_bloks
+from sqlalchemy import text
+from anyblok_postgres.column import Int4Range, find_containing
+
+pytest.importorskip('pytest_benchmark')
+
+register = Declarations.register
+Model = Declarations.Model
+
+ROWS = 100000
+POINTS = 100
+
+
+def bench_range():
+
+    @register(Model)
+    class BenchRange:
+        id = Integer(primary_key=True)
+        period = Int4Range()
+
+
+@pytest.fixture(scope="module")
+def registry_bench_range(request, bloks_loaded):
+    registry = init_registry_with_bloks([], bench_range)
+    request.addfinalizer(registry.close)
+    return registry
+
+
+class TestBenchRange:
+
+    @pytest.fixture(autouse=True)
+    def transact(self, request, registry_bench_range):
+        transaction = registry_bench_range.begin_nested()
+        request.addfinalizer(transaction.rollback)
+
+    @pytest.fixture(params=[False, True], ids=['seqscan', 'gist'])
+    def indexed(self, request, registry_bench_range):
+        registry = registry_bench_range
+        registry.execute(text(
+            "INSERT INTO benchrange (id, period) "
+            "SELECT g, int4range(g * 10, g * 10 + 15) "
+            "FROM generate_series(1, :rows) g"), dict(rows=ROWS))
+        if request.param:
+            registry.execute(text(
+                'CREATE INDEX benchrange_period_gist ON benchrange '
+                'USING gist (period)'))
+
+        registry.execute(text('ANALYZE benchrange'))
+        return request.param
+
+    def test_contains(self, benchmark, registry_bench_range, indexed):
+        BenchRange = registry_bench_range.BenchRange
+        query = BenchRange.query().filter(BenchRange.period.contains(5012))
+        benchmark.extra_info['rows'] = ROWS
+        assert len(benchmark(query.all)) == 2
+
+    def test_find_containing(self, benchmark, registry_bench_range, indexed):
+        BenchRange = registry_bench_range.BenchRange
+        points = [i * 1000 + 12 for i in range(POINTS)]
+        benchmark.extra_info['rows'] = ROWS
+        benchmark.extra_info['points'] = POINTS
+        res = benchmark(find_containing, BenchRange, 'period', points)
+        assert len(res) == POINTS